@@ -0,0 +1,258 @@
+"""
+Admission Control
+- Concurrency limit in front of the authentication pipeline
+- AIMD: the limit grows while latency stays under target and shrinks multiplicatively above it
+- Priority classes: session holders (and devices verified by the caller) keep
+  capacity that default and suspect traffic cannot take
+- Excess work is rejected in microseconds, before any hashing or crypto runs
+- Overload simulation with the attack scenarios scaled up
+"""
+
+import threading
+import time
+from enum import IntEnum
+from typing import Callable, Dict, Optional
+
+from metrics_registry import MetricsRegistry
+
+
+class Priority(IntEnum):
+    SESSION = 0  # Valid session token
+    KNOWN = 1  # A device the caller verified (e.g. a client certificate); never a bare device id
+    DEFAULT = 2
+    SUSPECT = 3  # Source flagged by the credential-stuffing detector
+
+
+# Fraction of the concurrency limit each class may occupy (higher classes can use all of it)
+DEFAULT_SHARES = {Priority.SESSION: 1.0, Priority.KNOWN: 1.0, Priority.DEFAULT: 0.75, Priority.SUSPECT: 0.25}
+
+
+class Permit:
+    """One admitted request; release it when the request finishes"""
+
+    __slots__ = ("_controller", "priority", "started")
+
+    def __init__(self, controller: "AdmissionController", priority: Priority, started: float):
+        self._controller = controller
+        self.priority = priority
+        self.started = started
+
+    def release(self):
+        """Return the slot; later calls do nothing, so a permit can't be released twice"""
+        controller, self._controller = self._controller, None
+        if controller is not None:
+            controller._release(self)
+
+    def __enter__(self) -> "Permit":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    def __init__(self, initial_limit: float = 32, min_limit: float = 4, max_limit: float = 512,
+                 target_latency: float = 0.005, backoff: float = 0.7,
+                 shares: Optional[Dict[Priority, float]] = None,
+                 registry: Optional[MetricsRegistry] = None,
+                 clock: Callable[[], float] = time.perf_counter):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target_latency = target_latency  # Seconds; slower completions shrink the limit
+        self.backoff = backoff
+        self.shares = dict(shares or DEFAULT_SHARES)
+        self.clock = clock  # Latency clock, independent of the authentication clock
+        self.in_flight = 0
+        self._last_decrease = float("-inf")
+        self._lock = threading.Lock()
+
+        registry = registry or MetricsRegistry()
+        self._admitted = registry.counter("admission_admitted", "Requests admitted to the pipeline", ("priority",))
+        self._rejected = registry.counter("admission_rejected", "Requests shed by admission control", ("priority",))
+        self._latency = registry.summary("admission_latency_seconds", "Latency of admitted requests")
+        registry.gauge("admission_limit", "Current concurrency limit").set_function(lambda: self.limit)
+        registry.gauge("admission_in_flight", "Requests in the pipeline").set_function(lambda: self.in_flight)
+
+    def try_acquire(self, priority: Priority = Priority.DEFAULT) -> Optional[Permit]:
+        """Admit a request if its class is under its share of the limit; never blocks"""
+        with self._lock:
+            # An idle pipeline admits anything, so the limit can always be probed
+            if self.in_flight and self.in_flight >= self.limit * self.shares[priority]:
+                admitted = False
+            else:
+                self.in_flight += 1
+                admitted = True
+        if not admitted:
+            self._rejected.labels(priority.name.lower()).inc()
+            return None
+        self._admitted.labels(priority.name.lower()).inc()
+        return Permit(self, priority, self.clock())
+
+    def _release(self, permit: Permit):
+        """Feed the request's latency back into the limit"""
+        now = self.clock()
+        latency = now - permit.started
+        self._latency.observe(latency)
+        with self._lock:
+            in_flight = self.in_flight
+            self.in_flight -= 1
+            if latency > self.target_latency:
+                # At most one decrease per target interval: the completions of one
+                # overloaded window should shrink the limit once, not once each
+                if now - self._last_decrease >= self.target_latency:
+                    self.limit = max(self.min_limit, self.limit * self.backoff)
+                    self._last_decrease = now
+            elif in_flight * 2 >= self.limit:
+                # Additive increase (about +1 per limit's worth of completions), only
+                # while the limit is actually in use so it cannot drift up when idle
+                self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def get_metrics(self) -> Dict[str, any]:
+        admitted = {labels[0]: child.value for labels, child in self._admitted.children()}
+        rejected = {labels[0]: child.value for labels, child in self._rejected.children()}
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "admitted": admitted,
+            "rejected": rejected,
+            "average_latency_seconds": self._latency.average
+        }
+
+
+def simulate_overload(admission: bool, duration: float = 3.0, attack_rate: float = 12000,
+                      legitimate_rate: float = 200, workers: int = 32) -> Dict[str, any]:
+    """Scale the demo's attack scenarios up against legitimate traffic.
+
+    Requests arrive open-loop (attackers do not slow down when the server
+    does), are admitted on arrival and queue for a pool of worker threads,
+    like a server's request queue. Attacks spray leaked usernames and
+    stuffed admin credentials from one source; legitimate users log in with
+    TOTP (default priority, like any unverified client) or resume sessions.
+    Latency is measured from arrival, so it includes time spent queued.
+    """
+    import contextlib
+    import io
+    import queue
+    import random
+    from ai_security_automation import AIAutomatedSecurity
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = AIAutomatedSecurity()
+        if admission:
+            system.enable_admission_control()
+        # Each legitimate device holds a session from one full authentication
+        sessions = []
+        for i in range(8):
+            result = system.authenticate_user("user", "user_password_456", {
+                "totp_token": system.level2.generate_totp(system.level2.totp_secrets["user"]),
+                "device_id": f"phone{i}", "neural_features": system.level5.neural_signature("user")
+            })
+            sessions.append(result["session_token"])
+    secret = system.level2.totp_secrets["user"]
+
+    arrivals = queue.Queue()
+    latencies, outcomes = [], {"legitimate_ok": 0, "legitimate_failed": 0, "attacks_served": 0, "attacks_shed": 0}
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            item = arrivals.get()
+            if item is None:
+                return
+            arrived, legitimate, username, password, factors, permit = item
+            result = system.authenticate_user(username, password, factors, permit=permit)
+            record(arrived, legitimate, result)
+
+    def record(arrived: float, legitimate: bool, result: Dict):
+        latency = time.perf_counter() - arrived
+        with lock:
+            if legitimate:
+                latencies.append(latency)
+                outcomes["legitimate_ok" if result["authenticated"] else "legitimate_failed"] += 1
+            else:
+                outcomes["attacks_shed" if result["reason"] == "Overloaded" else "attacks_served"] += 1
+
+    def arrive(now: float, legitimate: bool, username: str, password: str, factors: Dict):
+        permit = None
+        if admission:
+            permit = system.admit(username, factors)
+            if permit is None:
+                record(now, legitimate, {"authenticated": False, "reason": "Overloaded"})
+                return
+        arrivals.put((now, legitimate, username, password, factors, permit))
+
+    def generate():
+        rng = random.Random(0)
+        start = time.perf_counter()
+        sent_attacks = sent_legitimate = 0
+        while (now := time.perf_counter()) - start < duration:
+            elapsed = now - start
+            while sent_attacks < elapsed * attack_rate:
+                if sent_attacks % 2:
+                    request = (f"leaked{rng.randrange(100000)}", "hunter2", {"source_ip": "203.0.113.7"})
+                else:
+                    request = ("admin", "secure_password_123", {"totp_token": "123456", "source_ip": "203.0.113.7"})
+                arrive(now, False, *request)
+                sent_attacks += 1
+            while sent_legitimate < elapsed * legitimate_rate:
+                device = sent_legitimate % len(sessions)
+                if sent_legitimate % 2:
+                    factors = {"session_token": sessions[device]}
+                else:
+                    factors = {"totp_token": system.level2.generate_totp(secret), "device_id": f"phone{device}"}
+                arrive(now, True, "user", "user_password_456", factors)
+                sent_legitimate += 1
+            time.sleep(0.001)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    with contextlib.redirect_stdout(io.StringIO()):
+        for thread in threads:
+            thread.start()
+        generate()
+        backlog = arrivals.qsize()  # Still waiting when the arrivals stop
+        # Abandon the backlog (those clients have long since timed out)
+        with arrivals.mutex:
+            abandoned = list(arrivals.queue)
+            arrivals.queue.clear()
+        for item in abandoned:
+            if item[-1] is not None:
+                item[-1].release()
+        for _ in threads:
+            arrivals.put(None)
+        for thread in threads:
+            thread.join()
+        system.close()
+
+    latencies.sort()
+    outcomes.update({
+        "backlog": backlog,
+        "legitimate_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else float("nan"),
+        "legitimate_p99_ms": latencies[int(len(latencies) * 0.99)] * 1000 if latencies else float("nan"),
+        "admission": system.admission.get_metrics() if admission else None
+    })
+    return outcomes
+
+
+if __name__ == "__main__":
+    print("Admission Control")
+    controller = AdmissionController(initial_limit=4)
+    permits = [controller.try_acquire(Priority.DEFAULT) for _ in range(4)]
+    print(f"Limit 4: DEFAULT admitted {sum(p is not None for p in permits)}/4 (75% share), "
+          f"KNOWN admitted: {controller.try_acquire(Priority.KNOWN) is not None}, "
+          f"SUSPECT admitted: {controller.try_acquire(Priority.SUSPECT) is not None}")
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        controller.try_acquire(Priority.SUSPECT)
+    print(f"Rejection cost: {(time.perf_counter() - start) / 10000 * 1e6:.1f} µs")
+
+    print("\nOverload: 12,000 attack requests/s and 200 legitimate requests/s for 3 s, 32 workers")
+    for enabled in (False, True):
+        stats = simulate_overload(enabled)
+        print(f"- admission control {'on ' if enabled else 'off'}: legitimate p50 {stats['legitimate_p50_ms']:.1f} ms, "
+              f"p99 {stats['legitimate_p99_ms']:.1f} ms, {stats['legitimate_ok']} ok / "
+              f"{stats['legitimate_failed']} failed; attacks served {stats['attacks_served']}, "
+              f"shed {stats['attacks_shed']}; backlog at the end {stats['backlog']}")
+        if enabled:
+            print(f"  {stats['admission']}")
@@ -5,11 +5,18 @@ This system manages all 5 levels of security with AI-driven automation
 - Intelligent threat assessment
 - Adaptive security measures
 - Automated response protocols
+- Per-request deadline budgets with early abort
+- Admission control sheds excess load before any hashing or crypto
+- Verification codes delivered off the authentication path
+- Security event stream with incremental report diffs
+- Snapshot and restore of the full system state
 """
 
-import time
+import base64
 import random
-from typing import Dict, List, Optional, Tuple
+import time
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple, Union
 from enum import Enum
 
 # Import our security levels
@@ -18,6 +25,21 @@ from level2_two_factor import TwoFactorSecurity
 from level3_biometric import BiometricSecurity
 from level4_encryption import AdvancedEncryptionSecurity
 from level5_quantum_ai import QuantumAISecurity
+from session_tokens import SessionTokenManager
+from step_up_policy import StepUpPolicyEngine
+from risk_table import RiskTable
+from metrics_registry import MetricsRegistry
+from key_rotation import KeyRotationScheduler
+from snapshot import SnapshotReader, SnapshotWriter
+from access_log_index import AccessLogIndex
+from stuffing_detector import StuffingDetector
+from auth_trace import TraceRecorder
+from code_delivery import ConsoleTransport, DeliveryQueue
+from admission_control import AdmissionController, Permit, Priority
+from event_bus import EventBus, IncrementalReport
+from user_registry import UserRecord, UserRegistry
+from concurrency import Deadline, DeadlineExceeded
+from cipher_suites import DEFAULT_CIPHER_SUITE
 
 class SecurityLevel(Enum):
     BASIC_AUTH = 1
@@ -27,177 +49,488 @@ class SecurityLevel(Enum):
     QUANTUM_AI = 5
 
 class AIAutomatedSecurity:
-    def __init__(self):
+    def __init__(self, levels: Optional[Tuple] = None, clock: Callable[[], float] = time.time,
+                 rng: Optional[random.Random] = None, cipher_suite: str = DEFAULT_CIPHER_SUITE,
+                 metrics: Optional[MetricsRegistry] = None):
         print("Initializing AI Automated Security System...")
         print("Loading all 5 security levels...")
         
-        # Initialize all security levels
-        self.level1 = BasicAuthSecurity()
-        self.level2 = TwoFactorSecurity()
-        self.level3 = BiometricSecurity()
-        self.level4 = AdvancedEncryptionSecurity()
-        self.level5 = QuantumAISecurity()
+        self.metrics = metrics if metrics is not None else MetricsRegistry(prefix="echo_security_")
+        
+        # Initialize all security levels (or adopt levels restored from a snapshot);
+        # every level keeps its per-user state in one shared registry of records
+        if levels is None:
+            registry = UserRegistry()
+            delivery = DeliveryQueue(ConsoleTransport(), registry=self.metrics)
+            levels = (BasicAuthSecurity(clock, registry), TwoFactorSecurity(clock, rng, registry, delivery),
+                      BiometricSecurity(registry=registry),
+                      AdvancedEncryptionSecurity(clock=clock, registry=registry, cipher_suite=cipher_suite),
+                      QuantumAISecurity(clock=clock, rng=rng, registry=registry))
+        self.level1, self.level2, self.level3, self.level4, self.level5 = levels
+        self.registry = self.level1.registry
+        
+        # Striped counters: concurrent updates never race or serialize
+        self._attempts = self.metrics.counter("auth_attempts", "Authentication attempts")
+        self._successes = self.metrics.counter("auth_successes", "Successful authentications")
+        self._blocked = self.metrics.counter("auth_blocked", "Blocked authentication attempts", ("level",))
+        self._deadline_exceeded = self.metrics.counter("auth_deadline_exceeded",
+                                                       "Requests aborted when their deadline ran out", ("level",))
+        self._session_resumes = self.metrics.counter("session_resumes", "Requests served by a session token")
+        self._response_time = self.metrics.summary("auth_response_seconds", "Successful authentication latency")
+        
+        # Signed session tokens let repeat requests skip the 5-level pipeline
+        self.session_tokens = SessionTokenManager(clock=clock)
+        
+        # Levels publish lockouts, anomalies and key rotations; Level 5 monitors the first two
+        self.events = EventBus(registry=self.metrics)
+        for level in (self.level1, self.level4, self.level5):
+            level.events = self.events
+        self.level5.monitoring_queue = self.events.subscribe(("lockout", "anomaly"), name="level5_monitoring")
+        # Dashboards subscribe to report diffs instead of polling get_security_report
+        self.report_stream = IncrementalReport(self.events)
+        self.report_stream.start()
+        
+        # Keys rotate in the background; packages carry their key version
+        self.key_rotation = KeyRotationScheduler(self.level4, registry=self.metrics, clock=clock)
+        self.key_rotation.start()
+        
+        # Step-up policies choose which levels each request must pass
+        self.policy_engine = StepUpPolicyEngine(registry=self.metrics)
+        self.known_devices = self.registry.view("known_devices")
+        self._level_checks = {
+            1: ("Basic Authentication", "Failed basic authentication", self._check_basic_auth),
+            2: ("Two-Factor Authentication", "Failed two-factor authentication", self._check_two_factor),
+            3: ("Biometric Authentication", "Failed biometric authentication", self._check_biometric),
+            4: ("Encryption Security", "Failed encryption verification", self._check_encryption),
+            5: ("Quantum AI Security", "Failed quantum AI verification", self._check_quantum_ai)
+        }
         
         # Security state tracking
         self.user_security_state = {}
-        self.threat_assessment = {}
-        self.access_logs = []
-        self.security_metrics = {
-            "total_attempts": 0,
-            "successful_auths": 0,
-            "blocked_attempts": 0,
-            "average_response_time": 0.0
-        }
+        self.risk_table = RiskTable()
+        self.risk_table.add_many(["admin", "user"])
+        self.access_logs = deque(maxlen=1000)  # Keep only recent logs; appends are thread-safe
+        self.access_index = AccessLogIndex()  # Long-term history, indexed for queries
+        self.stuffing_detector = StuffingDetector()  # Cross-user view of failures per source
+        self._recorder = None  # Set while a trace is being captured
+        self.admission = None  # Set by enable_admission_control
+        self.suspect_risk = 0.5  # Source risk from which admission deprioritizes requests
+        
+        # Every time/randomness-dependent decision goes through one clock and RNG
+        self.set_clock_and_rng(clock, rng)
         
         print("All security levels loaded successfully!")
         print("AI Security Automation System is now operational.")
     
+    def set_clock_and_rng(self, clock: Callable[[], float], rng: Optional[random.Random] = None):
+        """Route every level's time and randomness through one clock and RNG (e.g. for replay)"""
+        self.clock = clock
+        self.rng = rng or random
+        for component in (self.level1, self.level2, self.level4, self.level5, self.session_tokens, self.key_rotation):
+            component.clock = clock
+        for component in (self.level2, self.level5):
+            component.rng = self.rng
+    
+    def close(self):
+        """Stop the background workers: key rotation, the report stream and code delivery"""
+        self.key_rotation.stop()
+        self.report_stream.stop()
+        self.level2.delivery.stop()
+    
+    def enable_admission_control(self, suspect_risk: float = 0.5, **options) -> AdmissionController:
+        """Put an adaptive concurrency limit in front of the level checks"""
+        self.suspect_risk = suspect_risk
+        self.admission = AdmissionController(registry=self.metrics, **options)
+        return self.admission
+    
+    def admission_priority(self, username: str, additional_factors: Optional[Dict] = None) -> Priority:
+        """Classify a request from cheap signals (no password hashing, no key operations)"""
+        additional_factors = additional_factors or {}
+        token = additional_factors.get("session_token")
+        # An HMAC check costs microseconds; it keeps forged tokens out of the top class
+        if token is not None and self.verify_session(token, username) is not None:
+            return Priority.SESSION
+        # A bare device_id earns nothing: it is unsigned, so anyone who learns one
+        # could quote it to jump the queue (KNOWN is for callers that verify devices)
+        source_ip = additional_factors.get("source_ip")
+        if source_ip is not None and self.stuffing_detector.source_risk(source_ip, self.clock()) >= self.suspect_risk:
+            return Priority.SUSPECT
+        return Priority.DEFAULT
+    
+    def admit(self, username: str, additional_factors: Optional[Dict] = None) -> Optional[Permit]:
+        """Admit a request on arrival (None: shed it); pass the permit to authenticate_user.
+        
+        A server that queues requests before authenticating them should admit
+        at arrival, so queued requests count against the limit and their wait
+        counts toward the latency the limit adapts to.
+        """
+        return self.admission.try_acquire(self.admission_priority(username, additional_factors))
+    
+    def _shed(self, username: str, additional_factors: Optional[Dict]) -> Dict[str, any]:
+        """The result for a request rejected by admission control (no level has run)"""
+        additional_factors = additional_factors or {}
+        return {
+            "user": username,
+            "timestamp": self.clock(),
+            "levels_passed": 0,
+            "total_levels": 5,
+            "authenticated": False,
+            "reason": "Overloaded",
+            "security_score": 0.0,
+            "threat_level": 0.0,
+            "source_ip": additional_factors.get("source_ip")
+        }
+    
+    def start_capture(self, path: str, passphrase: str) -> TraceRecorder:
+        """Record every authentication request (and a starting snapshot) to a trace file"""
+        self._recorder = TraceRecorder(self, path, passphrase)
+        return self._recorder
+    
+    def stop_capture(self) -> Dict[str, int]:
+        """Finish the trace file and return to the previous clock and RNG"""
+        recorder, self._recorder = self._recorder, None
+        return recorder.close() if recorder is not None else {}
+    
     def authenticate_user(self, username: str, password: str, 
-                         additional_factors: Dict = None) -> Dict[str, any]:
-        """Perform comprehensive authentication across all security levels"""
-        start_time = time.time()
-        self.security_metrics["total_attempts"] += 1
+                         additional_factors: Dict = None,
+                         deadline: Optional[Union[float, Deadline]] = None,
+                         permit: Optional[Permit] = None) -> Dict[str, any]:
+        """Perform risk-driven authentication across the required security levels.
+        
+        `deadline` is a time budget in seconds (or a Deadline shared with the
+        caller). Every level checks what is left of it; once it runs out the
+        request stops with reason "Deadline exceeded" instead of running on.
+        
+        With admission control enabled, a request without a `permit` (from
+        `admit`) is admitted here; a shed request returns reason "Overloaded"
+        before any level runs.
+        """
+        if self.admission is not None and permit is None:
+            permit = self.admit(username, additional_factors)
+            if permit is None:
+                # Not logged: a shed request says nothing about the credentials,
+                # and rejecting has to stay far cheaper than authenticating
+                return self._shed(username, additional_factors)
+        if deadline is not None and not isinstance(deadline, Deadline):
+            deadline = Deadline(deadline)
+        try:
+            recorder = self._recorder
+            if recorder is not None:
+                return recorder.record(self._authenticate, username, password, additional_factors, deadline)
+            return self._authenticate(username, password, additional_factors, deadline)
+        finally:
+            if permit is not None:
+                permit.release()
+    
+    def _authenticate(self, username: str, password: str, additional_factors: Dict = None,
+                      deadline: Optional[Deadline] = None) -> Dict[str, any]:
+        """The authentication pipeline itself (reads time and randomness only via clock/rng)"""
+        start_time = time.perf_counter()
+        self._attempts.inc()
+        additional_factors = additional_factors or {}
         
         result = {
             "user": username,
-            "timestamp": time.time(),
+            "timestamp": self.clock(),
             "levels_passed": 0,
             "total_levels": 5,
             "authenticated": False,
             "reason": "",
             "security_score": 0.0,
-            "threat_level": 0.0
+            "threat_level": 0.0,
+            "source_ip": additional_factors.get("source_ip")
         }
         
-        # Level 1: Basic Authentication
-        print(f"[{username}] Checking Level 1: Basic Authentication...")
-        level1_success = self.level1.authenticate(username, password)
-        if not level1_success:
-            result["reason"] = "Failed basic authentication"
-            self._log_access_attempt(result)
-            return result
-        result["levels_passed"] = 1
-        print(f"[{username}] ✓ Level 1 passed")
-        
-        # Level 2: Two-Factor Authentication
-        print(f"[{username}] Checking Level 2: Two-Factor Authentication...")
-        if additional_factors and "totp_token" in additional_factors:
-            level2_success = self.level2.verify_totp(username, additional_factors["totp_token"])
-        elif additional_factors and "sms_code" in additional_factors:
-            level2_success = self.level2.verify_sms_code(username, additional_factors["sms_code"])
-        else:
-            # Generate and send SMS code for demo
-            sms_code = self.level2.send_verification_code(username)
-            level2_success = self.level2.verify_sms_code(username, sms_code)
-        
-        if not level2_success:
-            result["reason"] = "Failed two-factor authentication"
-            self._log_access_attempt(result)
-            return result
-        result["levels_passed"] = 2
-        print(f"[{username}] ✓ Level 2 passed")
-        
-        # Level 3: Biometric Authentication
-        print(f"[{username}] Checking Level 3: Biometric Authentication...")
-        # For demo, we'll use stored templates
-        fingerprint = self.level3.fingerprint_templates.get(username)
-        voice = self.level3.voice_patterns.get(username)
-        face = self.level3.face_templates.get(username)
-        
-        bio_success = (
-            self.level3.verify_fingerprint(username, fingerprint) and
-            self.level3.verify_voice(username, voice) and
-            self.level3.verify_face(username, face)
-        )
-        
-        if not bio_success:
-            result["reason"] = "Failed biometric authentication"
-            self._log_access_attempt(result)
-            return result
-        result["levels_passed"] = 3
-        print(f"[{username}] ✓ Level 3 passed")
+        # Fast path: a valid session token skips all 5 levels, unless the user or the
+        # source has become riskier (e.g. a stuffing attack) than when it was issued
+        if "session_token" in additional_factors:
+            session = self.verify_session(additional_factors["session_token"], username)
+            if session and self.current_risk(username, result["source_ip"]) > session["risk_level"]:
+                result["session_rejected"] = "risk increased"
+                session = None
+            if session:
+                result["levels_passed"] = 5
+                result["authenticated"] = True
+                result["session_resumed"] = True
+                result["security_score"] = session["security_score"]
+                result["threat_level"] = session["risk_level"]
+                self._session_resumes.inc()
+                self._log_access_attempt(result)
+                return result
         
-        # Level 4: Encryption Security
-        print(f"[{username}] Checking Level 4: Encryption Security...")
-        # Test with a simple challenge
-        try:
-            test_data = f"auth_challenge_{username}_{int(time.time())}"
-            encrypted = self.level4.encrypt_data(username, test_data)
-            decrypted = self.level4.decrypt_data(username, encrypted)
-            level4_success = (decrypted == test_data)
-        except:
-            level4_success = False
+        # One registry lookup serves every level check below
+        record = self.registry.get(username)
         
-        if not level4_success:
-            result["reason"] = "Failed encryption verification"
-            self._log_access_attempt(result)
-            return result
-        result["levels_passed"] = 4
-        print(f"[{username}] ✓ Level 4 passed")
+        # Step-up policy: pick the level set from assessed risk and context
+        risk = self.assess_threat(username, result["source_ip"])["total_risk"]
+        device_id = additional_factors.get("device_id")
+        known_devices = record.known_devices if record is not None else None
+        context = {"known_device": device_id is not None and known_devices is not None and device_id in known_devices}
+        decision = self.policy_engine.select(risk, context)
+        result["total_levels"] = len(decision.levels)
+        result["policy"] = decision.policy
+        result["skipped_levels"] = decision.skipped_levels
         
-        # Level 5: Quantum AI Security (Most Difficult)
-        print(f"[{username}] Checking Level 5: Quantum AI Security...")
-        quantum_result = self.level5.quantum_authentication(
-            username, f"quantum_auth_{username}_{int(time.time())}"
-        )
+        for level in decision.levels:
+            name, failure_reason, check = self._level_checks[level]
+            print(f"[{username}] Checking Level {level}: {name}...")
+            cpu_start = time.thread_time()
+            try:
+                passed = check(username, password, additional_factors, result, record, deadline)
+            except DeadlineExceeded as exceeded:
+                # Not a verdict on the credentials: a distinct outcome, counted per level
+                result["reason"] = "Deadline exceeded"
+                result["deadline_exceeded"] = exceeded.stage
+                result["failed_level"] = level
+                self._deadline_exceeded.labels(level).inc()
+                print(f"[{username}] ✗ Level {level}: deadline exceeded")
+                self._log_access_attempt(result)
+                return result
+            self.policy_engine.record_level_cost(level, time.thread_time() - cpu_start)
+            
+            if not passed:
+                result["reason"] = failure_reason
+                result["failed_level"] = level  # Not levels_passed + 1 when the policy skips levels
+                self._blocked.labels(level).inc()
+                self._log_access_attempt(result)
+                return result
+            result["levels_passed"] += 1
+            print(f"[{username}] ✓ Level {level} passed")
         
-        if not quantum_result["success"]:
-            result["reason"] = "Failed quantum AI verification"
-            self._log_access_attempt(result)
-            return result
-        result["levels_passed"] = 5
         result["authenticated"] = True
-        result["security_score"] = quantum_result["neural_confidence"]
-        result["threat_level"] = quantum_result["anomaly_score"]
-        print(f"[{username}] ✓ Level 5 passed - FULL AUTHENTICATION ACHIEVED!")
+        if 5 not in decision.levels:
+            # Level 5 skipped by policy: score from the assessed risk instead
+            result["security_score"] = 1.0 - risk
+            result["threat_level"] = risk
+        print(f"[{username}] ✓ {decision.policy}: FULL AUTHENTICATION ACHIEVED!")
+        
+        # Only a full 5-level pass can vouch for a new device
+        if device_id is not None and not decision.skipped_levels:
+            record = record if record is not None else self.registry.record(username)
+            if record.known_devices is None:
+                record.known_devices = set()
+            record.known_devices.add(device_id)
         
         # Update metrics
-        self.security_metrics["successful_auths"] += 1
-        response_time = time.time() - start_time
-        self.security_metrics["average_response_time"] = (
-            (self.security_metrics["average_response_time"] * (self.security_metrics["successful_auths"] - 1) + response_time) /
-            self.security_metrics["successful_auths"]
-        )
+        self._successes.inc()
+        self._response_time.observe(time.perf_counter() - start_time)
         
         # Generate adaptive response based on threat level
         adaptive_response = self.level5.adaptive_threat_response(username, result["threat_level"])
         result["adaptive_response"] = adaptive_response
         
+        # Issue a session token so subsequent requests can take the fast path; a
+        # resume reports all 5 levels, so only a pass without skipped levels earns one
+        if not decision.skipped_levels:
+            result["session_token"] = self.session_tokens.issue(
+                username, result["threat_level"], result["security_score"]
+            )
+        
         self._log_access_attempt(result)
         return result
     
+    def _check_basic_auth(self, username: str, password: str, additional_factors: Dict, result: Dict,
+                          record: Optional[UserRecord], deadline: Optional[Deadline]) -> bool:
+        """Level 1: Basic Authentication"""
+        return self.level1.authenticate(username, password, record, deadline)
+    
+    def _check_two_factor(self, username: str, password: str, additional_factors: Dict, result: Dict,
+                          record: Optional[UserRecord], deadline: Optional[Deadline]) -> bool:
+        """Level 2: Two-Factor Authentication"""
+        if "totp_token" in additional_factors:
+            return self.level2.verify_totp(username, additional_factors["totp_token"], record, deadline)
+        if "sms_code" in additional_factors:
+            return self.level2.verify_sms_code(username, additional_factors["sms_code"], record, deadline)
+        # Generate and send SMS code for demo
+        sms_code = self.level2.send_verification_code(username, record, deadline)
+        if sms_code is None:
+            result["delivery_failed"] = True  # Delivery queue full: no code was sent
+            return False
+        return self.level2.verify_sms_code(username, sms_code, record, deadline)
+    
+    def _check_biometric(self, username: str, password: str, additional_factors: Dict, result: Dict,
+                         record: Optional[UserRecord], deadline: Optional[Deadline]) -> bool:
+        """Level 3: Biometric Authentication"""
+        row = self.level3.template_row(username, record)
+        if row is None:
+            return False
+        
+        # For demo, we'll use stored templates
+        templates = self.level3.templates
+        return (
+            self.level3.verify_fingerprint(username, templates.get_row(row, "fingerprint"), record, deadline) and
+            self.level3.verify_voice(username, templates.get_row(row, "voice"), record, deadline) and
+            self.level3.verify_face(username, templates.get_row(row, "face"), record, deadline)
+        )
+    
+    def _check_encryption(self, username: str, password: str, additional_factors: Dict, result: Dict,
+                          record: Optional[UserRecord], deadline: Optional[Deadline]) -> bool:
+        """Level 4: Encryption Security"""
+        # Test with a simple challenge
+        try:
+            test_data = f"auth_challenge_{username}_{int(self.clock())}"
+            encrypted = self.level4.encrypt_data(username, test_data, record, deadline)
+            decrypted = self.level4.decrypt_data(username, encrypted, record, deadline)
+            return decrypted == test_data
+        except DeadlineExceeded:
+            raise
+        except:
+            return False
+    
+    def _check_quantum_ai(self, username: str, password: str, additional_factors: Dict, result: Dict,
+                          record: Optional[UserRecord], deadline: Optional[Deadline]) -> bool:
+        """Level 5: Quantum AI Security (Most Difficult)"""
+        quantum_result = self.level5.quantum_authentication(
+            username, f"quantum_auth_{username}_{int(self.clock())}",
+            additional_factors.get("neural_features"), record, deadline
+        )
+        result["security_score"] = quantum_result["neural_confidence"]
+        result["threat_level"] = quantum_result["anomaly_score"]
+        return quantum_result["success"]
+    
+    @property
+    def security_metrics(self) -> Dict[str, float]:
+        """Merged view of the striped authentication counters"""
+        return {
+            "total_attempts": self._attempts.value,
+            "successful_auths": self._successes.value,
+            "blocked_attempts": sum(child.value for _, child in self._blocked.children()),
+            "session_resumes": self._session_resumes.value,
+            "deadline_exceeded": sum(child.value for _, child in self._deadline_exceeded.children()),
+            "average_response_time": self._response_time.average
+        }
+    
+    @property
+    def deadline_timeouts(self) -> Dict[str, float]:
+        """Requests aborted by their deadline, per level that noticed it"""
+        return {f"level_{labels[0]}": child.value for labels, child in self._deadline_exceeded.children()}
+    
+    def export_metrics(self, format: str = "openmetrics") -> str:
+        """Export all metrics as OpenMetrics text or a JSON snapshot"""
+        if format == "json":
+            return self.metrics.to_json()
+        return self.metrics.to_openmetrics()
+    
+    def verify_session(self, token: str, username: Optional[str] = None,
+                       max_risk: Optional[float] = None) -> Optional[Dict[str, any]]:
+        """Verify a session token issued by authenticate_user (fast path)"""
+        return self.session_tokens.verify(token, username, max_risk)
+    
+    def current_risk(self, username: str, source_ip: Optional[str] = None) -> float:
+        """Live credential-stuffing risk of a user and source (cheap: the risk table is untouched)"""
+        now = self.clock()
+        return max(self.stuffing_detector.user_risk(username, now),
+                   self.stuffing_detector.source_risk(source_ip, now))
+    
+    def revoke_sessions(self, username: Optional[str] = None):
+        """Revoke the session tokens of one user, or of every user"""
+        if username is None:
+            self.session_tokens.revoke_all()
+        else:
+            self.session_tokens.revoke_user(username)
+    
     def _log_access_attempt(self, result: Dict):
         """Log access attempt for monitoring and analysis"""
+        # The session token is a bearer credential: it goes to the caller, never into the logs
+        if "session_token" in result:
+            result = {key: value for key, value in result.items() if key != "session_token"}
         self.access_logs.append(result)
-        
-        # Keep only recent logs (last 1000)
-        if len(self.access_logs) > 1000:
-            self.access_logs = self.access_logs[-1000:]
+        self.access_index.append(result)
+        self.events.publish("auth", result["timestamp"], user=result["user"], authenticated=result["authenticated"],
+                            reason=result["reason"], levels_passed=result["levels_passed"],
+                            failed_level=result.get("failed_level"), source_ip=result["source_ip"],
+                            session_resumed=result.get("session_resumed", False))
+        if "deadline_exceeded" not in result:
+            # A timed-out request says nothing about the credentials
+            self.stuffing_detector.observe(result["user"], result["source_ip"], result["authenticated"],
+                                           result["timestamp"])
     
-    def assess_threat(self, username: str) -> Dict[str, float]:
+    def query_access_history(self, user: Optional[str] = None, reason: Optional[str] = None,
+                             levels_passed: Optional[int] = None, authenticated: Optional[bool] = None,
+                             start: Optional[float] = None, end: Optional[float] = None,
+                             limit: int = 100, cursor: Optional[int] = None) -> Dict:
+        """Page through indexed authentication history, newest first"""
+        return self.access_index.query(user=user, reason=reason, levels_passed=levels_passed,
+                                       authenticated=authenticated, start=start, end=end,
+                                       limit=limit, cursor=cursor)
+    
+    def assess_threat(self, username: str, source_ip: Optional[str] = None) -> Dict[str, float]:
         """Perform comprehensive threat assessment"""
-        if username not in self.threat_assessment:
-            self.threat_assessment[username] = {
-                "base_risk": 0.1,
-                "behavioral_risk": 0.0,
-                "access_pattern_risk": 0.0,
-                "total_risk": 0.1
-            }
-        
-        assessment = self.threat_assessment[username]
-        
-        # Update with AI analysis
-        assessment["behavioral_risk"] = random.uniform(0.0, 0.3)  # Simulated AI analysis
-        assessment["access_pattern_risk"] = random.uniform(0.0, 0.2)  # Simulated pattern analysis
-        
-        # Calculate total risk (weighted sum)
-        assessment["total_risk"] = (
-            0.5 * assessment["base_risk"] +
-            0.3 * assessment["behavioral_risk"] +
-            0.2 * assessment["access_pattern_risk"]
+        # Recent failures against this username (from any source) and the
+        # cross-user failure pattern of the request's source; the table
+        # recomputes the weighted total
+        now = self.clock()
+        return self.risk_table.update(
+            username,
+            behavioral_risk=self.stuffing_detector.user_risk(username, now),
+            access_pattern_risk=self.stuffing_detector.source_risk(source_ip, now)
         )
+    
+    def reassess_all(self):
+        """Reassess the risk of every known user in one vectorized pass"""
+        now = self.clock()
+        self.risk_table.reassess_all_with(lambda names: self.stuffing_detector.user_risk_many(names, now))
+    
+    def snapshot(self, path: str, passphrase: str, base: Optional[str] = None) -> Dict[str, int]:
+        """Write all five levels' state to a versioned binary snapshot.
+        
+        Secrets (keys, password hashes, TOTP secrets) are encrypted with a key
+        derived from the passphrase; NumPy arrays are stored raw. With `base`,
+        sections unchanged since that snapshot are stored as references.
+        """
+        writer = SnapshotWriter(passphrase, base=base)
+        for prefix, level in [("level1", self.level1), ("level2", self.level2), ("level3", self.level3),
+                              ("level4", self.level4), ("level5", self.level5)]:
+            level.save_state(writer, prefix)
+        
+        self.risk_table.save_state(writer, "system.risk")
+        writer.add_secret("system.session_tokens", {
+            "secret_key": base64.b64encode(self.session_tokens.secret_key).decode(),
+            "ttl": self.session_tokens.ttl,
+            "global_epoch": self.session_tokens.global_epoch,
+            "user_epochs": self.session_tokens.user_epochs
+        })
+        writer.add_json("system.state", {
+            "known_devices": {user: sorted(devices) for user, devices in self.known_devices.items()},
+            "user_security_state": self.user_security_state
+        })
+        # Logged results name users, sources and outcomes: encrypted like the other secrets
+        writer.add_secret("system.access_logs", list(self.access_logs))
+        self.access_index.save_state(writer, "system.access_index")
+        self.stuffing_detector.save_state(writer, "system.stuffing")
+        return writer.write(path)
+    
+    @classmethod
+    def restore(cls, path: str, passphrase: str) -> "AIAutomatedSecurity":
+        """Rebuild a system from a snapshot without regenerating any keys"""
+        reader = SnapshotReader(path, passphrase)
+        registry = UserRegistry()
+        # The metrics registry comes first so code delivery reports into it, as in __init__
+        metrics = MetricsRegistry(prefix="echo_security_")
+        delivery = DeliveryQueue(ConsoleTransport(), registry=metrics)
+        system = cls(metrics=metrics, levels=(
+            BasicAuthSecurity.load_state(reader, "level1", registry),
+            TwoFactorSecurity.load_state(reader, "level2", registry, delivery),
+            BiometricSecurity.load_state(reader, "level3", registry),
+            AdvancedEncryptionSecurity.load_state(reader, "level4", registry),
+            QuantumAISecurity.load_state(reader, "level5", registry)
+        ))
         
-        return assessment
+        system.risk_table.load_state(reader, "system.risk")
+        
+        tokens = reader.secret("system.session_tokens")
+        system.session_tokens.secret_key = base64.b64decode(tokens["secret_key"])
+        system.session_tokens.ttl = tokens["ttl"]
+        system.session_tokens.global_epoch = tokens["global_epoch"]
+        system.session_tokens.user_epochs = tokens["user_epochs"]
+        
+        state = reader.json("system.state")
+        system.known_devices.update({user: set(devices) for user, devices in state["known_devices"].items()})
+        system.user_security_state = state["user_security_state"]
+        system.access_logs.extend(reader.secret("system.access_logs"))
+        system.access_index = AccessLogIndex.load_state(reader, "system.access_index")
+        system.stuffing_detector = StuffingDetector.load_state(reader, "system.stuffing")
+        return system
     
     def get_security_report(self) -> Dict:
         """Generate a comprehensive security report"""
@@ -205,11 +538,16 @@ class AIAutomatedSecurity:
             "system_status": "ACTIVE",
             "active_users": list(self.user_security_state.keys()) if self.user_security_state else ["admin", "user"],
             "security_metrics": self.security_metrics,
-            "threat_assessment_summary": {
-                "high_risk_users": 0,
-                "medium_risk_users": 0,
-                "low_risk_users": 2  # Default for demo
-            },
+            "deadline_timeouts": self.deadline_timeouts,
+            "step_up_policy": self.policy_engine.get_metrics(),
+            "threat_assessment_summary": self.risk_table.summary(),
+            "top_risk_users": self.risk_table.top_k(5),
+            "key_rotation": self.key_rotation.get_metrics(),
+            "access_history": self.access_index.get_stats(),
+            "credential_stuffing": self.stuffing_detector.get_metrics(),
+            "code_delivery": self.level2.delivery.get_metrics(),
+            "admission_control": self.admission.get_metrics() if self.admission is not None else None,
+            "event_stream": dict(self.events.get_metrics(), report_version=self.report_stream.version),
             "level_status": {
                 "level_1_basic_auth": "OPERATIONAL",
                 "level_2_two_factor": "OPERATIONAL", 
@@ -246,7 +584,7 @@ class AIAutomatedSecurity:
             )
             
             print(f"Result: {'BLOCKED' if not result['authenticated'] else 'PASSED'}")
-            print(f"Failed at Level: {result['levels_passed'] + 1}")
+            print(f"Failed at Level: {result.get('failed_level')}")
             print(f"Reason: {result['reason']}")
         
         print(f"\nAll attack vectors successfully blocked by multi-layered security!")
@@ -265,11 +603,33 @@ if __name__ == "__main__":
     result = ai_sec.authenticate_user(
         "admin", 
         "secure_password_123",
-        {"totp_token": ai_sec.level2.generate_totp(ai_sec.level2.totp_secrets["admin"])}
+        {
+            "totp_token": ai_sec.level2.generate_totp(ai_sec.level2.totp_secrets["admin"]),
+            "device_id": "admin-laptop",
+            "neural_features": ai_sec.level5.neural_signature("admin")  # The demo client's own signature
+        }
     )
     
     print(f"\nAuthentication Result: {result}")
     
+    # Repeat request using the issued session token (skips all 5 levels)
+    if result["authenticated"]:
+        resumed = ai_sec.authenticate_user(
+            "admin", "", {"session_token": result["session_token"]}
+        )
+        print(f"\nSession resumed: {resumed['session_resumed']}")
+    
+    # Low-risk login from the now-known device skips the expensive levels
+    stepped = ai_sec.authenticate_user(
+        "admin",
+        "secure_password_123",
+        {
+            "totp_token": ai_sec.level2.generate_totp(ai_sec.level2.totp_secrets["admin"]),
+            "device_id": "admin-laptop"
+        }
+    )
+    print(f"\nKnown device policy: {stepped['policy']} (skipped levels {stepped['skipped_levels']})")
+    
     # Generate security report
     report = ai_sec.get_security_report()
     print(f"\nSecurity Report: {report}")
@@ -282,6 +642,81 @@ if __name__ == "__main__":
     print(f"- Successful authentications: {ai_sec.security_metrics['successful_auths']}")
     print(f"- Average response time: {ai_sec.security_metrics['average_response_time']:.3f}s")
     print(f"- Blocked attempts: {ai_sec.security_metrics['blocked_attempts']}")
+    print(f"- Session resumes: {ai_sec.security_metrics['session_resumes']}")
+    
+    # Indexed history: failed two-factor attempts for admin in the last hour
+    failed = ai_sec.query_access_history(user="admin", reason="Failed two-factor authentication",
+                                         start=time.time() - 3600, limit=10)
+    print(f"- Failed L2 attempts for admin in the last hour: {len(failed['events'])}")
+    
+    # Warm restart from a snapshot instead of regenerating every key
+    import contextlib
+    import io
+    import os
+    import tempfile
+    with tempfile.TemporaryDirectory() as directory:
+        full_path = os.path.join(directory, "security.snap")
+        stats = ai_sec.snapshot(full_path, "snapshot passphrase")
+        print(f"\nSnapshot: {stats['bytes']} bytes, {stats['sections']} sections")
+        
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            cold = AIAutomatedSecurity()
+        cold_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            restored = AIAutomatedSecurity.restore(full_path, "snapshot passphrase")
+        warm_seconds = time.perf_counter() - start
+        print(f"Cold start: {cold_seconds * 1000:.0f} ms; restore: {warm_seconds * 1000:.0f} ms "
+              f"(includes passphrase key derivation)")
+        print(f"Restored system decrypts old data: "
+              f"{restored.level4.decrypt_data('admin', ai_sec.level4.encrypt_data('admin', 'probe')) == 'probe'}; "
+              f"session still valid: {restored.verify_session(result['session_token'], 'admin') is not None}")
+        
+        # Invariant: the restored system answers every query the way the original does
+        now = time.time()
+        mismatched = [name for name, state in {
+            "risk table": lambda system: system.risk_table.top_k(len(system.risk_table)),
+            "access history": lambda system: system.query_access_history(limit=1000),
+            "stuffing sketches": lambda system: (system.stuffing_detector.failing_sources.top(10),
+                                                 system.stuffing_detector.user_risk("admin", now)),
+            "user records": lambda system: {name: (record.password_hash, record.totp_secret, record.known_devices)
+                                            for name, record in system.registry.items()}
+        }.items() if state(restored) != state(ai_sec)]
+        print(f"Restored state matches the original: {not mismatched}")
+        assert not mismatched, f"snapshot round trip changed: {mismatched}"
+        
+        with contextlib.redirect_stdout(io.StringIO()):
+            ai_sec.authenticate_user("user", "wrong_password")
+        stats = ai_sec.snapshot(os.path.join(directory, "security.1.snap"), "snapshot passphrase", base=full_path)
+        print(f"Incremental snapshot: {stats['bytes']} bytes ({stats['written']} sections written, "
+              f"{stats['referenced']} referenced from the base)")
+    
+    # Credential stuffing: one source sprays leaked credentials across many usernames
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(60):
+            ai_sec.authenticate_user(f"leaked{i}", "hunter2", {"source_ip": "203.0.113.7"})
+    threat = ai_sec.assess_threat("admin", "203.0.113.7")
+    print(f"Stuffing source 203.0.113.7: access pattern risk {threat['access_pattern_risk']:.2f} "
+          f"(total {threat['total_risk']:.2f}), policy for admin from it: {ai_sec.policy_engine.select(threat['total_risk'], {}).policy}")
+    print(f"Top failing sources: {ai_sec.stuffing_detector.top_sources(1)}")
+    
+    # Deadline budgets: tight budgets abort early, and the counters show which level ran out
+    print("\nDeadline budgets (20 full authentications each):")
+    for budget_ms in (0.2, 1, 3, 50):
+        outcomes = {}
+        with contextlib.redirect_stdout(io.StringIO()):
+            for _ in range(20):
+                result = ai_sec.authenticate_user(
+                    "user", "user_password_456",
+                    {"totp_token": ai_sec.level2.generate_totp(ai_sec.level2.totp_secrets["user"]),
+                     "neural_features": ai_sec.level5.neural_signature("user")},
+                    deadline=budget_ms / 1000
+                )
+                outcome = "authenticated" if result["authenticated"] else result["reason"]
+                outcomes[outcome] = outcomes.get(outcome, 0) + 1
+        print(f"- {budget_ms:>4} ms: {outcomes}")
+    print(f"Deadline timeouts by level: {ai_sec.deadline_timeouts}")
     
     print("\nAI Security Automation System is running and protecting all assets!")
     print("All 5 levels of security are active and coordinated by AI intelligence.")
\ No newline at end of file
@@ -0,0 +1,357 @@
+"""
+Authentication Trace Capture and Replay
+- Capture: request inputs, per-request clock instant and RNG seed, decisions and latency
+- Compact trace: JSON header, then zlib-compressed, Fernet-encrypted frames of records
+- Replay against a system restored from the capture's starting snapshot
+- Injected fixed clock and seeded RNG: decisions are reproduced exactly
+- Fast or original pacing; latency comparison report between two builds
+"""
+
+import base64
+import contextlib
+import io
+import json
+import os
+import random
+import secrets
+import struct
+import subprocess
+import threading
+import time
+import zlib
+import numpy as np
+from cryptography.fernet import Fernet
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from snapshot import KDF_ITERATIONS, derive_key
+
+MAGIC = b"ECHOTRCE"
+FORMAT_VERSION = 1
+FLUSH_EVERY = 256  # Records per compressed frame
+
+# magic, format version, header length
+_PREAMBLE = struct.Struct(">8sHI")
+_FRAME = struct.Struct(">I")
+
+# Result fields that make up a "decision"; replay must reproduce all of them
+DECISION_FIELDS = ("authenticated", "levels_passed", "reason", "policy", "security_score",
+                   "threat_level", "session_token")
+
+
+class FixedClock:
+    """A clock that returns whatever instant it was last set to"""
+
+    def __init__(self, now: float = 0.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def build_label() -> str:
+    """Identify the running build (git revision if available)"""
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or "unknown"
+    except (OSError, subprocess.SubprocessError):
+        return "unknown"
+
+
+def decision_of(result: Dict) -> Dict:
+    return {field: result.get(field) for field in DECISION_FIELDS}
+
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Cannot record {type(value).__name__} in a trace")
+
+
+class TraceRecorder:
+    """Captures requests to a trace file; installed by AIAutomatedSecurity.start_capture.
+
+    While capturing, requests are serialized and each one runs with the clock
+    frozen at its arrival time and the RNG seeded from a recorded seed.
+    """
+
+    def __init__(self, system, path: str, passphrase: str, flush_every: int = FLUSH_EVERY):
+        self.system = system
+        self.path = path
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = []
+        self.records = 0
+
+        # The replay starts from exactly this state
+        snapshot_path = path + ".snap"
+        system.snapshot(snapshot_path, passphrase)
+
+        salt = secrets.token_bytes(16)
+        self._fernet = Fernet(derive_key(passphrase, salt))
+        header = json.dumps({
+            "snapshot": os.path.basename(snapshot_path),
+            "kdf": {"algorithm": "pbkdf2-sha256", "iterations": KDF_ITERATIONS,
+                    "salt": base64.b64encode(salt).decode()},
+            "started": time.time(),
+            "build": build_label()
+        }).encode()
+        self._file = open(path, "wb")
+        self._file.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)) + header)
+
+        self._previous = (system.clock, system.rng)
+        self.clock = FixedClock(time.time())
+        self.rng = random.Random()
+        system.set_clock_and_rng(self.clock, self.rng)
+
+    def record(self, authenticate, username: str, password: str, additional_factors: Optional[Dict],
+               deadline=None) -> Dict:
+        """Run one request under a frozen clock and fresh seed, and record it"""
+        with self._lock:
+            seed = secrets.randbits(63)
+            self.clock.now = time.time()
+            self.rng.seed(seed)
+            start = time.perf_counter()
+            result = authenticate(username, password, additional_factors, deadline)
+            latency = time.perf_counter() - start
+            self._pending.append({
+                "t": self.clock.now,
+                "seed": seed,
+                "user": username,
+                "password": password,
+                "factors": additional_factors,
+                "deadline": deadline.budget if deadline is not None else None,
+                "latency": latency,
+                "decision": decision_of(result)
+            })
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+        return result
+
+    def _flush(self):
+        """Write pending records as one compressed, encrypted frame (lock held)"""
+        if not self._pending:
+            return
+        lines = "\n".join(json.dumps(record, separators=(",", ":"), default=_json_default)
+                          for record in self._pending)
+        frame = self._fernet.encrypt(zlib.compress(lines.encode(), 6))
+        self._file.write(_FRAME.pack(len(frame)) + frame)
+        self.records += len(self._pending)
+        self._pending = []
+
+    def close(self) -> Dict[str, int]:
+        with self._lock:
+            self._flush()
+            self._file.close()
+            self.system.set_clock_and_rng(*self._previous)
+        return {"records": self.records, "bytes": os.path.getsize(self.path),
+                "snapshot_bytes": os.path.getsize(self.path + ".snap")}
+
+
+def read_trace(path: str, passphrase: str) -> Tuple[Dict, Iterator[Dict]]:
+    """The trace header and an iterator over its records"""
+    handle = open(path, "rb")
+    magic, version, header_length = _PREAMBLE.unpack(handle.read(_PREAMBLE.size))
+    if magic != MAGIC:
+        handle.close()
+        raise ValueError(f"Not an authentication trace: {path}")
+    if version != FORMAT_VERSION:
+        handle.close()
+        raise ValueError(f"Unsupported trace format version {version}: {path}")
+    header = json.loads(handle.read(header_length))
+    kdf = header["kdf"]
+    fernet = Fernet(derive_key(passphrase, base64.b64decode(kdf["salt"]), kdf["iterations"]))
+
+    def records():
+        with handle:
+            while True:
+                length = handle.read(_FRAME.size)
+                if not length:
+                    return
+                frame = handle.read(_FRAME.unpack(length)[0])
+                for line in zlib.decompress(fernet.decrypt(frame)).decode().split("\n"):
+                    yield json.loads(line)
+
+    return header, records()
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    """Latency percentiles in milliseconds"""
+    if not latencies:
+        return {"count": 0}
+    values = np.array(latencies) * 1000
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {"count": len(values), "mean_ms": float(values.mean()), "p50_ms": float(p50),
+            "p90_ms": float(p90), "p99_ms": float(p99), "max_ms": float(values.max())}
+
+
+def replay(path: str, passphrase: str, pace: str = "fast", speed: float = 1.0,
+           label: Optional[str] = None, quiet: bool = True) -> Dict:
+    """Re-run a trace against a system restored from its starting snapshot.
+
+    pace="fast" issues requests back to back; pace="original" keeps the
+    captured inter-arrival times (divided by `speed`). The injected clock
+    always reads the captured instant, so pacing never changes decisions.
+    Recorded deadline budgets are re-applied on real time, so a build that
+    runs out of budget where the captured one did not shows up as a mismatch.
+    """
+    from ai_security_automation import AIAutomatedSecurity
+
+    header, records = read_trace(path, passphrase)
+    snapshot_path = os.path.join(os.path.dirname(os.path.abspath(path)), header["snapshot"])
+    output = io.StringIO() if quiet else None
+    with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+        system = AIAutomatedSecurity.restore(snapshot_path, passphrase)
+    clock, rng = FixedClock(), random.Random()
+    system.set_clock_and_rng(clock, rng)
+
+    latencies, captured, by_policy = [], [], {}
+    mismatches = []
+    first_time = wall_start = None
+    count = 0
+    try:
+        for record in records:
+            if pace == "original":
+                if first_time is None:
+                    first_time, wall_start = record["t"], time.perf_counter()
+                delay = wall_start + (record["t"] - first_time) / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            clock.now = record["t"]
+            rng.seed(record["seed"])
+            if quiet:
+                output.seek(0)
+                output.truncate()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+                result = system.authenticate_user(record["user"], record["password"], record["factors"],
+                                                  record.get("deadline"))
+            latency = time.perf_counter() - start
+
+            decision = decision_of(result)
+            if decision != record["decision"]:
+                mismatches.append({"index": count, "user": record["user"],
+                                   "captured": record["decision"], "replayed": decision})
+            latencies.append(latency)
+            captured.append(record["latency"])
+            by_policy.setdefault(decision["policy"] or "session_resume", []).append(latency)
+            count += 1
+    finally:
+        with contextlib.redirect_stdout(output) if quiet else contextlib.nullcontext():
+            system.close()
+
+    return {
+        "label": label or build_label(),
+        "trace": os.path.basename(path),
+        "captured_build": header["build"],
+        "pace": pace,
+        "requests": count,
+        "identical_decisions": not mismatches,
+        "mismatch_count": len(mismatches),
+        "mismatches": mismatches[:20],
+        "latency": latency_summary(latencies),
+        "captured_latency": latency_summary(captured),
+        "latency_by_policy": {policy: latency_summary(values) for policy, values in by_policy.items()}
+    }
+
+
+def compare_reports(baseline: Dict, candidate: Dict) -> Dict:
+    """Latency deltas (candidate vs baseline), overall and per policy"""
+    def delta(before: Dict, after: Dict) -> Dict[str, float]:
+        return {
+            metric: {"baseline": before[metric], "candidate": after[metric],
+                     "change_pct": (after[metric] / before[metric] - 1) * 100 if before[metric] else 0.0}
+            for metric in ("mean_ms", "p50_ms", "p90_ms", "p99_ms") if metric in before and metric in after
+        }
+    policies = set(baseline["latency_by_policy"]) & set(candidate["latency_by_policy"])
+    return {
+        "baseline": baseline["label"],
+        "candidate": candidate["label"],
+        "same_trace": baseline["trace"] == candidate["trace"] and baseline["requests"] == candidate["requests"],
+        "decisions_reproduced": baseline["identical_decisions"] and candidate["identical_decisions"],
+        "overall": delta(baseline["latency"], candidate["latency"]),
+        "by_policy": {policy: delta(baseline["latency_by_policy"][policy], candidate["latency_by_policy"][policy])
+                      for policy in sorted(policies)}
+    }
+
+
+def format_comparison(comparison: Dict) -> str:
+    lines = [f"Latency: {comparison['candidate']} vs {comparison['baseline']} "
+             f"(same trace: {comparison['same_trace']}, decisions reproduced: {comparison['decisions_reproduced']})"]
+    for scope, metrics in [("overall", comparison["overall"])] + list(comparison["by_policy"].items()):
+        cells = ", ".join(f"{metric[:-3]} {values['baseline']:.3f} -> {values['candidate']:.3f} ms "
+                          f"({values['change_pct']:+.1f}%)" for metric, values in metrics.items())
+        lines.append(f"  {scope}: {cells}")
+    return "\n".join(lines)
+
+
+def _demo_workload(system, requests: int = 300, seed: int = 5):
+    """Mixed traffic: good and bad logins, session resumes, SMS fallback and a stuffing burst"""
+    rng = random.Random(seed)
+    token = None
+    for i in range(requests):
+        kind = rng.random()
+        if kind < 0.3:
+            factors = {"totp_token": system.level2.generate_totp(system.level2.totp_secrets["admin"]),
+                       "device_id": "admin-laptop", "source_ip": "10.0.0.5",
+                       "neural_features": system.level5.neural_signature("admin")}
+            result = system.authenticate_user("admin", "secure_password_123", factors)
+            token = result.get("session_token") or token
+        elif kind < 0.5 and token:
+            system.authenticate_user("admin", "", {"session_token": token, "source_ip": "10.0.0.5"})
+        elif kind < 0.65:
+            system.authenticate_user("user", "user_password_456", {"source_ip": "10.0.0.9"})
+        elif kind < 0.75:
+            system.authenticate_user("user", "wrong_password", {"source_ip": "10.0.0.9"})
+        else:
+            system.authenticate_user(f"leaked{i}", "hunter2", {"source_ip": "203.0.113.7"})
+
+
+if __name__ == "__main__":
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Capture and replay authentication traces")
+    commands = parser.add_subparsers(dest="command")
+    replay_parser = commands.add_parser("replay", help="replay a trace and write a latency report")
+    replay_parser.add_argument("trace")
+    replay_parser.add_argument("--passphrase", required=True)
+    replay_parser.add_argument("--pace", choices=("fast", "original"), default="fast")
+    replay_parser.add_argument("--speed", type=float, default=1.0)
+    replay_parser.add_argument("--label")
+    replay_parser.add_argument("--out", help="write the JSON report here")
+    compare_parser = commands.add_parser("compare", help="compare two replay reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    args = parser.parse_args()
+
+    if args.command == "replay":
+        report = replay(args.trace, args.passphrase, args.pace, args.speed, args.label)
+        print(f"Replayed {report['requests']} requests ({report['pace']}): identical decisions: "
+              f"{report['identical_decisions']}, p50 {report['latency']['p50_ms']:.3f} ms, "
+              f"p99 {report['latency']['p99_ms']:.3f} ms")
+        if args.out:
+            with open(args.out, "w") as handle:
+                json.dump(report, handle, indent=2)
+    elif args.command == "compare":
+        with open(args.baseline) as before, open(args.candidate) as after:
+            print(format_comparison(compare_reports(json.load(before), json.load(after))))
+    else:
+        from ai_security_automation import AIAutomatedSecurity
+
+        print("Authentication Trace Capture and Replay")
+        with tempfile.TemporaryDirectory() as directory:
+            trace_path = os.path.join(directory, "auth.trace")
+            with contextlib.redirect_stdout(io.StringIO()):
+                system = AIAutomatedSecurity()
+                system.start_capture(trace_path, "trace passphrase")
+                _demo_workload(system)
+                stats = system.stop_capture()
+            print(f"Captured {stats['records']} requests: {stats['bytes']} byte trace "
+                  f"({stats['bytes'] / stats['records']:.0f} bytes/request) + {stats['snapshot_bytes']} byte snapshot")
+
+            baseline = replay(trace_path, "trace passphrase", label="baseline")
+            candidate = replay(trace_path, "trace passphrase", label="candidate")
+            print(f"Replay reproduced every decision: {baseline['identical_decisions']} "
+                  f"(mismatches: {baseline['mismatch_count']})")
+            print(format_comparison(compare_reports(baseline, candidate)))
+            system.close()
@@ -0,0 +1,277 @@
+"""
+Streaming Behavioral Biometrics
+- Continuous keystroke and mouse event streams per session
+- Sliding-window feature extraction with NumPy
+- Per-user profiles updated with exponential decay
+- Vectorized DTW for variable-length rhythm sequences
+- Bounded per-session memory (fixed-size ring buffers)
+"""
+
+import time
+import numpy as np
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+FEATURE_NAMES = (
+    "interval_mean", "interval_std", "interval_median", "interval_p90",
+    "dwell_mean", "dwell_std",
+    "speed_mean", "speed_std", "speed_p90", "turn_mean"
+)
+_KEY_FEATURES = slice(0, 6)
+_MOUSE_FEATURES = slice(6, 10)
+
+
+def dtw_distance(a: Sequence[float], b: Sequence[float]) -> float:
+    """Dynamic time warping distance, normalized by path length bound.
+
+    Each DP row is computed with vectorized NumPy: the horizontal dependency
+    D[i, j] = c[i, j] + min(U[j], D[i, j-1]) unrolls to
+    D[i, :] = C + minimum.accumulate(U + c - C), with C = cumsum(c).
+    """
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    if len(a) == 0 or len(b) == 0:
+        return float("inf")
+    cost = np.abs(a[:, None] - b[None, :])
+
+    previous = np.cumsum(cost[0])
+    for i in range(1, len(a)):
+        row_cost = cost[i]
+        upper = np.empty_like(previous)
+        upper[0] = previous[0]
+        np.minimum(previous[1:], previous[:-1], out=upper[1:])  # D[i-1, j], D[i-1, j-1]
+        cumulative = np.cumsum(row_cost)
+        previous = cumulative + np.minimum.accumulate(upper + row_cost - cumulative)
+    return float(previous[-1] / (len(a) + len(b)))
+
+
+def sequence_similarity(a: Sequence[float], b: Sequence[float]) -> float:
+    """Similarity in [0, 1] between two variable-length sequences via DTW"""
+    a = np.asarray(a, dtype=np.float64)
+    b = np.asarray(b, dtype=np.float64)
+    magnitude = np.abs(a).mean() + np.abs(b).mean() if len(a) and len(b) else 0.0
+    if magnitude == 0:
+        return 0.0
+    return max(0.0, 1.0 - 2.0 * dtw_distance(a, b) / magnitude)
+
+
+def _quantile(sorted_values: np.ndarray, q: float) -> float:
+    """Linear-interpolated quantile of an already sorted array (cheaper than np.percentile)"""
+    position = q * (len(sorted_values) - 1)
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return float(sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower))
+
+
+class _Ring:
+    """Fixed-capacity ring buffer of float64 rows"""
+
+    def __init__(self, capacity: int, width: int):
+        self.data = np.zeros((capacity, width))
+        self.capacity = capacity
+        self.count = 0  # Total rows ever pushed
+
+    def push(self, rows: np.ndarray):
+        rows = rows[-self.capacity:]
+        start = self.count % self.capacity
+        first = min(len(rows), self.capacity - start)
+        self.data[start:start + first] = rows[:first]
+        self.data[:len(rows) - first] = rows[first:]
+        self.count += len(rows)
+
+    def last(self, n: int) -> np.ndarray:
+        """The most recent n rows, oldest first"""
+        n = min(n, self.count, self.capacity)
+        end = self.count % self.capacity
+        if n <= end:
+            return self.data[end - n:end]
+        return np.concatenate((self.data[self.capacity - (n - end):], self.data[:end]))
+
+
+@dataclass
+class BehaviorProfile:
+    """Exponentially decayed per-user behavior model"""
+    mean: np.ndarray = field(default_factory=lambda: np.full(len(FEATURE_NAMES), np.nan))
+    var: np.ndarray = field(default_factory=lambda: np.full(len(FEATURE_NAMES), np.nan))
+    windows: int = 0
+    reference_intervals: Optional[np.ndarray] = None
+    hour_histogram: np.ndarray = field(default_factory=lambda: np.zeros(24))
+
+
+class BehaviorSession:
+    """Streaming state for one user session (bounded memory)"""
+
+    def __init__(self, username: str, key_capacity: int, mouse_capacity: int, authenticated: bool = False):
+        self.username = username
+        self.authenticated = authenticated  # Only sessions of an authenticated login teach the profile
+        self.keys = _Ring(key_capacity, 2)  # press time, dwell
+        self.mouse = _Ring(mouse_capacity, 3)  # time, x, y
+        self.keys_since_window = 0
+        self.scores = []
+
+    def memory_bytes(self) -> int:
+        return self.keys.data.nbytes + self.mouse.data.nbytes
+
+
+class BehavioralStreamEngine:
+    def __init__(self, key_window: int = 32, mouse_window: int = 64, step: int = 8,
+                 decay: float = 0.05, learn_threshold: float = 0.6, min_windows: int = 5):
+        self.key_window = key_window
+        self.mouse_window = mouse_window
+        self.step = step  # New keystrokes between scored windows
+        self.decay = decay
+        self.learn_threshold = learn_threshold
+        self.min_windows = min_windows  # Windows needed before scores are trusted
+        self.profiles = {}
+
+    def seed_profile(self, username: str, typing_rhythm: Sequence[float], login_hours: Sequence[int]):
+        """Seed a profile from a static behavioral pattern"""
+        profile = self.profiles.setdefault(username, BehaviorProfile())
+        profile.reference_intervals = np.asarray(typing_rhythm, dtype=np.float64)
+        for hour in login_hours:
+            profile.hour_histogram[hour % 24] += 1.0
+
+    def open_session(self, username: str, authenticated: bool = False) -> BehaviorSession:
+        return BehaviorSession(username, key_capacity=2 * self.key_window,
+                               mouse_capacity=2 * self.mouse_window, authenticated=authenticated)
+
+    def feed(self, session: BehaviorSession, key_times: Sequence[float] = (),
+             key_dwells: Sequence[float] = (), mouse_times: Sequence[float] = (),
+             mouse_x: Sequence[float] = (), mouse_y: Sequence[float] = ()) -> List[Dict[str, float]]:
+        """Push events into a session; returns scores for any completed windows"""
+        if len(mouse_times):
+            session.mouse.push(np.column_stack((mouse_times, mouse_x, mouse_y)))
+
+        scores = []
+        key_rows = np.column_stack((key_times, key_dwells)) if len(key_times) else np.empty((0, 2))
+        while len(key_rows):
+            take = self.step - session.keys_since_window
+            session.keys.push(key_rows[:take])
+            session.keys_since_window += len(key_rows[:take])
+            key_rows = key_rows[take:]
+            if session.keys_since_window >= self.step:
+                session.keys_since_window = 0
+                if session.keys.count >= self.key_window:
+                    scores.append(self.score_window(session))
+        session.scores.extend(scores)
+        del session.scores[:-16]  # Keep recent scores only
+        return scores
+
+    def extract_features(self, session: BehaviorSession) -> np.ndarray:
+        """Feature vector of the current sliding window (NaN where no data)"""
+        features = np.full(len(FEATURE_NAMES), np.nan)
+        keys = session.keys.last(self.key_window)
+        if len(keys) >= 2:
+            intervals = np.sort(np.diff(keys[:, 0]))
+            features[_KEY_FEATURES] = (
+                intervals.mean(), intervals.std(), _quantile(intervals, 0.5), _quantile(intervals, 0.9),
+                keys[:, 1].mean(), keys[:, 1].std()
+            )
+        mouse = session.mouse.last(self.mouse_window)
+        if len(mouse) >= 3:
+            deltas = np.diff(mouse, axis=0)
+            dt = np.maximum(deltas[:, 0], 1e-6)
+            speeds = np.sort(np.hypot(deltas[:, 1], deltas[:, 2]) / dt)
+            headings = np.arctan2(deltas[:, 2], deltas[:, 1])
+            turns = np.abs(np.angle(np.exp(1j * np.diff(headings))))
+            features[_MOUSE_FEATURES] = (speeds.mean(), speeds.std(), _quantile(speeds, 0.9), turns.mean())
+        return features
+
+    def score_window(self, session: BehaviorSession) -> Dict[str, float]:
+        """Score the current window against the user's profile, then adapt the profile.
+
+        Until the profile has min_windows windows the verdict is "enrolling"
+        (score None): such windows prove nothing, and only an authenticated
+        session's windows are learned.
+        """
+        features = self.extract_features(session)
+        profile = self.profiles.get(session.username)
+        if profile is None:
+            if not session.authenticated:
+                return {"score": None, "enrolling": True, "windows": 0}
+            profile = self.profiles[session.username] = BehaviorProfile()
+        intervals = np.diff(session.keys.last(self.key_window)[:, 0])
+
+        if profile.windows < self.min_windows:
+            if session.authenticated:
+                self._update_profile(profile, features, intervals)
+            return {"score": None, "enrolling": True, "windows": profile.windows}
+
+        z = (features - profile.mean) / np.sqrt(profile.var + 1e-9)
+        distance = float(np.sqrt(np.nanmean(z * z))) if np.isfinite(z).any() else 0.0
+        score = float(np.exp(-distance * distance / 8.0))
+        if profile.reference_intervals is not None and len(intervals):
+            score = 0.7 * score + 0.3 * sequence_similarity(intervals, profile.reference_intervals)
+
+        if session.authenticated and score >= self.learn_threshold:
+            self._update_profile(profile, features, intervals)
+        return {"score": score, "enrolling": False, "windows": profile.windows}
+
+    def _update_profile(self, profile: BehaviorProfile, features: np.ndarray, intervals: np.ndarray):
+        """Exponential-decay update of mean and variance (NaN features are skipped)"""
+        seen = np.isfinite(features)
+        fresh = seen & ~np.isfinite(profile.mean)
+        profile.mean[fresh] = features[fresh]
+        profile.var[fresh] = (0.25 * features[fresh]) ** 2  # Wide prior until data accumulates
+
+        update = seen & ~fresh
+        alpha = max(self.decay, 1.0 / (profile.windows + 1))
+        delta = features[update] - profile.mean[update]
+        profile.mean[update] += alpha * delta
+        profile.var[update] = (1 - alpha) * (profile.var[update] + alpha * delta * delta)
+
+        if len(intervals):
+            profile.reference_intervals = intervals.copy()
+        profile.windows += 1
+
+    def hour_likelihood(self, username: str, hour: int, tolerance: int = 1) -> float:
+        """Share of past logins within `tolerance` hours of `hour` (circular)"""
+        profile = self.profiles.get(username)
+        if profile is None or profile.hour_histogram.sum() == 0:
+            return 0.0
+        nearby = [(hour + offset) % 24 for offset in range(-tolerance, tolerance + 1)]
+        return float(profile.hour_histogram[nearby].sum() / profile.hour_histogram.sum())
+
+    def record_login_hour(self, username: str, hour: int):
+        """Decay the login-hour histogram and add the new login"""
+        profile = self.profiles.setdefault(username, BehaviorProfile())
+        profile.hour_histogram *= 1 - self.decay
+        profile.hour_histogram[hour % 24] += 1.0
+
+
+if __name__ == "__main__":
+    print("Streaming Behavioral Biometrics")
+    rng = np.random.default_rng(3)
+    engine = BehavioralStreamEngine()
+
+    def synthetic_stream(count: int, interval: float, dwell: float, speed: float):
+        key_times = np.cumsum(rng.gamma(8.0, interval / 8.0, count))
+        mouse_times = np.cumsum(np.full(count * 2, 0.01))
+        steps = rng.normal(speed * 0.01, speed * 0.002, (count * 2, 2))
+        positions = np.cumsum(steps, axis=0)
+        return (key_times, rng.normal(dwell, dwell * 0.1, count),
+                mouse_times, positions[:, 0], positions[:, 1])
+
+    genuine = engine.open_session("admin", authenticated=True)
+    engine.feed(genuine, *synthetic_stream(400, 0.18, 0.09, 300.0))
+    print(f"Genuine session: last window score {genuine.scores[-1]['score']:.3f} "
+          f"({genuine.memory_bytes()} bytes of session buffers)")
+
+    impostor = engine.open_session("admin")
+    impostor_scores = engine.feed(impostor, *synthetic_stream(80, 0.35, 0.15, 900.0))
+    print(f"Impostor session: mean window score {np.mean([s['score'] for s in impostor_scores]):.3f}")
+
+    unknown = engine.open_session("mallory")
+    unknown_scores = engine.feed(unknown, *synthetic_stream(80, 0.35, 0.15, 900.0))
+    print(f"Unenrolled user: {sum(s['enrolling'] for s in unknown_scores)}/{len(unknown_scores)} windows "
+          f"'enrolling' (no verdict), profile created: {'mallory' in engine.profiles}")
+
+    session = engine.open_session("admin", authenticated=True)
+    stream = synthetic_stream(4000, 0.18, 0.09, 300.0)
+    start = time.perf_counter()
+    windows = engine.feed(session, *stream)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {len(windows)} windows: {elapsed / len(windows) * 1e6:.0f} µs per window")
+
+    print(f"DTW similarity (variable length): "
+          f"{sequence_similarity([0.2, 0.3, 0.1, 0.4, 0.2], [0.2, 0.3, 0.3, 0.1, 0.4, 0.2]):.3f}")
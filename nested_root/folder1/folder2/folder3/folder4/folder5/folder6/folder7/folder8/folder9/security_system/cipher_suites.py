@@ -0,0 +1,346 @@
+"""
+Cipher Suites
+- Named profiles for Level 4 key wrapping, data encryption and signatures
+- legacy: RSA-4096 OAEP key wrapping, Fernet (AES-128-CBC + HMAC) data, RSA-PSS signatures
+- modern: X25519 + HKDF-SHA256 key agreement, ChaCha20-Poly1305 data, Ed25519 signatures
+- nist: ECDH P-256 + HKDF-SHA256 key agreement, AES-256-GCM data, ECDSA P-256 signatures
+- Each package records its suite, so any configured suite can decrypt it
+- Benchmark matrix: keygen, wrap/unwrap, bulk encryption and signature throughput
+"""
+
+import base64
+import os
+import time
+from abc import ABC, abstractmethod
+from cryptography.exceptions import InvalidSignature, InvalidTag
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, padding, rsa, x25519
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM, ChaCha20Poly1305
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from typing import Callable, Dict, List, Optional, Tuple
+
+DEFAULT_CIPHER_SUITE = "legacy"
+
+NONCE_BYTES = 12
+_WRAP_INFO = b"echo-level4-key-wrap"
+_OAEP = padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()), algorithm=hashes.SHA256(), label=None)
+_PSS = padding.PSS(mgf=padding.MGF1(hashes.SHA256()), salt_length=padding.PSS.MAX_LENGTH)
+
+
+class CipherSuite(ABC):
+    """One profile: a key-wrapping scheme, a data cipher and a signature scheme.
+
+    Data ciphers are created once per data key (data_cipher) and reused for
+    every record; encrypt/decrypt work on raw bytes (no base64).
+    """
+
+    name = ""
+    suite_id = 0  # Stored in binary headers
+    description = ""
+
+    @abstractmethod
+    def generate_data_key(self) -> bytes:
+        ...
+
+    @abstractmethod
+    def generate_keypair(self) -> Tuple[object, object]:
+        """(private, public) key pair used to wrap data keys"""
+
+    def generate_signing_key(self) -> Optional[object]:
+        """A separate signing key, or None to sign with the wrapping private key"""
+        return None
+
+    @abstractmethod
+    def wrap_key(self, public_key, data_key: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def unwrap_key(self, private_key, wrapped: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def data_cipher(self, data_key: bytes):
+        ...
+
+    @abstractmethod
+    def encrypt(self, cipher, plaintext: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def decrypt(self, cipher, ciphertext: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def sign(self, signing_key, data: bytes) -> bytes:
+        ...
+
+    @abstractmethod
+    def verify(self, public_key, signature: bytes, data: bytes) -> bool:
+        ...
+
+
+class LegacySuite(CipherSuite):
+    name = "legacy"
+    suite_id = 1
+    description = "RSA-4096 OAEP + Fernet, RSA-PSS"
+
+    def generate_data_key(self) -> bytes:
+        return Fernet.generate_key()
+
+    def generate_keypair(self) -> Tuple[object, object]:
+        private_key = rsa.generate_private_key(public_exponent=65537, key_size=4096)
+        return private_key, private_key.public_key()
+
+    def wrap_key(self, public_key, data_key: bytes) -> bytes:
+        return public_key.encrypt(data_key, _OAEP)
+
+    def unwrap_key(self, private_key, wrapped: bytes) -> bytes:
+        return private_key.decrypt(wrapped, _OAEP)
+
+    def data_cipher(self, data_key: bytes) -> Fernet:
+        return Fernet(data_key)
+
+    def encrypt(self, cipher: Fernet, plaintext: bytes) -> bytes:
+        # Raw token bytes: the base64 text form is a third larger
+        return base64.urlsafe_b64decode(cipher.encrypt(plaintext))
+
+    def decrypt(self, cipher: Fernet, ciphertext: bytes) -> bytes:
+        return cipher.decrypt(base64.urlsafe_b64encode(ciphertext))
+
+    def sign(self, signing_key, data: bytes) -> bytes:
+        return signing_key.sign(data, _PSS, hashes.SHA256())
+
+    def verify(self, public_key, signature: bytes, data: bytes) -> bool:
+        try:
+            public_key.verify(signature, data, _PSS, hashes.SHA256())
+            return True
+        except InvalidSignature:
+            return False
+
+
+class _AgreementSuite(CipherSuite):
+    """Ephemeral-static key agreement + HKDF wraps a random data key with an AEAD"""
+
+    aead = None  # AEAD class for both wrapping and data
+
+    @abstractmethod
+    def _agree(self, private_key, public_key):
+        """Shared secret of a private key and a peer's public key"""
+
+    @abstractmethod
+    def _encode_public(self, public_key) -> bytes:
+        """Fixed-length wire encoding of a public key"""
+
+    @abstractmethod
+    def _decode_public(self, data: bytes):
+        ...
+
+    @abstractmethod
+    def _public_length(self) -> int:
+        ...
+
+    def _wrapping_key(self, shared: bytes, ephemeral: bytes, recipient: bytes) -> bytes:
+        # Both public keys go into the KDF so a wrapped key is bound to its recipient
+        return HKDF(algorithm=hashes.SHA256(), length=32, salt=None,
+                    info=_WRAP_INFO + ephemeral + recipient).derive(shared)
+
+    def generate_data_key(self) -> bytes:
+        return os.urandom(32)
+
+    def wrap_key(self, public_key, data_key: bytes) -> bytes:
+        ephemeral_private, ephemeral_public = self.generate_keypair()
+        ephemeral = self._encode_public(ephemeral_public)
+        kek = self._wrapping_key(self._agree(ephemeral_private, public_key), ephemeral,
+                                 self._encode_public(public_key))
+        nonce = os.urandom(NONCE_BYTES)
+        return ephemeral + nonce + self.aead(kek).encrypt(nonce, data_key, None)
+
+    def unwrap_key(self, private_key, wrapped: bytes) -> bytes:
+        length = self._public_length()
+        ephemeral = wrapped[:length]
+        nonce = wrapped[length:length + NONCE_BYTES]
+        kek = self._wrapping_key(self._agree(private_key, self._decode_public(ephemeral)), ephemeral,
+                                 self._encode_public(private_key.public_key()))
+        try:
+            return self.aead(kek).decrypt(nonce, wrapped[length + NONCE_BYTES:], None)
+        except InvalidTag:
+            raise ValueError("Wrapped key does not belong to this key pair") from None
+
+    def data_cipher(self, data_key: bytes):
+        return self.aead(data_key)
+
+    def encrypt(self, cipher, plaintext: bytes) -> bytes:
+        nonce = os.urandom(NONCE_BYTES)
+        return nonce + cipher.encrypt(nonce, plaintext, None)
+
+    def decrypt(self, cipher, ciphertext: bytes) -> bytes:
+        try:
+            return cipher.decrypt(ciphertext[:NONCE_BYTES], ciphertext[NONCE_BYTES:], None)
+        except InvalidTag:
+            raise ValueError("Ciphertext failed authentication") from None
+
+
+class ModernSuite(_AgreementSuite):
+    name = "modern"
+    suite_id = 2
+    description = "X25519 + HKDF + ChaCha20-Poly1305, Ed25519"
+    aead = ChaCha20Poly1305
+
+    def generate_keypair(self) -> Tuple[object, object]:
+        private_key = x25519.X25519PrivateKey.generate()
+        return private_key, private_key.public_key()
+
+    def generate_signing_key(self) -> ed25519.Ed25519PrivateKey:
+        return ed25519.Ed25519PrivateKey.generate()
+
+    def _agree(self, private_key, public_key) -> bytes:
+        return private_key.exchange(public_key)
+
+    def _encode_public(self, public_key) -> bytes:
+        return public_key.public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+
+    def _decode_public(self, data: bytes) -> x25519.X25519PublicKey:
+        return x25519.X25519PublicKey.from_public_bytes(data)
+
+    def _public_length(self) -> int:
+        return 32
+
+    def sign(self, signing_key, data: bytes) -> bytes:
+        return signing_key.sign(data)
+
+    def verify(self, public_key, signature: bytes, data: bytes) -> bool:
+        try:
+            public_key.verify(signature, data)
+            return True
+        except InvalidSignature:
+            return False
+
+
+class NistSuite(_AgreementSuite):
+    name = "nist"
+    suite_id = 3
+    description = "ECDH P-256 + HKDF + AES-256-GCM, ECDSA P-256"
+    aead = AESGCM
+
+    def generate_keypair(self) -> Tuple[object, object]:
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        return private_key, private_key.public_key()
+
+    def generate_signing_key(self) -> ec.EllipticCurvePrivateKey:
+        # Separate from the key-agreement key: one key, one purpose
+        return ec.generate_private_key(ec.SECP256R1())
+
+    def _agree(self, private_key, public_key) -> bytes:
+        return private_key.exchange(ec.ECDH(), public_key)
+
+    def _encode_public(self, public_key) -> bytes:
+        return public_key.public_bytes(serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint)
+
+    def _decode_public(self, data: bytes) -> ec.EllipticCurvePublicKey:
+        return ec.EllipticCurvePublicKey.from_encoded_point(ec.SECP256R1(), data)
+
+    def _public_length(self) -> int:
+        return 65
+
+    def sign(self, signing_key, data: bytes) -> bytes:
+        return signing_key.sign(data, ec.ECDSA(hashes.SHA256()))
+
+    def verify(self, public_key, signature: bytes, data: bytes) -> bool:
+        try:
+            public_key.verify(signature, data, ec.ECDSA(hashes.SHA256()))
+            return True
+        except InvalidSignature:
+            return False
+
+
+CIPHER_SUITES = {suite.name: suite for suite in (LegacySuite(), ModernSuite(), NistSuite())}
+_SUITES_BY_ID = {suite.suite_id: suite for suite in CIPHER_SUITES.values()}
+
+
+def get_cipher_suite(name: str) -> CipherSuite:
+    suite = CIPHER_SUITES.get(name)
+    if suite is None:
+        raise ValueError(f"Unknown cipher suite: {name} (choose from {', '.join(CIPHER_SUITES)})")
+    return suite
+
+
+def cipher_suite_by_id(suite_id: int) -> CipherSuite:
+    suite = _SUITES_BY_ID.get(suite_id)
+    if suite is None:
+        raise ValueError(f"Unknown cipher suite id: {suite_id}")
+    return suite
+
+
+def _rate(operation: Callable[[], object], min_seconds: float = 0.3, max_calls: int = 100000) -> float:
+    """Calls per second, timed over at least min_seconds (or max_calls calls)"""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        operation()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds or calls >= max_calls:
+            return calls / elapsed
+
+
+def benchmark_matrix(suites: Optional[List[str]] = None, record_size: int = 64,
+                     records: int = 20000, chunk_size: int = 65536) -> Dict[str, Dict[str, float]]:
+    """Throughput of every operation for each suite (operations or MB per second)"""
+    matrix = {}
+    for name in suites or list(CIPHER_SUITES):
+        suite = get_cipher_suite(name)
+        private_key, public_key = suite.generate_keypair()
+        signing_key = suite.generate_signing_key() or private_key
+        verify_key = signing_key.public_key()
+        data_key = suite.generate_data_key()
+        wrapped = suite.wrap_key(public_key, data_key)
+        cipher = suite.data_cipher(data_key)
+        message = os.urandom(record_size)
+        signature = suite.sign(signing_key, message)
+
+        batch = [os.urandom(record_size) for _ in range(records)]
+        start = time.perf_counter()
+        sealed = [suite.encrypt(cipher, record) for record in batch]
+        encrypt_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        opened = [suite.decrypt(cipher, record) for record in sealed]
+        decrypt_seconds = time.perf_counter() - start
+        assert opened == batch
+
+        chunk = os.urandom(chunk_size)
+        matrix[name] = {
+            "keygen_per_second": _rate(suite.generate_keypair, max_calls=2000),
+            "wrap_per_second": _rate(lambda: suite.wrap_key(public_key, data_key)),
+            "unwrap_per_second": _rate(lambda: suite.unwrap_key(private_key, wrapped)),
+            "records_encrypted_per_second": records / encrypt_seconds,
+            "records_decrypted_per_second": records / decrypt_seconds,
+            "bulk_encrypt_mb_per_second": _rate(lambda: suite.encrypt(cipher, chunk)) * chunk_size / 1e6,
+            "sign_per_second": _rate(lambda: suite.sign(signing_key, message)),
+            "verify_per_second": _rate(lambda: suite.verify(verify_key, signature, message)),
+            "wrapped_key_bytes": len(wrapped),
+            "record_overhead_bytes": len(sealed[0]) - record_size
+        }
+    return matrix
+
+
+if __name__ == "__main__":
+    print("Cipher Suite Benchmark Matrix")
+    matrix = benchmark_matrix()
+    columns = [
+        ("keygen_per_second", "keygen/s"), ("wrap_per_second", "wrap/s"), ("unwrap_per_second", "unwrap/s"),
+        ("records_encrypted_per_second", "enc rec/s"), ("records_decrypted_per_second", "dec rec/s"),
+        ("bulk_encrypt_mb_per_second", "bulk MB/s"), ("sign_per_second", "sign/s"),
+        ("verify_per_second", "verify/s"), ("wrapped_key_bytes", "wrap B"), ("record_overhead_bytes", "rec +B")
+    ]
+    print(f"{'suite':<8}" + "".join(f"{label:>11}" for _, label in columns))
+    for name, row in matrix.items():
+        print(f"{name:<8}" + "".join(f"{row[key]:>11,.0f}" for key, _ in columns))
+    for name, suite in CIPHER_SUITES.items():
+        print(f"- {name}: {suite.description}")
+    baseline = matrix["legacy"]
+    for name in ("modern", "nist"):
+        print(f"{name} vs legacy: keygen {matrix[name]['keygen_per_second'] / baseline['keygen_per_second']:,.0f}x, "
+              f"unwrap {matrix[name]['unwrap_per_second'] / baseline['unwrap_per_second']:,.1f}x, "
+              f"record encryption "
+              f"{matrix[name]['records_encrypted_per_second'] / baseline['records_encrypted_per_second']:.1f}x")
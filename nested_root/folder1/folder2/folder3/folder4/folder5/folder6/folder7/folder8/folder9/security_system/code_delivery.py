@@ -0,0 +1,310 @@
+"""
+Verification Code Delivery
+- Bounded outbound queue: the authentication path only pays for an enqueue
+- Background dispatcher coalesces sends into batches (by size or linger time)
+- Retries with exponential backoff and jitter; dead letters after the last attempt
+- Pluggable transports: console, JSON-lines file, UDP socket, simulated gateway
+- Queue depth, delivery lag and batch sizes in the metrics registry
+"""
+
+import heapq
+import json
+import queue
+import random
+import socket
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from metrics_registry import MetricsRegistry
+
+
+@dataclass
+class Delivery:
+    """One outbound message; times are on the monotonic clock"""
+    username: str
+    message: str
+    channel: str
+    enqueued_at: float
+    attempts: int = 0
+
+
+class DeliveryTransport(ABC):
+    """Sends a batch; returns one success flag per delivery (raising fails the whole batch)"""
+
+    @abstractmethod
+    def send_batch(self, deliveries: List[Delivery]) -> List[bool]:
+        ...
+
+    def close(self):
+        pass
+
+
+class ConsoleTransport(DeliveryTransport):
+    """The original behavior: print each code"""
+
+    def send_batch(self, deliveries: List[Delivery]) -> List[bool]:
+        for delivery in deliveries:
+            print(f"Verification code sent to {delivery.username}: {delivery.message}")
+        return [True] * len(deliveries)
+
+
+class FileTransport(DeliveryTransport):
+    """Append each batch to a JSON-lines file (a local stand-in for a gateway)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "a", encoding="utf-8")
+
+    def send_batch(self, deliveries: List[Delivery]) -> List[bool]:
+        self._file.write("".join(
+            json.dumps({"user": d.username, "channel": d.channel, "message": d.message}) + "\n"
+            for d in deliveries
+        ))
+        self._file.flush()
+        return [True] * len(deliveries)
+
+    def close(self):
+        self._file.close()
+
+
+class SocketTransport(DeliveryTransport):
+    """Send each batch as one UDP datagram of JSON lines (e.g. to a local test listener)"""
+
+    def __init__(self, address: Tuple[str, int]):
+        self.address = address
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def send_batch(self, deliveries: List[Delivery]) -> List[bool]:
+        payload = "".join(
+            json.dumps({"user": d.username, "channel": d.channel, "message": d.message}) + "\n"
+            for d in deliveries
+        ).encode()
+        self._socket.sendto(payload, self.address)
+        return [True] * len(deliveries)
+
+    def close(self):
+        self._socket.close()
+
+
+class SimulatedGateway(DeliveryTransport):
+    """A gateway with per-call latency, per-message cost and random per-message failures"""
+
+    def __init__(self, call_latency: float = 0.05, per_message: float = 0.0005,
+                 failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.call_latency = call_latency
+        self.per_message = per_message
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.delivered = []
+        self.calls = 0
+
+    def send_batch(self, deliveries: List[Delivery]) -> List[bool]:
+        self.calls += 1
+        time.sleep(self.call_latency + self.per_message * len(deliveries))
+        results = [self._rng.random() >= self.failure_rate for _ in deliveries]
+        self.delivered.extend(d for d, ok in zip(deliveries, results) if ok)
+        return results
+
+
+class DeliveryQueue:
+    def __init__(self, transport: DeliveryTransport, max_queue: int = 10000, batch_size: int = 100,
+                 linger: float = 0.005, max_attempts: int = 5, initial_backoff: float = 0.1,
+                 max_backoff: float = 10.0, registry: Optional[MetricsRegistry] = None):
+        self.transport = transport
+        self.batch_size = batch_size
+        self.linger = linger  # Seconds to wait for a batch to fill once its first message arrives
+        self.max_attempts = max_attempts
+        self.initial_backoff = initial_backoff
+        self.max_backoff = max_backoff
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._retries = []  # Min-heap of (due, sequence, Delivery); dispatcher thread only
+        self._sequence = 0
+        self._rng = random.Random()  # Jitter only; never the injectable authentication RNG
+        self._pending = 0  # Enqueued and not yet delivered or dead-lettered
+        self._pending_lock = threading.Condition()
+        self._dispatcher = None
+        self._running = False
+        self.dead_letters = deque(maxlen=1000)
+
+        registry = registry or MetricsRegistry()
+        self._enqueued = registry.counter("code_delivery_enqueued", "Verification codes queued")
+        self._delivered = registry.counter("code_delivery_delivered", "Verification codes delivered")
+        self._dropped = registry.counter("code_delivery_dropped", "Codes rejected because the queue was full")
+        self._retried = registry.counter("code_delivery_retries", "Delivery attempts that will be retried")
+        self._dead = registry.counter("code_delivery_dead_letters", "Codes abandoned after the last attempt")
+        self._lag = registry.summary("code_delivery_lag_seconds", "Enqueue to successful delivery")
+        self._batch = registry.summary("code_delivery_batch_size", "Messages per transport call")
+        self._depth = registry.gauge("code_delivery_queue_depth", "Codes waiting, including retries")
+        self._depth.set_function(lambda: self._pending)
+        self._max_lag = 0.0
+
+    def enqueue(self, username: str, message: str, channel: str = "sms") -> bool:
+        """Queue a message without blocking; False if the queue is full"""
+        delivery = Delivery(username, message, channel, time.monotonic())
+        with self._pending_lock:
+            self._pending += 1
+        try:
+            self._queue.put_nowait(delivery)
+        except queue.Full:
+            self._finish(1)
+            self._dropped.inc()
+            return False
+        self._enqueued.inc()
+        return True
+
+    def _finish(self, count: int):
+        with self._pending_lock:
+            self._pending -= count
+            if self._pending == 0:
+                self._pending_lock.notify_all()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until every queued message is delivered or dead-lettered"""
+        with self._pending_lock:
+            return self._pending_lock.wait_for(lambda: self._pending == 0, timeout)
+
+    def _next_batch(self) -> List[Delivery]:
+        """Due retries plus new messages, waiting up to `linger` for the batch to fill"""
+        now = time.monotonic()
+        batch = []
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            batch.append(heapq.heappop(self._retries)[2])
+
+        if not batch:
+            # Block until a message arrives or the next retry is due (or 0.1 s, to notice stop)
+            timeout = min(0.1, max(0.0, self._retries[0][0] - now)) if self._retries else 0.1
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                return batch
+        deadline = time.monotonic() + self.linger
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+        return batch
+
+    def _send(self, batch: List[Delivery]):
+        """Deliver one batch; failed messages are rescheduled with backoff or dead-lettered"""
+        for delivery in batch:
+            delivery.attempts += 1
+        try:
+            results = self.transport.send_batch(batch)
+        except Exception:
+            results = [False] * len(batch)
+        self._batch.observe(len(batch))
+
+        now = time.monotonic()
+        finished = 0
+        for delivery, ok in zip(batch, results):
+            if ok:
+                lag = now - delivery.enqueued_at
+                self._lag.observe(lag)
+                self._max_lag = max(self._max_lag, lag)
+                self._delivered.inc()
+                finished += 1
+            elif delivery.attempts >= self.max_attempts:
+                self.dead_letters.append(delivery)
+                self._dead.inc()
+                finished += 1
+            else:
+                # Full jitter keeps retries of one failed batch from arriving together
+                backoff = min(self.max_backoff, self.initial_backoff * 2 ** (delivery.attempts - 1))
+                self._sequence += 1
+                heapq.heappush(self._retries, (now + backoff * (0.5 + self._rng.random() / 2),
+                                               self._sequence, delivery))
+                self._retried.inc()
+        if finished:
+            self._finish(finished)
+
+    def _dispatch_loop(self):
+        while self._running or not self._queue.empty():
+            batch = self._next_batch()
+            if batch:
+                self._send(batch)
+
+    def start(self):
+        """Start the dispatcher thread"""
+        if self._running:
+            return
+        self._running = True
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="code-delivery", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self, drain_timeout: Optional[float] = 5.0):
+        """Stop the dispatcher after it drains the queue (retries still waiting are abandoned)"""
+        if self._dispatcher is None:
+            return
+        self.flush(drain_timeout)
+        self._running = False
+        self._dispatcher.join()
+        self._dispatcher = None
+
+    def get_metrics(self) -> Dict[str, float]:
+        return {
+            "queue_depth": self._pending,
+            "waiting_retries": len(self._retries),
+            "enqueued": self._enqueued.value,
+            "delivered": self._delivered.value,
+            "dropped": self._dropped.value,
+            "retries": self._retried.value,
+            "dead_letters": self._dead.value,
+            "average_lag_seconds": self._lag.average,
+            "max_lag_seconds": self._max_lag,
+            "average_batch_size": self._batch.average
+        }
+
+
+if __name__ == "__main__":
+    import statistics
+
+    print("Verification Code Delivery")
+    codes = 2000
+
+    # Inline delivery: every login waits for a gateway call
+    gateway = SimulatedGateway(call_latency=0.002, per_message=0.0001, seed=1)
+    latencies = []
+    for i in range(200):
+        start = time.perf_counter()
+        gateway.send_batch([Delivery(f"user{i}", f"{i:06d}", "sms", time.monotonic())])
+        latencies.append(time.perf_counter() - start)
+    print(f"Inline send: p50 {statistics.median(latencies) * 1e6:,.0f} µs per login "
+          f"({gateway.calls} gateway calls for 200 codes)")
+
+    # Queued delivery against a flaky gateway: logins only enqueue
+    gateway = SimulatedGateway(call_latency=0.002, per_message=0.0001, failure_rate=0.05, seed=1)
+    delivery = DeliveryQueue(gateway, batch_size=100, linger=0.005, initial_backoff=0.01)
+    delivery.start()
+    latencies = []
+    for i in range(codes):
+        start = time.perf_counter()
+        delivery.enqueue(f"user{i}", f"{i:06d}")
+        latencies.append(time.perf_counter() - start)
+    delivery.flush(30)
+    delivery.stop()
+    metrics = delivery.get_metrics()
+    print(f"Queued send: p50 {statistics.median(latencies) * 1e6:.1f} µs, "
+          f"p99 {statistics.quantiles(latencies, n=100)[98] * 1e6:.1f} µs per login")
+    print(f"{int(metrics['delivered'])}/{codes} delivered in {gateway.calls} gateway calls "
+          f"(average batch {metrics['average_batch_size']:.1f}), {int(metrics['retries'])} retries, "
+          f"{int(metrics['dead_letters'])} dead letters; "
+          f"lag average {metrics['average_lag_seconds'] * 1000:.1f} ms, max {metrics['max_lag_seconds'] * 1000:.1f} ms")
+
+    # Overload: a tiny queue in front of a stalled gateway rejects instead of blocking logins
+    stalled = DeliveryQueue(SimulatedGateway(call_latency=0.2), max_queue=50, batch_size=10)
+    stalled.start()
+    accepted = sum(stalled.enqueue(f"user{i}", "000000") for i in range(500))
+    print(f"Stalled gateway: {accepted}/500 accepted, {int(stalled.get_metrics()['dropped'])} rejected "
+          f"without blocking; queue depth {stalled.get_metrics()['queue_depth']}")
+    stalled.stop(drain_timeout=0)
@@ -0,0 +1,202 @@
+"""
+Concurrency Support
+- Striped per-user locks (bounded lock count, no global lock)
+- Thread-local numpy.random.Generator objects (no global RNG state)
+- Per-request deadlines (budget checks and lock waits bounded by the budget)
+- Stress test for concurrent authentication; exits non-zero if an invariant breaks
+"""
+
+import contextlib
+import hashlib
+import os
+import sys
+import threading
+import time
+import numpy as np
+from typing import Callable, Hashable, List, Optional
+
+_thread_state = threading.local()
+
+
+class StripedLock:
+    """A fixed pool of locks; each key always maps to the same stripe"""
+
+    def __init__(self, stripes: int = 64):
+        self._locks = [threading.Lock() for _ in range(stripes)]
+
+    def for_key(self, key: Hashable) -> threading.Lock:
+        return self._locks[hash(key) % len(self._locks)]
+
+
+class DeadlineExceeded(Exception):
+    """A request's time budget ran out; `stage` names where it was noticed"""
+
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded in {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """A per-request time budget on a monotonic clock (never the injectable wall clock)"""
+
+    def __init__(self, seconds: float, clock: Callable[[], float] = time.perf_counter):
+        self.clock = clock
+        self.budget = seconds
+        self.expires_at = clock() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - self.clock())
+
+    def expired(self) -> bool:
+        return self.clock() >= self.expires_at
+
+    def check(self, stage: str):
+        """Raise DeadlineExceeded if the budget is spent"""
+        if self.clock() >= self.expires_at:
+            raise DeadlineExceeded(stage)
+
+    @contextlib.contextmanager
+    def hold(self, lock: threading.Lock, stage: str):
+        """Acquire a lock, waiting at most the remaining budget"""
+        if not lock.acquire(timeout=self.remaining()):
+            raise DeadlineExceeded(stage)
+        try:
+            yield
+        finally:
+            lock.release()
+
+
+def locked(lock: threading.Lock, deadline: Optional[Deadline], stage: str):
+    """The lock itself, or a deadline-bounded hold on it"""
+    return lock if deadline is None else deadline.hold(lock, stage)
+
+
+def thread_rng() -> np.random.Generator:
+    """Return the calling thread's private NumPy generator"""
+    rng = getattr(_thread_state, "rng", None)
+    if rng is None:
+        rng = np.random.default_rng()
+        _thread_state.rng = rng
+    return rng
+
+
+def _run_in_threads(thread_count: int, target, *args) -> float:
+    """Run target(*args) once in each of thread_count threads; returns wall time"""
+    threads = [threading.Thread(target=target, args=args) for _ in range(thread_count)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def run_stress_test(thread_count: int = 8, iterations: int = 50) -> List[str]:
+    """Hammer the security system from many threads; returns the invariants that broke"""
+    import io
+    from ai_security_automation import AIAutomatedSecurity
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = AIAutomatedSecurity()
+    violations = []
+
+    def check(holds: bool, invariant: str):
+        if not holds:
+            violations.append(invariant)
+            print(f"INVARIANT VIOLATED: {invariant}")
+
+    # 1. Concurrent full authentications: every attempt must be counted
+    def authenticate():
+        for i in range(iterations):
+            username = "admin" if i % 2 else "user"
+            password = "secure_password_123" if username == "admin" else "user_password_456"
+            system.authenticate_user(username, password)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        elapsed = _run_in_threads(thread_count, authenticate)
+        system.level2.delivery.flush(1.0)
+    metrics = system.security_metrics
+    expected = thread_count * iterations
+    print(f"Authentications: {metrics['total_attempts']}/{expected} counted, "
+          f"{metrics['successful_auths'] + metrics['blocked_attempts']} outcomes "
+          f"in {elapsed:.2f}s")
+    check(metrics["total_attempts"] == expected, "every authentication attempt is counted")
+    check(metrics["successful_auths"] + metrics["blocked_attempts"] == expected,
+          "every attempt has exactly one outcome")
+
+    # 2. Backup codes: each code must be consumed exactly once
+    system.level2.backup_codes["admin"] = [f"{i:06d}" for i in range(1000)]
+    consumed = []
+
+    def consume_backup_codes():
+        for i in range(1000):
+            if system.level2.verify_backup_code("admin", f"{i:06d}"):
+                consumed.append(i)
+
+    _run_in_threads(thread_count, consume_backup_codes)
+    print(f"Backup codes consumed: {len(consumed)} (expected 1000, duplicates: {len(consumed) - len(set(consumed))})")
+    check(sorted(consumed) == list(range(1000)), "each backup code is redeemed exactly once")
+
+    # 3. SMS attempts: a code must never accept more than 3 wrong guesses
+    wrong_guess = "000000"
+    for guessers in (3, thread_count):
+        with contextlib.redirect_stdout(io.StringIO()):
+            code = system.level2.send_verification_code("user")
+            system.level2.delivery.flush(1.0)
+        if code == wrong_guess:
+            wrong_guess = "000001"
+        wrong_guesses = []
+
+        def guess_sms_code():
+            wrong_guesses.append(system.level2.verify_sms_code("user", wrong_guess))
+
+        _run_in_threads(guessers, guess_sms_code)
+        # A lost attempt increment would leave room for a 4th guess: the right code must now fail
+        revoked = not system.level2.verify_sms_code("user", code)
+        print(f"Code revoked after {guessers} concurrent wrong guesses: {revoked}")
+        check(not any(wrong_guesses), "a wrong SMS code is never accepted")
+        check(revoked, "an SMS code allows at most 3 wrong guesses")
+
+    # 4. Scaling of GIL-releasing work (ideal speedup is bounded by available cores)
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+    ideal = min(thread_count, cores or 1)
+    payload = b"x" * (8 * 1024 * 1024)
+    matrix = np.random.default_rng(0).random((300, 300))
+    private_key, public_key = system.level4.asymmetric_keys["admin"]
+    wrapped = system.level4.encrypt_data("admin", "scaling probe")["encrypted_key"]
+
+    def sha256_work():
+        for _ in range(4):
+            hashlib.sha256(payload).digest()
+
+    def numpy_work():
+        for _ in range(20):
+            matrix @ matrix
+
+    def rsa_work():
+        import base64
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.asymmetric import padding
+        for _ in range(10):
+            private_key.decrypt(
+                base64.b64decode(wrapped),
+                padding.OAEP(mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                             algorithm=hashes.SHA256(), label=None)
+            )
+
+    for name, work in [("SHA-256", sha256_work), ("NumPy matmul", numpy_work), ("RSA decrypt", rsa_work)]:
+        single = _run_in_threads(1, work)
+        parallel = _run_in_threads(thread_count, work)
+        speedup = single * thread_count / parallel
+        print(f"{name}: {speedup:.1f}x throughput with {thread_count} threads on {cores} cores "
+              f"({speedup / ideal:.0%} of linear)")
+
+    system.close()
+    return violations
+
+
+if __name__ == "__main__":
+    print("Concurrency stress test")
+    violations = run_stress_test()
+    print(f"Invariants: {'all held' if not violations else f'{len(violations)} violated'}")
+    sys.exit(1 if violations else 0)
@@ -0,0 +1,313 @@
+"""
+Security Event Bus
+- In-process publish/subscribe for auth, lockout, anomaly and key-rotation events
+- Publishing never blocks: each subscriber has a bounded buffer and a drop policy
+- Per-topic publish and per-subscriber drop counters in the metrics registry
+- Incrementally maintained report: subscribers get versioned diffs instead of polling
+"""
+
+import copy
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from metrics_registry import MetricsRegistry
+
+DROP_OLDEST = "drop_oldest"  # Keep the most recent events (a lagging dashboard sees the latest state)
+DROP_NEWEST = "drop_newest"  # Keep the earliest events (e.g. an audit consumer that must see a burst's start)
+
+
+@dataclass
+class Event:
+    topic: str
+    timestamp: float
+    data: Dict[str, any]
+
+
+class Subscription:
+    """A subscriber's bounded buffer; queue-like get/empty so it can replace a queue.Queue"""
+
+    def __init__(self, bus: "EventBus", name: str, topics: Optional[Iterable[str]], maxsize: int, policy: str):
+        if policy not in (DROP_OLDEST, DROP_NEWEST):
+            raise ValueError(f"Unknown drop policy: {policy}")
+        self.name = name
+        self.topics = frozenset(topics) if topics is not None else None  # None: every topic
+        self.maxsize = maxsize
+        self.policy = policy
+        self.dropped = 0
+        self._bus = bus
+        self._buffer = deque()
+        self._ready = threading.Condition(threading.Lock())
+        self._dropped_counter = bus._dropped.labels(name)
+
+    def _offer(self, event: Event):
+        """Called by publishers: append or drop, never wait"""
+        with self._ready:
+            if len(self._buffer) >= self.maxsize:
+                self.dropped += 1
+                self._dropped_counter.inc()
+                if self.policy == DROP_NEWEST:
+                    return
+                self._buffer.popleft()
+            self._buffer.append(event)
+            self._ready.notify()
+
+    def get(self, block: bool = True, timeout: Optional[float] = None) -> Optional[Event]:
+        """Next event, or None if none arrives in time"""
+        with self._ready:
+            if block and not self._buffer:
+                self._ready.wait_for(lambda: self._buffer, timeout)
+            return self._buffer.popleft() if self._buffer else None
+
+    def drain(self, timeout: Optional[float] = None) -> List[Event]:
+        """All buffered events, waiting up to `timeout` for the first one"""
+        with self._ready:
+            if not self._buffer and timeout:
+                self._ready.wait_for(lambda: self._buffer, timeout)
+            events = list(self._buffer)
+            self._buffer.clear()
+            return events
+
+    def empty(self) -> bool:
+        return not self._buffer
+
+    def qsize(self) -> int:
+        return len(self._buffer)
+
+    def close(self):
+        self._bus.unsubscribe(self)
+
+
+class EventBus:
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self._subscriptions = ()  # Replaced (not mutated) on subscribe, so publish needs no lock
+        self._lock = threading.Lock()
+        registry = registry or MetricsRegistry()
+        self._published = registry.counter("events_published", "Events published", ("topic",))
+        self._topic_counters = {}  # topic -> counter child, skipping the labels() lookup per publish
+        self._dropped = registry.counter("events_dropped", "Events dropped by full subscriber buffers",
+                                         ("subscriber",))
+
+    def subscribe(self, topics: Optional[Iterable[str]] = None, maxsize: int = 1024,
+                  policy: str = DROP_OLDEST, name: Optional[str] = None) -> Subscription:
+        """Subscribe to some topics (or all); the buffer holds at most `maxsize` events"""
+        with self._lock:
+            subscription = Subscription(self, name or f"subscriber{len(self._subscriptions)}",
+                                        topics, maxsize, policy)
+            self._subscriptions += (subscription,)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions = tuple(s for s in self._subscriptions if s is not subscription)
+
+    def publish(self, topic: str, timestamp: Optional[float] = None, **data) -> Event:
+        """Deliver an event to every matching subscriber without blocking"""
+        event = Event(topic, time.time() if timestamp is None else timestamp, data)
+        counter = self._topic_counters.get(topic)
+        if counter is None:
+            counter = self._topic_counters[topic] = self._published.labels(topic)
+        counter.inc()
+        for subscription in self._subscriptions:
+            if subscription.topics is None or topic in subscription.topics:
+                subscription._offer(event)
+        return event
+
+    def get_metrics(self) -> Dict[str, any]:
+        return {
+            "published": {topic: child.value for (topic,), child in self._published.children()},
+            "subscribers": {s.name: {"buffered": s.qsize(), "dropped": s.dropped, "policy": s.policy}
+                            for s in self._subscriptions}
+        }
+
+
+def apply_diff(report: Dict[str, Dict], diff: Dict[str, any]) -> Dict[str, Dict]:
+    """Apply a report diff (the data of a "report" event) to a local copy of the report"""
+    for section, changes in diff["changes"].items():
+        report.setdefault(section, {}).update(changes)
+    return report
+
+
+class IncrementalReport:
+    """Report sections kept up to date from bus events; changes go out as "report" diffs.
+
+    Each diff carries its version and the version it applies to ("base"). A
+    subscriber whose base doesn't match its copy missed a diff (e.g. dropped
+    from a full buffer) and resyncs from `snapshot()`.
+    """
+
+    TOPICS = ("auth", "lockout", "anomaly", "key_rotation")
+
+    def __init__(self, bus: EventBus, interval: float = 0.5, buffer: int = 65536):
+        self.bus = bus
+        self.interval = interval  # Seconds between diffs
+        self.version = 0
+        self.sections = {
+            "security_metrics": {"total_attempts": 0, "successful_auths": 0, "blocked_attempts": 0,
+                                 "session_resumes": 0, "deadline_exceeded": 0},
+            "blocked_by_level": {},
+            "lockouts": {},  # username -> lockout time
+            "anomalies": {},  # username -> anomaly count
+            "key_rotations": {},  # kind -> rotations
+            "stream": {"events_applied": 0, "events_dropped": 0}
+        }
+        self._changed = {}  # section -> keys changed since the last diff
+        self._lock = threading.Lock()
+        self._subscription = bus.subscribe(self.TOPICS, maxsize=buffer, name="incremental_report")
+        self._thread = None
+        self._running = False
+
+    def _set(self, section: str, key: str, value):
+        self.sections[section][key] = value
+        self._changed.setdefault(section, set()).add(key)
+
+    def _add(self, section: str, key: str, amount: int = 1):
+        self._set(section, key, self.sections[section].get(key, 0) + amount)
+
+    def apply(self, event: Event):
+        """Fold one event into the report (lock held)"""
+        data = event.data
+        if event.topic == "auth":
+            self._add("security_metrics", "total_attempts")
+            if data["authenticated"]:
+                self._add("security_metrics", "successful_auths")
+                if data.get("session_resumed"):
+                    self._add("security_metrics", "session_resumes")
+            elif data["reason"] == "Deadline exceeded":
+                self._add("security_metrics", "deadline_exceeded")
+            else:
+                self._add("security_metrics", "blocked_attempts")
+                self._add("blocked_by_level", f"level_{data['failed_level']}")
+        elif event.topic == "lockout":
+            self._set("lockouts", data["user"], event.timestamp)
+        elif event.topic == "anomaly":
+            self._add("anomalies", data["user"])
+        elif event.topic == "key_rotation":
+            self._add("key_rotations", data["kind"])
+        self._add("stream", "events_applied")
+
+    def update(self, timeout: Optional[float] = None) -> Optional[Dict[str, any]]:
+        """Apply buffered events and publish a diff if anything changed; returns the diff"""
+        events = self._subscription.drain(timeout)
+        with self._lock:
+            for event in events:
+                self.apply(event)
+            if self._subscription.dropped != self.sections["stream"]["events_dropped"]:
+                self._set("stream", "events_dropped", self._subscription.dropped)
+            if not self._changed:
+                return None
+            changes = {section: {key: self.sections[section][key] for key in keys}
+                       for section, keys in self._changed.items()}
+            self._changed = {}
+            self.version += 1
+            diff = {"version": self.version, "base": self.version - 1, "changes": changes}
+            # Published under the lock so subscribe() can't fall between a version and its diff
+            self.bus.publish("report", **diff)
+        return diff
+
+    def snapshot(self) -> Tuple[int, Dict[str, Dict]]:
+        """The current version and a copy of every section"""
+        with self._lock:
+            return self.version, copy.deepcopy(self.sections)
+
+    def subscribe(self, maxsize: int = 64, policy: str = DROP_OLDEST,
+                  name: Optional[str] = None) -> Tuple[int, Dict[str, Dict], Subscription]:
+        """A starting version and copy of the report plus a subscription to the diffs after it"""
+        with self._lock:
+            subscription = self.bus.subscribe(("report",), maxsize, policy, name)
+            return self.version, copy.deepcopy(self.sections), subscription
+
+    def _loop(self):
+        next_diff = time.monotonic() + self.interval
+        while self._running:
+            time.sleep(max(0.0, next_diff - time.monotonic()))
+            next_diff += self.interval
+            self.update()
+
+    def start(self):
+        """Publish diffs every `interval` seconds from a background thread"""
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name="incremental-report", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._running = False
+        self._thread.join()
+        self._thread = None
+
+
+if __name__ == "__main__":
+    import contextlib
+    import io
+    import json
+    from ai_security_automation import AIAutomatedSecurity
+
+    print("Security Event Bus")
+    bus = EventBus()
+    fast = bus.subscribe(maxsize=8, policy=DROP_OLDEST, name="dashboard")
+    audit = bus.subscribe(("lockout",), maxsize=8, policy=DROP_NEWEST, name="audit")
+    for i in range(20):
+        bus.publish("lockout", user=f"user{i}")
+    print(f"20 lockouts into 8-event buffers: dashboard (drop_oldest) kept "
+          f"{[e.data['user'] for e in fast.drain()][:2]}..., audit (drop_newest) kept "
+          f"{[e.data['user'] for e in audit.drain()][:2]}...; drops {bus.get_metrics()['subscribers']['audit']['dropped']}")
+
+    idle = EventBus()
+    start = time.perf_counter()
+    for _ in range(100000):
+        idle.publish("auth", user="admin")
+    idle_ns = (time.perf_counter() - start) / 100000 * 1e9
+    for i in range(3):
+        idle.subscribe(maxsize=100000, name=f"s{i}")
+    start = time.perf_counter()
+    for _ in range(100000):
+        idle.publish("auth", user="admin")
+    print(f"Publish cost: {idle_ns:.0f} ns with no subscribers, "
+          f"{(time.perf_counter() - start) / 100000 * 1e9:.0f} ns with 3")
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        system = AIAutomatedSecurity()
+    system.report_stream.stop()  # Diffs on demand below, one per interval of traffic
+    version, report, diffs = system.report_stream.subscribe(name="demo_dashboard")
+    diff_sizes = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for interval in range(10):
+            for i in range(20):
+                system.authenticate_user("user", "user_password_456", {
+                    "totp_token": system.level2.generate_totp(system.level2.totp_secrets["user"]),
+                    "neural_features": system.level5.neural_signature("user")
+                })
+                system.authenticate_user(f"leaked{interval * 4 + i % 4}", "hunter2", {"source_ip": "203.0.113.7"})
+            if interval == 5:
+                system.key_rotation.rotate_now(["admin", "user"], "symmetric")
+                time.sleep(0.2)
+            system.report_stream.update()
+        idle = system.report_stream.update()  # Nothing happened: no diff is sent
+
+    for event in diffs.drain():
+        if event.data["base"] != version:
+            version, report = system.report_stream.snapshot()  # Missed a diff: resync
+            continue
+        apply_diff(report, event.data)
+        version = event.data["version"]
+        diff_sizes.append(len(json.dumps(event.data)))
+    full_bytes = len(json.dumps(system.get_security_report(), default=str))
+    time.sleep(0.2)  # Let Level 5's monitoring loop drain its subscription
+    print(f"Report after 400 logins: {report['security_metrics']}")
+    blocked = {f"level_{key.split('=')[1]}": value
+               for key, value in system.metrics.snapshot()["echo_security_auth_blocked"].items() if value}
+    print(f"Matches the pipeline's own counters: "
+          f"{all(report['security_metrics'][k] == v for k, v in system.security_metrics.items() if k in report['security_metrics'])}; "
+          f"blocked by level {report['blocked_by_level']} (pipeline: {blocked})")
+    print(f"Lockouts: {len(report['lockouts'])}, key rotations: {report['key_rotations']}, "
+          f"Level 5 monitoring escalations: "
+          f"{sum(r.get('response') == 'MULTI_FACTOR_REAUTH_REQUIRED' for r in system.level5.adaptive_responses.values())}")
+    print(f"Version {version}: average diff {sum(diff_sizes) / len(diff_sizes):.0f} bytes per interval "
+          f"(idle interval: {'no diff' if idle is None else 'diff'}) vs {full_bytes} bytes per full report poll")
+    print(f"Bus: {system.events.get_metrics()}")
@@ -0,0 +1,204 @@
+"""
+Background Key Rotation
+- Min-heap of (due time, user, key kind) rotation entries
+- Keys regenerated in a worker pool, off the request path
+- Rate-limited dispatch so mass rotations never starve request threads
+- Versioned keys: the previous version decrypts during a grace window
+- Rotation counters and latency in the metrics registry
+"""
+
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+from level4_encryption import AdvancedEncryptionSecurity
+from metrics_registry import MetricsRegistry
+
+
+class KeyRotationScheduler:
+    def __init__(self, encryption: AdvancedEncryptionSecurity, workers: int = 2,
+                 max_rotations_per_second: float = 200.0, registry: Optional[MetricsRegistry] = None,
+                 clock: Callable[[], float] = time.time):
+        self.encryption = encryption
+        self.workers = workers
+        self.clock = clock
+        self.interval = 1.0 / max_rotations_per_second  # Spacing between dispatched rotations
+        self._heap = []  # May hold stale entries; they are skipped when popped
+        self._queued = {}  # (username, kind) -> due time of its live heap entry
+        self._wakeup = threading.Condition()
+        self._pool = None
+        self._dispatcher = None
+        self._running = False
+
+        registry = registry or MetricsRegistry()
+        self._rotations = registry.counter("key_rotations", "Completed key rotations", ("kind",))
+        self._failures = registry.counter("key_rotation_failures", "Failed key rotations", ("kind",))
+        self._rotation_time = registry.summary("key_rotation_seconds", "Key generation and publish time")
+        self._backlog = registry.gauge("key_rotation_backlog", "Rotations waiting in the heap")
+        self._backlog.set_function(lambda: len(self._queued))
+
+        self.sync()
+
+    def sync(self):
+        """Load every user's rotation times from the encryption layer into the heap"""
+        for due, username, kind in self.encryption.due_rotations():
+            self.schedule(username, kind, due)
+
+    def _push(self, username: str, kind: str, due: float) -> bool:
+        """Queue (user, kind) at `due` unless it is already queued as early (condition held).
+
+        An earlier due time supersedes the queued entry, which stays in the
+        heap as a stale entry until it is popped or compacted away.
+        """
+        queued = self._queued.get((username, kind))
+        if queued is not None and queued <= due:
+            return False
+        self._queued[(username, kind)] = due
+        heapq.heappush(self._heap, (due, username, kind))
+        if len(self._heap) > 2 * len(self._queued) + 64:
+            self._heap = [(due, username, kind) for (username, kind), due in self._queued.items()]
+            heapq.heapify(self._heap)
+        return True
+
+    def schedule(self, username: str, kind: str, due: float):
+        """Queue a rotation; an already queued (user, kind) keeps its earliest due time"""
+        with self._wakeup:
+            if self._push(username, kind, due):
+                self._wakeup.notify()
+
+    def rotate_now(self, usernames: List[str], kind: str):
+        """Make rotations due immediately, e.g. after a suspected key compromise"""
+        now = self.clock()
+        with self._wakeup:
+            for username in usernames:
+                self.encryption.key_rotation_schedule[username][kind] = now
+                self._push(username, kind, now)
+            self._wakeup.notify()
+
+    def _pop_due(self, now: float) -> List[tuple]:
+        """Remove and return all live entries due at `now` (condition held)"""
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            entry = heapq.heappop(self._heap)
+            key = entry[1:]
+            if self._queued.get(key) != entry[0]:
+                continue  # Superseded by an earlier rotate_now/schedule
+            del self._queued[key]
+            due.append(entry)
+        return due
+
+    def _rotate(self, username: str, kind: str):
+        """Worker task: rotate one key and queue its next rotation"""
+        start = time.perf_counter()
+        try:
+            self.encryption.rotate_key(username, kind)
+        except Exception:
+            self._failures.labels(kind).inc()
+            self.schedule(username, kind, self.clock() + 60)  # Retry in a minute
+            return
+        self._rotation_time.observe(time.perf_counter() - start)
+        self._rotations.labels(kind).inc()
+        self.schedule(username, kind, self.encryption.key_rotation_schedule[username][kind])
+
+    def run_pending(self) -> int:
+        """Rotate everything currently due in the calling thread; returns the count"""
+        with self._wakeup:
+            due = self._pop_due(self.clock())
+        for _, username, kind in due:
+            self._rotate(username, kind)
+        return len(due)
+
+    def _dispatch_loop(self):
+        """Sleep until the earliest entry is due, then hand due entries to the pool"""
+        while True:
+            with self._wakeup:
+                while self._running:
+                    now = self.clock()
+                    due = self._pop_due(now)
+                    if due:
+                        break
+                    timeout = self._heap[0][0] - now if self._heap else None
+                    self._wakeup.wait(timeout)
+                if not self._running:
+                    return
+            for _, username, kind in due:
+                self._pool.submit(self._rotate, username, kind)
+                time.sleep(self.interval)  # Spread bursts (e.g. mass rotate_now) over time
+
+    def start(self):
+        """Start the dispatcher thread and worker pool"""
+        if self._running:
+            return
+        self._running = True
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="key-rotation")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="key-rotation-dispatch", daemon=True)
+        self._dispatcher.start()
+
+    def stop(self, wait: bool = True):
+        """Stop dispatching; with wait=True, finish rotations already handed to workers"""
+        with self._wakeup:
+            self._running = False
+            self._wakeup.notify()
+        if self._dispatcher is not None:
+            self._dispatcher.join()
+            self._pool.shutdown(wait=wait)
+            self._dispatcher = None
+
+    def get_metrics(self) -> Dict[str, any]:
+        with self._wakeup:
+            next_due = min(self._queued.values(), default=None)
+            backlog = len(self._queued)
+        return {
+            "rotations": {kind: child.value for (kind,), child in self._rotations.children()},
+            "failures": {kind: child.value for (kind,), child in self._failures.children()},
+            "backlog": backlog,
+            "next_due_in_seconds": next_due - self.clock() if next_due is not None else None,
+            "avg_rotation_ms": self._rotation_time.average * 1000
+        }
+
+
+if __name__ == "__main__":
+    import statistics
+
+    print("Background Key Rotation Scheduler")
+    encryption = AdvancedEncryptionSecurity(grace_period=3600)
+    scheduler = KeyRotationScheduler(encryption, workers=2, max_rotations_per_second=1000)
+    scheduler.start()
+
+    # Provision many users by rotating only cheap key kinds on top of a shared RSA pair
+    users = [f"user{i}" for i in range(2000)]
+    template = encryption.current_keys["user"]
+    for username in users:
+        with encryption._user_locks.for_key(username):
+            encryption._publish_keys(username, template)
+            encryption.key_rotation_schedule[username] = {"symmetric": float("inf")}
+
+    package = encryption.encrypt_data("admin", "rotation probe")
+
+    def measure(samples: int = 300) -> List[float]:
+        latencies = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            encryption.decrypt_data("admin", encryption.encrypt_data("admin", "latency probe"))
+            latencies.append((time.perf_counter() - start) * 1000)
+        return latencies
+
+    def p99(latencies: List[float]) -> float:
+        return statistics.quantiles(latencies, n=100)[98]
+
+    idle = measure()
+    scheduler.rotate_now(users, "symmetric")
+    scheduler.rotate_now(["admin"], "quantum_resistant")
+    during = measure()
+    while scheduler.get_metrics()["rotations"].get("symmetric", 0) < len(users):
+        time.sleep(0.01)
+    scheduler.stop()
+
+    print(f"encrypt+decrypt p99 idle: {p99(idle):.2f} ms, "
+          f"while rotating {len(users)} users: {p99(during):.2f} ms")
+    print(f"Package from version {package['key_version']} decrypts after rotation: "
+          f"{encryption.decrypt_data('admin', package) == 'rotation probe'} "
+          f"(current version {encryption.current_keys['admin'].version})")
+    print(f"Metrics: {scheduler.get_metrics()}")
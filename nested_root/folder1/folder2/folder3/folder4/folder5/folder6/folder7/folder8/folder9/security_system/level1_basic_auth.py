@@ -7,48 +7,84 @@ Level 1: Basic Authentication Security
 
 import hashlib
 import time
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
+
+from concurrency import Deadline, StripedLock, locked
+from user_registry import UserRecord, UserRegistry
 
 class BasicAuthSecurity:
-    def __init__(self):
-        self.users = {
-            "admin": self._hash_password("secure_password_123"),
-            "user": self._hash_password("user_password_456")
-        }
-        self.failed_attempts = {}
+    def __init__(self, clock: Callable[[], float] = time.time, registry: Optional[UserRegistry] = None):
+        self.clock = clock  # Injectable for deterministic replay
+        self.registry = registry if registry is not None else UserRegistry()
+        # Username-keyed views over the shared per-user records
+        self.users = self.registry.view("password_hash")
+        self.failed_attempts = self.registry.view("failed_attempts")
+        self.users["admin"] = self._hash_password("secure_password_123")
+        self.users["user"] = self._hash_password("user_password_456")
         self.lockout_time = 300  # 5 minutes lockout
+        self._user_locks = StripedLock()
+        self.events = None  # Event bus for lockouts (set by the orchestrator)
         
     def _hash_password(self, password: str) -> str:
         """Hash password using SHA-256"""
         return hashlib.sha256(password.encode()).hexdigest()
     
-    def authenticate(self, username: str, password: str) -> bool:
-        """Authenticate user with rate limiting"""
-        current_time = time.time()
-        
-        # Check if user is locked out
-        if username in self.failed_attempts:
-            last_attempt, attempts = self.failed_attempts[username]
-            if attempts >= 3 and current_time - last_attempt < self.lockout_time:
-                print(f"User {username} is locked out for {self.lockout_time} seconds")
-                return False
-        
-        # Validate credentials
-        expected_hash = self.users.get(username)
-        if expected_hash and expected_hash == self._hash_password(password):
-            # Reset failed attempts on successful login
-            if username in self.failed_attempts:
-                del self.failed_attempts[username]
-            return True
+    def authenticate(self, username: str, password: str, record: Optional[UserRecord] = None,
+                     deadline: Optional[Deadline] = None) -> bool:
+        """Authenticate user with rate limiting (raises DeadlineExceeded once the budget is spent)"""
+        if deadline is not None:
+            deadline.check("level1")
+        # Hash outside the lock so concurrent logins only serialize on state updates
+        password_hash = self._hash_password(password)
+        if record is None:
+            record = self.registry.get(username)
         
-        # Record failed attempt
-        if username not in self.failed_attempts:
-            self.failed_attempts[username] = (current_time, 1)
-        else:
-            last_time, attempts = self.failed_attempts[username]
-            self.failed_attempts[username] = (current_time, attempts + 1)
-        
-        return False
+        with locked(self._user_locks.for_key(username), deadline, "level1"):
+            current_time = self.clock()
+            failed = record.failed_attempts if record is not None else None
+            
+            # Check if user is locked out
+            if failed is not None:
+                last_attempt, attempts = failed
+                if attempts >= 3 and current_time - last_attempt < self.lockout_time:
+                    print(f"User {username} is locked out for {self.lockout_time} seconds")
+                    return False
+            
+            # Validate credentials
+            expected_hash = record.password_hash if record is not None else None
+            if expected_hash and expected_hash == password_hash:
+                # Reset failed attempts on successful login
+                record.failed_attempts = None
+                return True
+            
+            # Record failed attempt
+            if record is None:
+                record = self.registry.record(username)
+            attempts = 1 if failed is None else failed[1] + 1
+            record.failed_attempts = (current_time, attempts)
+            # Past 3 failures every further failure (after the previous lockout expired) starts a new one
+            if attempts >= 3 and self.events is not None:
+                self.events.publish("lockout", current_time, user=username, until=current_time + self.lockout_time)
+            
+            return False
+    
+    def save_state(self, writer, prefix: str = "level1"):
+        """Add password hashes and lockout state to a snapshot"""
+        with_lists = {user: list(entry) for user, entry in self.failed_attempts.items()}
+        writer.add_secret(f"{prefix}.users", dict(self.users))
+        writer.add_json(f"{prefix}.state", {"failed_attempts": with_lists, "lockout_time": self.lockout_time})
+    
+    @classmethod
+    def load_state(cls, reader, prefix: str = "level1", registry: Optional[UserRegistry] = None) -> "BasicAuthSecurity":
+        """Rebuild Level 1 from a snapshot"""
+        auth = cls(registry=registry)
+        auth.users.clear()
+        auth.users.update(reader.secret(f"{prefix}.users"))
+        state = reader.json(f"{prefix}.state")
+        auth.failed_attempts.clear()
+        auth.failed_attempts.update({user: tuple(entry) for user, entry in state["failed_attempts"].items()})
+        auth.lockout_time = state["lockout_time"]
+        return auth
 
 if __name__ == "__main__":
     auth = BasicAuthSecurity()
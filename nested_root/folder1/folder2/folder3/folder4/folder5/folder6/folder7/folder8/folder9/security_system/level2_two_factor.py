@@ -3,86 +3,145 @@ Level 2: Two-Factor Authentication Security
 - SMS/Email verification
 - Time-based tokens (TOTP)
 - Backup codes
+- Codes are delivered asynchronously through a batched outbound queue
 """
 
 import hashlib
 import time
 import random
 from datetime import datetime, timedelta
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional
+
+from code_delivery import ConsoleTransport, DeliveryQueue
+from concurrency import Deadline, StripedLock, locked
+from user_registry import UserRecord, UserRegistry
 
 class TwoFactorSecurity:
-    def __init__(self):
-        self.totp_secrets = {
+    def __init__(self, clock: Callable[[], float] = time.time, rng: Optional[random.Random] = None,
+                 registry: Optional[UserRegistry] = None, delivery: Optional[DeliveryQueue] = None):
+        self.clock = clock  # Injectable for deterministic replay
+        self.rng = rng or random
+        self.registry = registry if registry is not None else UserRegistry()
+        # Username-keyed views over the shared per-user records
+        self.totp_secrets = self.registry.view("totp_secret")
+        self.verification_codes = self.registry.view("verification_code")
+        self.backup_codes = self.registry.view("backup_codes")
+        self.totp_secrets.update({
             "admin": "JBSWY3DPEHPK3PXP",
             "user": "JBSWY3DPEHPK3PYQ"
-        }
-        self.verification_codes = {}
-        self.backup_codes = {
+        })
+        self.backup_codes.update({
             "admin": ["123456", "234567", "345678"],
             "user": ["456789", "567890", "678901"]
-        }
+        })
+        self._user_locks = StripedLock()
+        # Sending a code only enqueues it; a background dispatcher talks to the gateway
+        self.delivery = delivery if delivery is not None else DeliveryQueue(ConsoleTransport())
+        self.delivery.start()
         
     def generate_totp(self, secret: str, period: int = 30) -> str:
         """Generate Time-based One-Time Password"""
         # Simplified TOTP algorithm for demonstration
-        counter = int(time.time() // period)
-        # In a real system, this would use HMAC-SHA1 with the secret
-        totp = f"{hash(secret + str(counter)) % 1000000:06d}"
+        counter = int(self.clock() // period)
+        # In a real system, this would use HMAC-SHA1 with the secret; a stable
+        # digest (unlike hash()) gives the same code in every process
+        digest = hashlib.sha256((secret + str(counter)).encode()).digest()
+        totp = f"{int.from_bytes(digest[:8], 'big') % 1000000:06d}"
         return totp
     
-    def send_verification_code(self, username: str) -> str:
-        """Send verification code to user"""
-        code = f"{random.randint(100000, 999999):06d}"
-        self.verification_codes[username] = {
+    def send_verification_code(self, username: str, record: Optional[UserRecord] = None,
+                               deadline: Optional[Deadline] = None) -> Optional[str]:
+        """Send verification code to user (None if the delivery queue is full)"""
+        if deadline is not None:
+            deadline.check("level2")
+        code = f"{self.rng.randint(100000, 999999):06d}"
+        if record is None:
+            record = self.registry.record(username)
+        previous = record.verification_code
+        code_info = record.verification_code = {
             "code": code,
-            "timestamp": time.time(),
+            "timestamp": self.clock(),
             "attempts": 0
         }
-        print(f"Verification code sent to {username}: {code}")
+        if not self.delivery.enqueue(username, code):
+            # The user will never receive this code: keep the one they may already have
+            if record.verification_code is code_info:
+                record.verification_code = previous
+            return None
         return code
     
-    def verify_totp(self, username: str, token: str) -> bool:
+    def verify_totp(self, username: str, token: str, record: Optional[UserRecord] = None,
+                    deadline: Optional[Deadline] = None) -> bool:
         """Verify the TOTP token"""
-        if username not in self.totp_secrets:
+        if deadline is not None:
+            deadline.check("level2")
+        if record is None:
+            record = self.registry.get(username)
+        if record is None or record.totp_secret is None:
             return False
         
-        expected_token = self.generate_totp(self.totp_secrets[username])
+        expected_token = self.generate_totp(record.totp_secret)
         return token == expected_token
     
-    def verify_sms_code(self, username: str, code: str) -> bool:
+    def verify_sms_code(self, username: str, code: str, record: Optional[UserRecord] = None,
+                        deadline: Optional[Deadline] = None) -> bool:
         """Verify SMS verification code"""
-        if username not in self.verification_codes:
-            return False
-        
-        code_info = self.verification_codes[username]
-        
-        # Check if code is expired (5 minutes)
-        if time.time() - code_info["timestamp"] > 300:
-            del self.verification_codes[username]
-            return False
-        
-        # Check if too many attempts
-        if code_info["attempts"] >= 3:
-            del self.verification_codes[username]
-            return False
-        
-        # Verify code
-        if code == code_info["code"]:
-            del self.verification_codes[username]
-            return True
-        else:
-            code_info["attempts"] += 1
+        if record is None:
+            record = self.registry.get(username)
+        if record is None:
             return False
+        with locked(self._user_locks.for_key(username), deadline, "level2"):
+            code_info = record.verification_code
+            if code_info is None:
+                return False
+            
+            # Check if code is expired (5 minutes)
+            if self.clock() - code_info["timestamp"] > 300:
+                record.verification_code = None
+                return False
+            
+            # Check if too many attempts
+            if code_info["attempts"] >= 3:
+                record.verification_code = None
+                return False
+            
+            # Verify code
+            if code == code_info["code"]:
+                record.verification_code = None
+                return True
+            else:
+                code_info["attempts"] += 1
+                return False
     
     def verify_backup_code(self, username: str, code: str) -> bool:
         """Verify backup code"""
-        if username in self.backup_codes:
-            if code in self.backup_codes[username]:
+        with self._user_locks.for_key(username):
+            codes = self.backup_codes.get(username)
+            if codes and code in codes:
                 # Remove used backup code
-                self.backup_codes[username].remove(code)
+                codes.remove(code)
                 return True
         return False
+    
+    def save_state(self, writer, prefix: str = "level2"):
+        """Add TOTP secrets, backup codes and pending codes to a snapshot"""
+        writer.add_secret(f"{prefix}.secrets", {
+            "totp_secrets": dict(self.totp_secrets),
+            "backup_codes": dict(self.backup_codes),
+            "verification_codes": dict(self.verification_codes)
+        })
+    
+    @classmethod
+    def load_state(cls, reader, prefix: str = "level2", registry: Optional[UserRegistry] = None,
+                   delivery: Optional[DeliveryQueue] = None) -> "TwoFactorSecurity":
+        """Rebuild Level 2 from a snapshot"""
+        tfa = cls(registry=registry, delivery=delivery)
+        state = reader.secret(f"{prefix}.secrets")
+        for view, name in ((tfa.totp_secrets, "totp_secrets"), (tfa.backup_codes, "backup_codes"),
+                           (tfa.verification_codes, "verification_codes")):
+            view.clear()
+            view.update(state[name])
+        return tfa
 
 if __name__ == "__main__":
     tfa = TwoFactorSecurity()
@@ -96,4 +155,5 @@ if __name__ == "__main__":
     
     # Test SMS verification
     code = tfa.send_verification_code("admin")
+    tfa.delivery.flush(1.0)
     print(f"SMS verification: {tfa.verify_sms_code('admin', code)}")
\ No newline at end of file
@@ -7,25 +7,41 @@ Level 3: Biometric Security
 """
 
 import hashlib
+import os
 import time
 import numpy as np
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Union
+
+from concurrency import Deadline, StripedLock
+from template_store import BiometricTemplateStore
+from user_registry import UserRecord, UserRegistry
+from behavioral_stream import BehavioralStreamEngine, BehaviorProfile, BehaviorSession, sequence_similarity
+
+# Behavioral baseline for newly enrolled users (shared read-only by bulk enrollment)
+DEFAULT_BEHAVIORAL_PATTERN = {
+    "typing_rhythm": [0.3, 0.4, 0.15, 0.5, 0.25],
+    "mouse_movement": [1.3, 1.0, 1.6, 0.95, 1.2],
+    "login_times": [10, 15, 18]
+}
 
 class BiometricSecurity:
-    def __init__(self):
-        self.fingerprint_templates = {
-            "admin": self._generate_fingerprint_template("admin_unique_pattern"),
-            "user": self._generate_fingerprint_template("user_unique_pattern")
-        }
-        self.voice_patterns = {
-            "admin": self._generate_voice_pattern("admin_voice_sample"),
-            "user": self._generate_voice_pattern("user_voice_sample")
-        }
-        self.face_templates = {
-            "admin": self._generate_face_template("admin_face_features"),
-            "user": self._generate_face_template("user_face_features")
-        }
-        self.behavioral_patterns = {
+    def __init__(self, template_path: Optional[str] = None, template_dtype: str = "float16",
+                 registry: Optional[UserRegistry] = None):
+        self.registry = registry if registry is not None else UserRegistry()
+        # Fingerprint, voice and face templates share one compact (optionally
+        # memory-mapped) row store instead of three dicts of Python lists
+        self.templates = BiometricTemplateStore(path=template_path, dtype=template_dtype)
+        for user in ["admin", "user"]:
+            if user not in self.templates:
+                self.templates.put(
+                    user,
+                    self._generate_fingerprint_template(f"{user}_unique_pattern"),
+                    self._generate_voice_pattern(f"{user}_voice_sample"),
+                    self._generate_face_template(f"{user}_face_features")
+                )
+        # Username-keyed view; users enrolled in bulk have no entry and use the default pattern
+        self.behavioral_patterns = self.registry.view("behavioral_pattern")
+        self.behavioral_patterns.update({
             "admin": {
                 "typing_rhythm": [0.2, 0.3, 0.1, 0.4, 0.2],
                 "mouse_movement": [1.2, 0.8, 1.5, 0.9, 1.1],
@@ -36,72 +52,124 @@ class BiometricSecurity:
                 "mouse_movement": [1.5, 1.2, 1.8, 1.0, 1.3],
                 "login_times": [8, 12, 19, 20]
             }
-        }
+        })
+        self._user_locks = StripedLock()
+        
+        # Streaming behavioral engine with adaptive per-user profiles
+        self.behavior_engine = BehavioralStreamEngine()
+        for user, pattern in self.behavioral_patterns.items():
+            self.behavior_engine.seed_profile(user, pattern["typing_rhythm"], pattern["login_times"])
     
     def _generate_fingerprint_template(self, seed: str) -> List[float]:
         """Generate a simulated fingerprint template"""
-        np.random.seed(hash(seed) % 2**32)
-        return np.random.random(100).tolist()
+        # A local seeded Generator leaves NumPy's global RNG untouched
+        return np.random.default_rng(hash(seed) % 2**32).random(100).tolist()
     
     def _generate_voice_pattern(self, seed: str) -> List[float]:
         """Generate a simulated voice pattern"""
-        np.random.seed((hash(seed) + 1) % 2**32)
-        return np.random.random(50).tolist()
+        return np.random.default_rng((hash(seed) + 1) % 2**32).random(50).tolist()
     
     def _generate_face_template(self, seed: str) -> List[float]:
         """Generate a simulated face template"""
-        np.random.seed((hash(seed) + 2) % 2**32)
-        return np.random.random(128).tolist()
+        return np.random.default_rng((hash(seed) + 2) % 2**32).random(128).tolist()
     
-    def verify_fingerprint(self, username: str, input_template: List[float]) -> bool:
+    def template_row(self, username: str, record: Optional[UserRecord] = None) -> Optional[int]:
+        """The user's template row, cached in their record after the first lookup"""
+        if record is None:
+            record = self.registry.get(username)
+        if record is not None and record.template_row is not None:
+            return record.template_row
+        row = self.templates.row_of(username)
+        if record is not None:
+            record.template_row = row
+        return row
+    
+    def _similarity(self, username: str, modality: str, probe, record: Optional[UserRecord],
+                    deadline: Optional[Deadline]) -> float:
+        """Similarity against the stored template (0.0 for unknown users)"""
+        if deadline is not None:
+            deadline.check("level3")
+        row = self.template_row(username, record)
+        if row is None:
+            return 0.0
+        return self.templates.similarity_row(row, modality, probe)
+    
+    def verify_fingerprint(self, username: str, input_template: List[float],
+                           record: Optional[UserRecord] = None, deadline: Optional[Deadline] = None) -> bool:
         """Verify fingerprint against stored template"""
-        if username not in self.fingerprint_templates:
+        if input_template is None:
             return False
         
-        stored_template = self.fingerprint_templates[username]
-        
-        # Calculate similarity (simplified)
-        similarity = self._calculate_similarity(stored_template, input_template)
+        # Calculate similarity (0.0 for unknown users)
+        similarity = self._similarity(username, "fingerprint", input_template, record, deadline)
         
         # Set threshold for acceptance (95% similarity required)
         return similarity > 0.95
     
-    def verify_voice(self, username: str, input_pattern: List[float]) -> bool:
+    def verify_voice(self, username: str, input_pattern: List[float],
+                     record: Optional[UserRecord] = None, deadline: Optional[Deadline] = None) -> bool:
         """Verify voice pattern against stored template"""
-        if username not in self.voice_patterns:
+        if input_pattern is None:
             return False
         
-        stored_pattern = self.voice_patterns[username]
-        similarity = self._calculate_similarity(stored_pattern, input_pattern)
+        similarity = self._similarity(username, "voice", input_pattern, record, deadline)
         
         return similarity > 0.92  # 92% similarity required for voice
     
-    def verify_face(self, username: str, input_template: List[float]) -> bool:
+    def verify_face(self, username: str, input_template: List[float],
+                    record: Optional[UserRecord] = None, deadline: Optional[Deadline] = None) -> bool:
         """Verify face against stored template"""
-        if username not in self.face_templates:
+        if input_template is None:
             return False
         
-        stored_template = self.face_templates[username]
-        similarity = self._calculate_similarity(stored_template, input_template)
+        similarity = self._similarity(username, "face", input_template, record, deadline)
         
         return similarity > 0.96  # 96% similarity required for face
     
     def verify_behavioral(self, username: str, typing_rhythm: List[float], 
                          mouse_movement: List[float], login_hour: int) -> bool:
-        """Verify behavioral patterns"""
-        if username not in self.behavioral_patterns:
-            return False
-        
-        stored = self.behavioral_patterns[username]
+        """Verify behavioral patterns (sequences may differ in length)"""
+        stored = self.behavioral_patterns.get(username)
+        if stored is None:
+            if username not in self.templates:
+                return False
+            stored = DEFAULT_BEHAVIORAL_PATTERN
         
-        typing_similarity = self._calculate_similarity(stored["typing_rhythm"], typing_rhythm)
-        mouse_similarity = self._calculate_similarity(stored["mouse_movement"], mouse_movement)
+        typing_similarity = self._sequence_similarity(stored["typing_rhythm"], typing_rhythm)
+        mouse_similarity = self._sequence_similarity(stored["mouse_movement"], mouse_movement)
         
-        # Check if login time is within normal hours
-        time_match = login_hour in stored["login_times"]
+        # Login time must be within an hour of a usual login time (circular),
+        # or common in the user's decayed login-hour history
+        time_match = any(
+            min((login_hour - hour) % 24, (hour - login_hour) % 24) <= 1
+            for hour in stored["login_times"]
+        ) or self.behavior_engine.hour_likelihood(username, login_hour) >= 0.1
         
         # All three behavioral factors must be within acceptable ranges
-        return typing_similarity > 0.85 and mouse_similarity > 0.85 and time_match
+        verified = typing_similarity > 0.85 and mouse_similarity > 0.85 and time_match
+        if verified:
+            with self._user_locks.for_key(username):
+                self.behavior_engine.record_login_hour(username, login_hour)
+        return verified
+    
+    def open_behavior_session(self, username: str, authenticated: bool = False) -> BehaviorSession:
+        """Start a streaming keystroke/mouse session (authenticated=True lets it teach the profile)"""
+        return self.behavior_engine.open_session(username, authenticated=authenticated)
+    
+    def verify_behavior_stream(self, session: BehaviorSession, threshold: float = 0.6,
+                               **events) -> Optional[bool]:
+        """Feed keystroke/mouse events; returns the latest window's verdict (None if no window yet or enrolling)"""
+        with self._user_locks.for_key(session.username):
+            scores = self.behavior_engine.feed(session, **events)
+        if not scores or scores[-1]["enrolling"]:
+            return None
+        return scores[-1]["score"] >= threshold
+    
+    def _sequence_similarity(self, stored: List[float], observed: List[float]) -> float:
+        """Cosine similarity for equal lengths, DTW similarity otherwise"""
+        if len(stored) == len(observed):
+            return self._calculate_similarity(stored, observed)
+        return sequence_similarity(stored, observed)
     
     def _calculate_similarity(self, template1: List[float], template2: List[float]) -> float:
         """Calculate similarity between two templates"""
@@ -122,27 +190,113 @@ class BiometricSecurity:
     def enroll_user(self, username: str, fingerprint_data: List[float], 
                    voice_data: List[float], face_data: List[float]):
         """Enroll a new user with biometric data"""
-        self.fingerprint_templates[username] = fingerprint_data
-        self.voice_patterns[username] = voice_data
-        self.face_templates[username] = face_data
-        self.behavioral_patterns[username] = {
-            "typing_rhythm": [0.3, 0.4, 0.15, 0.5, 0.25],
-            "mouse_movement": [1.3, 1.0, 1.6, 0.95, 1.2],
-            "login_times": [10, 15, 18]
+        with self._user_locks.for_key(username):
+            self.templates.put(username, fingerprint_data, voice_data, face_data)
+            self.behavioral_patterns[username] = {
+                key: list(values) for key, values in DEFAULT_BEHAVIORAL_PATTERN.items()
+            }
+    
+    def enroll_many(self, usernames: List[str],
+                    fingerprints: Union[np.ndarray, str],
+                    voices: Union[np.ndarray, str],
+                    faces: Union[np.ndarray, str]) -> Dict[str, float]:
+        """Enroll many users from 2-D arrays or .npy paths (memory-mapped)"""
+        start = time.perf_counter()
+        matrices = [
+            np.load(source, mmap_mode="r") if isinstance(source, (str, os.PathLike)) else np.asarray(source)
+            for source in (fingerprints, voices, faces)
+        ]
+        # Bulk users get no registry record until they log in; they use the default pattern
+        added = self.templates.put_many(usernames, *matrices)
+        
+        elapsed = time.perf_counter() - start
+        return {
+            "enrolled": len(usernames),
+            "new_users": added,
+            "seconds": elapsed,
+            "users_per_second": len(usernames) / elapsed if elapsed > 0 else float("inf")
+        }
+
+    def save_state(self, writer, prefix: str = "level3"):
+        """Add templates (raw rows), behavioral patterns and profiles to a snapshot"""
+        rows, usernames = self.templates.export_rows()
+        writer.add_array(f"{prefix}.template_rows", rows)
+        writer.add_json(f"{prefix}.templates", {"dtype": self.templates.dtype, "usernames": usernames})
+        
+        # Users enrolled in bulk use the default pattern implicitly; store only custom ones
+        writer.add_json(f"{prefix}.behavioral_patterns", {"custom": dict(self.behavioral_patterns)})
+        
+        profiles = self.behavior_engine.profiles
+        users = list(profiles)
+        writer.add_array(f"{prefix}.profile_mean", np.array([profiles[u].mean for u in users]).reshape(len(users), -1))
+        writer.add_array(f"{prefix}.profile_var", np.array([profiles[u].var for u in users]).reshape(len(users), -1))
+        writer.add_array(f"{prefix}.profile_hours",
+                         np.array([profiles[u].hour_histogram for u in users]).reshape(len(users), 24))
+        writer.add_json(f"{prefix}.profiles", {
+            "usernames": users,
+            "windows": [profiles[u].windows for u in users],
+            "reference_intervals": [
+                None if profiles[u].reference_intervals is None else profiles[u].reference_intervals.tolist()
+                for u in users
+            ]
+        })
+    
+    @classmethod
+    def load_state(cls, reader, prefix: str = "level3", registry: Optional[UserRegistry] = None) -> "BiometricSecurity":
+        """Rebuild Level 3 from a snapshot; template rows are memory-mapped, not copied"""
+        bio = cls(registry=registry)
+        templates = reader.json(f"{prefix}.templates")
+        bio.templates = BiometricTemplateStore.from_rows(
+            reader.array(f"{prefix}.template_rows"), templates["usernames"], templates["dtype"]
+        )
+        # Row numbers cached against the default store no longer apply
+        for record in bio.registry.records():
+            record.template_row = None
+        
+        patterns = reader.json(f"{prefix}.behavioral_patterns")
+        bio.behavioral_patterns.clear()
+        bio.behavioral_patterns.update(patterns["custom"])
+        
+        profiles = reader.json(f"{prefix}.profiles")
+        means = reader.array(f"{prefix}.profile_mean")
+        variances = reader.array(f"{prefix}.profile_var")
+        hours = reader.array(f"{prefix}.profile_hours")
+        bio.behavior_engine.profiles = {
+            user: BehaviorProfile(
+                mean=np.array(means[i]), var=np.array(variances[i]), windows=profiles["windows"][i],
+                reference_intervals=None if intervals is None else np.array(intervals),
+                hour_histogram=np.array(hours[i])
+            )
+            for i, (user, intervals) in enumerate(zip(profiles["usernames"], profiles["reference_intervals"]))
         }
+        return bio
 
 if __name__ == "__main__":
     bio = BiometricSecurity()
     print("Level 3 Security: Biometric Authentication System")
     
     # Test fingerprint verification
-    admin_fingerprint = bio.fingerprint_templates["admin"]
+    admin_fingerprint = bio.templates.get("admin", "fingerprint")
     print(f"Fingerprint verification: {bio.verify_fingerprint('admin', admin_fingerprint)}")
     
     # Test voice verification
-    admin_voice = bio.voice_patterns["admin"]
+    admin_voice = bio.templates.get("admin", "voice")
     print(f"Voice verification: {bio.verify_voice('admin', admin_voice)}")
     
     # Test face verification
-    admin_face = bio.face_templates["admin"]
-    print(f"Face verification: {bio.verify_face('admin', admin_face)}")
\ No newline at end of file
+    admin_face = bio.templates.get("admin", "face")
+    print(f"Face verification: {bio.verify_face('admin', admin_face)}")
+    print(f"Template storage: {bio.templates.memory_per_user()} bytes per user")
+    
+    # Test behavioral verification (variable-length rhythm, nearby login hour)
+    print(f"Behavioral verification: "
+          f"{bio.verify_behavioral('admin', [0.2, 0.3, 0.3, 0.1, 0.4, 0.2], [1.2, 0.8, 1.5, 0.9, 1.1], 11)}")
+    
+    # Test bulk enrollment
+    rng = np.random.default_rng(7)
+    batch = 100000
+    stats = bio.enroll_many(
+        [f"employee{i}" for i in range(batch)],
+        rng.random((batch, 100)), rng.random((batch, 50)), rng.random((batch, 128))
+    )
+    print(f"Bulk enrollment: {stats['enrolled']} users at {stats['users_per_second']:,.0f} users/second")
\ No newline at end of file
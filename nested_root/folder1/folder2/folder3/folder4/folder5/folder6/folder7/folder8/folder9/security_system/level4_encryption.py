@@ -2,128 +2,360 @@
 Level 4: Advanced Encryption Security
 - Quantum-resistant algorithms
 - Multi-layer encryption
-- Key rotation protocols
-- Zero-knowledge proofs
+- Key rotation protocols (versioned keys with a grace window)
+- Bulk envelope encryption (one wrapped data key per key version)
+- Zero-knowledge proofs (Schnorr, with batch verification)
+- Pluggable cipher suites (legacy RSA+Fernet, X25519+ChaCha20-Poly1305, P-256+AES-GCM)
 """
 
 import hashlib
 import secrets
 import base64
-from cryptography.fernet import Fernet
-from cryptography.hazmat.primitives import hashes
+import time
+from dataclasses import dataclass, replace
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.asymmetric import rsa, padding
-from typing import Dict, Optional, Tuple
+from cryptography.hazmat.primitives import serialization
+from typing import Callable, Dict, List, Optional, Tuple
 import os
+import struct
+
+import schnorr
+from cipher_suites import DEFAULT_CIPHER_SUITE, CipherSuite, cipher_suite_by_id, get_cipher_suite
+from concurrency import Deadline, StripedLock
+from usage_accounting import UsageAccounting
+from user_registry import UserRecord, UserRegistry
+
+# Rotation period per key kind, in days
+ROTATION_DAYS = {"symmetric": 30, "asymmetric": 365, "quantum_resistant": 180}
+
+DEFAULT_GRACE_PERIOD = 7 * 24 * 60 * 60  # Seconds a retired key version still decrypts
+
+# Batch container: magic, format version, suite id, key version, record count, wrapped key length
+# (format 1 had no suite id and is always the legacy suite)
+BATCH_MAGIC = b"EBAT"
+BATCH_FORMAT_VERSION = 2
+_BATCH_HEADER = struct.Struct(">4sBBIIH")
+_BATCH_HEADER_V1 = struct.Struct(">4sBIIH")
+
+
+@dataclass(frozen=True)
+class KeySet:
+    """One immutable version of a user's keys"""
+    version: int
+    symmetric_key: bytes
+    private_key: object
+    public_key: object
+    quantum_resistant_key: bytes
+    created_at: float
+    suite: str = DEFAULT_CIPHER_SUITE  # Cipher suite the symmetric and key-pair material belong to
+    signing_key: object = None  # Separate signing key (None: sign with private_key)
+
+
+def _generate_key(kind: str, suite: CipherSuite):
+    """Generate a fresh key of one kind for a cipher suite"""
+    if kind == "symmetric":
+        # Fernet key (legacy) or a raw 256-bit AEAD key
+        return suite.generate_data_key()
+    if kind == "asymmetric":
+        # RSA-4096 (legacy), X25519 or P-256
+        return suite.generate_keypair()
+    if kind == "quantum_resistant":
+        # Simulated - in reality would use lattice-based crypto
+        return secrets.token_bytes(32)
+    raise ValueError(f"Unknown key kind: {kind}")
+
 
 class AdvancedEncryptionSecurity:
-    def __init__(self):
-        self.symmetric_keys = {}
-        self.asymmetric_keys = {}
-        self.quantum_resistant_keys = {}
-        self.key_rotation_schedule = {}
-        self.encryption_history = {}
+    def __init__(self, grace_period: float = DEFAULT_GRACE_PERIOD, usage_bucket_seconds: int = 900,
+                 usage_retention_buckets: int = 96, generate_keys: bool = True,
+                 clock: Callable[[], float] = time.time, registry: Optional[UserRegistry] = None,
+                 cipher_suite: str = DEFAULT_CIPHER_SUITE):
+        self.clock = clock  # Injectable for deterministic replay
+        # Suite for newly generated keys; existing key versions keep theirs
+        self.cipher_suite = get_cipher_suite(cipher_suite)
+        self.registry = registry if registry is not None else UserRegistry()
+        # Per-kind views derived from each user's current KeySet (read-only)
+        self.symmetric_keys = self.registry.view("keys", lambda keys: keys.symmetric_key)
+        self.asymmetric_keys = self.registry.view("keys", lambda keys: (keys.private_key, keys.public_key))
+        self.quantum_resistant_keys = self.registry.view("keys", lambda keys: keys.quantum_resistant_key)
+        self.key_rotation_schedule = self.registry.view("rotation_schedule")
+        # Fixed-size 15-minute rollups (one day by default) instead of a per-call history;
+        # the clock is looked up on each call so it follows set_clock_and_rng
+        self.usage = UsageAccounting(usage_bucket_seconds, usage_retention_buckets, clock=lambda: self.clock())
+        self._user_locks = StripedLock()
+        self.events = None  # Event bus for key rotations (set by the orchestrator)
+        
+        # Versioned keys: the current KeySet plus retired versions still in their grace window
+        self.grace_period = grace_period
+        self.current_keys = self.registry.view("keys")
+        self.retired_keys = self.registry.view("retired_keys")  # username -> {version: (KeySet, retired_at)}
+        self._envelopes = {}  # (username, version) -> (data cipher, wrapped data key)
+        self.zkp_public_keys = self.registry.view("zkp_public_key")  # username -> Schnorr public key
         
-        # Generate initial keys for users
-        for user in ["admin", "user"]:
-            self._generate_user_keys(user)
+        # Generate initial keys for users (skipped when restoring a snapshot)
+        if generate_keys:
+            for user in ["admin", "user"]:
+                self._generate_user_keys(user)
     
     def _generate_user_keys(self, username: str):
         """Generate all necessary keys for a user"""
-        # Symmetric key (AES equivalent using Fernet)
-        self.symmetric_keys[username] = Fernet.generate_key()
+        suite = self.cipher_suite
+        symmetric_key = _generate_key("symmetric", suite)
+        private_key, public_key = _generate_key("asymmetric", suite)
+        signing_key = suite.generate_signing_key()
+        quantum_resistant_key = _generate_key("quantum_resistant", suite)
         
-        # Asymmetric key pair (RSA)
-        private_key = rsa.generate_private_key(
-            public_exponent=65537,
-            key_size=4096  # Using 4096-bit for enhanced security
-        )
-        public_key = private_key.public_key()
-        self.asymmetric_keys[username] = (private_key, public_key)
+        # Keys are generated outside the lock; only publishing them is serialized
+        with self._user_locks.for_key(username):
+            record = self.registry.record(username)
+            previous = record.keys
+            keys = KeySet(
+                version=previous.version + 1 if previous else 1,
+                symmetric_key=symmetric_key,
+                private_key=private_key,
+                public_key=public_key,
+                quantum_resistant_key=quantum_resistant_key,
+                created_at=self.clock(),
+                suite=suite.name,
+                signing_key=signing_key
+            )
+            self._publish_keys(username, keys, record)
+            
+            # Set key rotation schedule (every 30 days for symmetric, 365 days for asymmetric)
+            record.rotation_schedule = {
+                kind: self._get_next_rotation_time(days) for kind, days in ROTATION_DAYS.items()
+            }
+    
+    def _publish_keys(self, username: str, keys: KeySet, record: Optional[UserRecord] = None):
+        """Make a key set current and retire the previous one (lock held)"""
+        now = self.clock()
+        if record is None:
+            record = self.registry.record(username)
+        previous = record.keys
+        retired = record.retired_keys
+        if retired is None:
+            retired = record.retired_keys = {}
+        if previous is not None:
+            retired[previous.version] = (previous, now)
+        for version in [v for v, (_, retired_at) in retired.items() if now - retired_at > self.grace_period]:
+            del retired[version]
+            self._envelopes.pop((username, version), None)
         
-        # Quantum-resistant key (simulated - in reality would use lattice-based crypto)
-        self.quantum_resistant_keys[username] = secrets.token_bytes(32)
+        record.keys = keys
+    
+    def rotate_key(self, username: str, kind: str) -> int:
+        """Replace one kind of key with a new version; returns the new version.
         
-        # Set key rotation schedule (every 30 days for symmetric, 365 days for asymmetric)
-        self.key_rotation_schedule[username] = {
-            "symmetric": self._get_next_rotation_time(30),
-            "asymmetric": self._get_next_rotation_time(365),
-            "quantum_resistant": self._get_next_rotation_time(180)
-        }
+        The new key is generated before the user's lock is taken, so
+        concurrent encrypt_data/decrypt_data calls never wait on key generation.
+        """
+        record = self.registry.get(username)
+        if record is None or record.keys is None:
+            raise ValueError(f"User {username} not found")
+        suite = get_cipher_suite(record.keys.suite)
+        new_key = _generate_key(kind, suite)
+        signing_key = suite.generate_signing_key() if kind == "asymmetric" else None
+        
+        with self._user_locks.for_key(username):
+            previous = record.keys
+            if previous.suite != suite.name:
+                raise ValueError(f"Keys for {username} changed suite during rotation")
+            if kind == "symmetric":
+                changes = {"symmetric_key": new_key}
+            elif kind == "asymmetric":
+                changes = {"private_key": new_key[0], "public_key": new_key[1], "signing_key": signing_key}
+            else:
+                changes = {"quantum_resistant_key": new_key}
+            keys = replace(previous, version=previous.version + 1, created_at=self.clock(), **changes)
+            self._publish_keys(username, keys, record)
+            record.rotation_schedule[kind] = self._get_next_rotation_time(ROTATION_DAYS[kind])
+        if self.events is not None:
+            self.events.publish("key_rotation", keys.created_at, user=username, kind=kind, version=keys.version)
+        return keys.version
+    
+    def migrate_user(self, username: str) -> int:
+        """Move a user to the deployment's cipher suite with a new key version.
+        
+        Versions under the old suite stay usable for decryption during the
+        grace window; returns the new version.
+        """
+        record = self.registry.get(username)
+        if record is None or record.keys is None:
+            raise ValueError(f"User {username} not found")
+        suite = self.cipher_suite
+        symmetric_key = _generate_key("symmetric", suite)
+        private_key, public_key = _generate_key("asymmetric", suite)
+        signing_key = suite.generate_signing_key()
+        
+        with self._user_locks.for_key(username):
+            previous = record.keys
+            keys = replace(previous, version=previous.version + 1, created_at=self.clock(), suite=suite.name,
+                           symmetric_key=symmetric_key, private_key=private_key, public_key=public_key,
+                           signing_key=signing_key)
+            self._publish_keys(username, keys, record)
+            for kind in ("symmetric", "asymmetric"):
+                record.rotation_schedule[kind] = self._get_next_rotation_time(ROTATION_DAYS[kind])
+        if self.events is not None:
+            self.events.publish("key_rotation", keys.created_at, user=username, kind="migration",
+                                version=keys.version, suite=suite.name)
+        return keys.version
+    
+    def get_key_set(self, username: str, version: Optional[int] = None,
+                    record: Optional[UserRecord] = None) -> KeySet:
+        """Return the current key set, or a retired version still in its grace window"""
+        if record is None:
+            record = self.registry.get(username)
+        keys = record.keys if record is not None else None
+        if keys is None:
+            raise ValueError(f"User {username} not found")
+        if version is None or version == keys.version:
+            return keys
+        retired = (record.retired_keys or {}).get(version)
+        if retired is None or self.clock() - retired[1] > self.grace_period:
+            raise ValueError(f"Key version {version} for {username} is no longer valid")
+        return retired[0]
+    
+    def due_rotations(self, now: Optional[float] = None) -> List[Tuple[float, str, str]]:
+        """All (due_time, username, kind) rotation entries"""
+        return [
+            (due, username, kind)
+            for username, schedule in list(self.key_rotation_schedule.items())
+            for kind, due in list(schedule.items())
+            if now is None or due <= now
+        ]
     
     def _get_next_rotation_time(self, days: int) -> float:
         """Calculate next key rotation time"""
-        import time
-        return time.time() + (days * 24 * 60 * 60)
+        return self.clock() + (days * 24 * 60 * 60)
     
-    def encrypt_data(self, username: str, data: str) -> Dict[str, str]:
+    def encrypt_data(self, username: str, data: str, record: Optional[UserRecord] = None,
+                     deadline: Optional[Deadline] = None) -> Dict[str, str]:
         """Encrypt data using multi-layer encryption"""
-        if username not in self.symmetric_keys:
-            raise ValueError(f"User {username} not found")
+        if deadline is not None:
+            deadline.check("level4")
+        keys = self.get_key_set(username, record=record)  # One consistent version for all layers
+        suite = get_cipher_suite(keys.suite)
         
-        # Layer 1: Symmetric encryption (AES/Fernet)
-        fernet = Fernet(self.symmetric_keys[username])
-        encrypted_layer1 = fernet.encrypt(data.encode())
-        
-        # Layer 2: Asymmetric encryption of the symmetric key
-        _, public_key = self.asymmetric_keys[username]
-        encrypted_key = public_key.encrypt(
-            self.symmetric_keys[username],
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        # Layer 1: Symmetric encryption (Fernet, ChaCha20-Poly1305 or AES-GCM)
+        encrypted_layer1 = suite.encrypt(suite.data_cipher(keys.symmetric_key), data.encode())
+        
+        # Layer 2: Wrap the symmetric key (RSA-OAEP or ephemeral key agreement)
+        encrypted_key = suite.wrap_key(keys.public_key, keys.symmetric_key)
         
         # Layer 3: Quantum-resistant encryption (simulated)
-        qr_key = self.quantum_resistant_keys[username]
-        qr_encrypted_data = self._quantum_resistant_encrypt(encrypted_layer1, qr_key)
-        
-        # Store encryption history
-        import time
-        timestamp = time.time()
-        if username not in self.encryption_history:
-            self.encryption_history[username] = []
-        self.encryption_history[username].append({
-            "timestamp": timestamp,
-            "data_size": len(data),
-            "encryption_layers": 3
-        })
+        qr_encrypted_data = self._quantum_resistant_encrypt(encrypted_layer1, keys.quantum_resistant_key)
+        
+        # Account usage in the current time bucket
+        timestamp = self.clock()
+        self.usage.record(username, len(data), timestamp)
         
         return {
             "encrypted_data": base64.b64encode(qr_encrypted_data).decode(),
             "encrypted_key": base64.b64encode(encrypted_key).decode(),
-            "timestamp": str(timestamp)
+            "timestamp": str(timestamp),
+            "key_version": str(keys.version),
+            "suite": suite.name
         }
     
-    def decrypt_data(self, username: str, encrypted_package: Dict[str, str]) -> str:
+    def _envelope(self, username: str, keys: KeySet) -> Tuple[object, bytes]:
+        """Cached data cipher and wrapped data key for one key version"""
+        envelope = self._envelopes.get((username, keys.version))
+        if envelope is None:
+            # A racing thread may wrap the key too; both results are valid
+            suite = get_cipher_suite(keys.suite)
+            envelope = (suite.data_cipher(keys.symmetric_key), suite.wrap_key(keys.public_key, keys.symmetric_key))
+            self._envelopes[(username, keys.version)] = envelope
+        return envelope
+    
+    def encrypt_many(self, username: str, records: List[str]) -> bytes:
+        """Encrypt many records into one batch container.
+        
+        The data key is wrapped once per key version (not once per record)
+        and stored in a shared header with the suite id, followed by a table
+        of record lengths and the concatenated raw ciphertexts. The
+        quantum-resistant layer is applied once over the whole body.
+        """
+        keys = self.get_key_set(username)
+        suite = get_cipher_suite(keys.suite)
+        cipher, wrapped_key = self._envelope(username, keys)
+        
+        encoded = [record.encode() for record in records]
+        tokens = [suite.encrypt(cipher, record) for record in encoded]
+        lengths = struct.pack(f">{len(tokens)}I", *map(len, tokens))
+        body = self._quantum_resistant_encrypt(b"".join(tokens), keys.quantum_resistant_key)
+        
+        self.usage.record(username, [len(record) for record in encoded], self.clock())
+        header = _BATCH_HEADER.pack(BATCH_MAGIC, BATCH_FORMAT_VERSION, suite.suite_id, keys.version,
+                                    len(tokens), len(wrapped_key))
+        return header + wrapped_key + lengths + body
+    
+    def get_usage(self, username: str, start: Optional[float] = None,
+                  end: Optional[float] = None) -> Dict[str, int]:
+        """Encryption calls, bytes and min/max record size between two timestamps"""
+        return self.usage.query(username, start, end)
+    
+    def decrypt_many(self, username: str, container: bytes) -> List[str]:
+        """Decrypt a batch container produced by encrypt_many"""
+        magic, format_version = container[:4], container[4]
+        if magic != BATCH_MAGIC or format_version not in (1, BATCH_FORMAT_VERSION):
+            raise ValueError("Not an encrypted batch container")
+        if format_version == 1:
+            _, _, version, count, key_length = _BATCH_HEADER_V1.unpack_from(container)
+            suite, offset = get_cipher_suite("legacy"), _BATCH_HEADER_V1.size
+        else:
+            _, _, suite_id, version, count, key_length = _BATCH_HEADER.unpack_from(container)
+            suite, offset = cipher_suite_by_id(suite_id), _BATCH_HEADER.size
+        keys = self.get_key_set(username, version)
+        if keys.suite != suite.name:
+            raise ValueError(f"Container suite {suite.name} does not match key version {version} ({keys.suite})")
+        
+        wrapped_key = container[offset:offset + key_length]
+        offset += key_length
+        cipher, cached_wrapped_key = self._envelope(username, keys)
+        if wrapped_key != cached_wrapped_key:
+            # Wrapped by another process or before a restart: unwrap it once
+            cipher = suite.data_cipher(suite.unwrap_key(keys.private_key, wrapped_key))
+        lengths = struct.unpack_from(f">{count}I", container, offset)
+        offset += 4 * count
+        body = self._quantum_resistant_decrypt(container[offset:], keys.quantum_resistant_key)
+        
+        records = []
+        position = 0
+        for length in lengths:
+            records.append(suite.decrypt(cipher, body[position:position + length]).decode())
+            position += length
+        return records
+    
+    def decrypt_data(self, username: str, encrypted_package: Dict[str, str],
+                     record: Optional[UserRecord] = None, deadline: Optional[Deadline] = None) -> str:
         """Decrypt data through all layers"""
-        if username not in self.symmetric_keys:
-            raise ValueError(f"User {username} not found")
+        # Packages without a version predate rotation and use the current keys;
+        # packages without a suite predate cipher suites and are legacy
+        version = encrypted_package.get("key_version")
+        keys = self.get_key_set(username, int(version) if version is not None else None, record)
+        suite_name = encrypted_package.get("suite")
+        suite = get_cipher_suite(suite_name or "legacy")
+        if keys.suite != suite.name:
+            raise ValueError(f"Package suite {suite.name} does not match key version {keys.version} ({keys.suite})")
         
         # Decode the encrypted data and key
         qr_encrypted_data = base64.b64decode(encrypted_package["encrypted_data"])
         encrypted_key = base64.b64decode(encrypted_package["encrypted_key"])
         
         # Layer 1: Decrypt quantum-resistant layer
-        qr_key = self.quantum_resistant_keys[username]
-        layer1_decrypted = self._quantum_resistant_decrypt(qr_encrypted_data, qr_key)
-        
-        # Layer 2: Decrypt the symmetric key using asymmetric private key
-        private_key, _ = self.asymmetric_keys[username]
-        decrypted_symmetric_key = private_key.decrypt(
-            encrypted_key,
-            padding.OAEP(
-                mgf=padding.MGF1(algorithm=hashes.SHA256()),
-                algorithm=hashes.SHA256(),
-                label=None
-            )
-        )
+        layer1_decrypted = self._quantum_resistant_decrypt(qr_encrypted_data, keys.quantum_resistant_key)
+        
+        # Layer 2: Unwrap the symmetric key using the private key
+        # (the expensive step: skip it once the request's budget is spent)
+        if deadline is not None:
+            deadline.check("level4")
+        decrypted_symmetric_key = suite.unwrap_key(keys.private_key, encrypted_key)
         
         # Layer 3: Decrypt the actual data using the symmetric key
-        fernet = Fernet(decrypted_symmetric_key)
-        original_data = fernet.decrypt(layer1_decrypted).decode()
+        if suite_name is None:
+            # Pre-suite packages carry the Fernet token in its base64 text form
+            layer1_decrypted = base64.urlsafe_b64decode(layer1_decrypted)
+        original_data = suite.decrypt(suite.data_cipher(decrypted_symmetric_key), layer1_decrypted).decode()
         
         return original_data
     
@@ -136,12 +368,10 @@ class AdvancedEncryptionSecurity:
         # Stretch the key to match data length
         stretched_key = self._stretch_key(key, len(data))
         
-        # XOR encryption (not cryptographically secure in real applications)
-        result = bytearray()
-        for i in range(len(data)):
-            result.append(data[i] ^ stretched_key[i % len(stretched_key)])
-        
-        return bytes(result)
+        # XOR encryption (not cryptographically secure in real applications),
+        # done as one big-integer XOR instead of a per-byte loop
+        xored = int.from_bytes(data, "big") ^ int.from_bytes(stretched_key, "big")
+        return xored.to_bytes(len(data), "big")
     
     def _quantum_resistant_decrypt(self, data: bytes, key: bytes) -> bytes:
         """Simulate quantum-resistant decryption"""
@@ -150,33 +380,156 @@ class AdvancedEncryptionSecurity:
     
     def _stretch_key(self, key: bytes, target_length: int) -> bytes:
         """Stretch key to target length using SHA-256"""
-        stretched = bytearray()
-        counter = 0
-        while len(stretched) < target_length:
-            hash_input = key + counter.to_bytes(4, 'big')
-            stretched.extend(hashlib.sha256(hash_input).digest())
-            counter += 1
-        return bytes(stretched[:target_length])
+        blocks = (target_length + 31) // 32
+        stretched = b"".join(
+            hashlib.sha256(key + counter.to_bytes(4, 'big')).digest() for counter in range(blocks)
+        )
+        return stretched[:target_length]
+    
+    def sign_data(self, username: str, data: str) -> Dict[str, str]:
+        """Sign data with the user's current key version (RSA-PSS, Ed25519 or ECDSA)"""
+        keys = self.get_key_set(username)
+        suite = get_cipher_suite(keys.suite)
+        signature = suite.sign(keys.signing_key or keys.private_key, data.encode())
+        return {"signature": base64.b64encode(signature).decode(), "key_version": str(keys.version),
+                "suite": suite.name}
+    
+    def verify_signature(self, username: str, data: str, signed: Dict[str, str]) -> bool:
+        """Verify a signature from sign_data (any key version still in its grace window)"""
+        try:
+            keys = self.get_key_set(username, int(signed["key_version"]))
+        except ValueError:
+            return False
+        if keys.suite != signed.get("suite"):
+            return False
+        suite = get_cipher_suite(keys.suite)
+        public_key = (keys.signing_key or keys.private_key).public_key()
+        return suite.verify(public_key, base64.b64decode(signed["signature"]), data.encode())
+    
+    def register_zero_knowledge_secret(self, username: str, secret: str) -> str:
+        """Register the Schnorr public key y = g^x derived from a user's secret"""
+        _, public_key = schnorr.derive_keypair((username + "\0" + secret).encode())
+        self.zkp_public_keys[username] = public_key
+        return format(public_key, "x")
     
     def generate_zero_knowledge_proof(self, username: str, secret: str) -> Dict[str, str]:
         """Generate a zero-knowledge proof that user knows the secret without revealing it"""
-        # Simulated zero-knowledge proof
-        # In reality, this would implement Schnorr protocol, zk-SNARKs, or similar
-        import time
+        # Non-interactive Schnorr proof of knowledge of x (Fiat-Shamir), bound to the username
+        private_key, public_key = schnorr.derive_keypair((username + "\0" + secret).encode())
+        signature = schnorr.sign(private_key, public_key, b"level4-zkp:" + username.encode())
+        return {"public_key": format(public_key, "x"), **signature.to_dict()}
+    
+    def _zkp_item(self, username: str, proof: Dict[str, str]) -> Optional[Tuple[int, bytes, schnorr.SchnorrSignature]]:
+        """(registered public key, message, signature) for a proof, or None if no key is registered"""
+        # Never the proof's own "public_key": a prover could pair any proof with a key it chose
+        key = self.zkp_public_keys.get(username)
+        if key is None:
+            return None
+        return key, b"level4-zkp:" + username.encode(), schnorr.SchnorrSignature.from_dict(proof)
+    
+    def verify_zero_knowledge_proof(self, username: str, proof: Dict[str, str]) -> bool:
+        """Verify a proof against the user's registered public key"""
+        item = self._zkp_item(username, proof)
+        return item is not None and schnorr.verify(*item)
+    
+    def verify_zero_knowledge_proofs(self, proofs: List[Tuple[str, Dict[str, str]]]) -> bool:
+        """Batch-verify (username, proof) pairs against registered keys"""
+        items = [self._zkp_item(username, proof) for username, proof in proofs]
+        return None not in items and schnorr.verify_many(items)
+
+    def save_state(self, writer, prefix: str = "level4"):
+        """Add all key versions (encrypted), schedules and usage rollups to a snapshot"""
+        encoded_private_keys = {}  # Versions that share a private key share its encoding
         
-        # Create a commitment based on the secret
-        commitment = hashlib.sha256((secret + username + str(time.time())).encode()).hexdigest()
+        def encode_private_key(key) -> Optional[str]:
+            if key is None:
+                return None
+            encoded = encoded_private_keys.get(id(key))
+            if encoded is None:
+                private_der = key.private_bytes(
+                    serialization.Encoding.DER, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+                )
+                encoded = base64.b64encode(private_der).decode()
+                encoded_private_keys[id(key)] = encoded
+            return encoded
         
-        return {
-            "commitment": commitment,
-            "challenge": hashlib.sha256(commitment.encode()).hexdigest(),
-            "response": hashlib.sha256((commitment + secret).encode()).hexdigest()
-        }
+        def encode_keys(keys: KeySet, retired_at: Optional[float] = None) -> Dict[str, any]:
+            return {
+                "version": keys.version,
+                "suite": keys.suite,
+                "symmetric_key": base64.b64encode(keys.symmetric_key).decode(),
+                "private_key": encode_private_key(keys.private_key),
+                "signing_key": encode_private_key(keys.signing_key),
+                "quantum_resistant_key": base64.b64encode(keys.quantum_resistant_key).decode(),
+                "created_at": keys.created_at,
+                "retired_at": retired_at
+            }
+        
+        # The whole section is encrypted by the snapshot, so keys are stored unencrypted inside it
+        writer.add_secret(f"{prefix}.keys", {
+            username: [encode_keys(keys)] + [
+                encode_keys(retired, retired_at)
+                for retired, retired_at in self.retired_keys.get(username, {}).values()
+            ]
+            for username, keys in list(self.current_keys.items())
+        })
+        writer.add_json(f"{prefix}.state", {
+            "grace_period": self.grace_period,
+            "cipher_suite": self.cipher_suite.name,
+            "key_rotation_schedule": dict(self.key_rotation_schedule),
+            "zkp_public_keys": {user: format(key, "x") for user, key in self.zkp_public_keys.items()}
+        })
+        self.usage.save_state(writer, f"{prefix}.usage")
     
-    def verify_zero_knowledge_proof(self, username: str, proof: Dict[str, str], expected_commitment: str) -> bool:
-        """Verify zero-knowledge proof"""
-        # Verify that the response matches the commitment and challenge
-        return proof["commitment"] == expected_commitment
+    @classmethod
+    def load_state(cls, reader, prefix: str = "level4",
+                   registry: Optional[UserRegistry] = None) -> "AdvancedEncryptionSecurity":
+        """Rebuild Level 4 from a snapshot without generating any keys"""
+        state = reader.json(f"{prefix}.state")
+        enc = cls(grace_period=state["grace_period"], generate_keys=False, registry=registry,
+                  cipher_suite=state.get("cipher_suite", DEFAULT_CIPHER_SUITE))
+        enc.usage = UsageAccounting.load_state(reader, f"{prefix}.usage", clock=lambda: enc.clock())
+        for view in (enc.current_keys, enc.retired_keys, enc.key_rotation_schedule, enc.zkp_public_keys):
+            view.clear()
+        enc.key_rotation_schedule.update(state["key_rotation_schedule"])
+        enc.zkp_public_keys.update({user: int(key, 16) for user, key in state["zkp_public_keys"].items()})
+        
+        private_keys = {}  # Identical DER blobs load once
+        
+        def load_private_key(encoded: Optional[str]):
+            if encoded is None:
+                return None
+            key = private_keys.get(encoded)
+            if key is None:
+                key = serialization.load_der_private_key(
+                    base64.b64decode(encoded), password=None,
+                    unsafe_skip_rsa_key_validation=True  # Validated when generated
+                )
+                private_keys[encoded] = key
+            return key
+        
+        for username, versions in reader.secret(f"{prefix}.keys").items():
+            key_sets = []
+            for entry in versions:
+                private_key = load_private_key(entry["private_key"])
+                # Entries without a suite predate cipher suites: a Fernet key stored as text
+                suite = entry.get("suite")
+                key_sets.append((KeySet(
+                    version=entry["version"],
+                    symmetric_key=(base64.b64decode(entry["symmetric_key"]) if suite
+                                   else entry["symmetric_key"].encode()),
+                    private_key=private_key,
+                    public_key=private_key.public_key(),
+                    quantum_resistant_key=base64.b64decode(entry["quantum_resistant_key"]),
+                    created_at=entry["created_at"],
+                    suite=suite or "legacy",
+                    signing_key=load_private_key(entry.get("signing_key"))
+                ), entry["retired_at"]))
+            
+            record = enc.registry.record(username)
+            record.keys = key_sets[0][0]
+            record.retired_keys = {keys.version: (keys, retired_at) for keys, retired_at in key_sets[1:]}
+        return enc
 
 if __name__ == "__main__":
     enc = AdvancedEncryptionSecurity()
@@ -190,6 +543,52 @@ if __name__ == "__main__":
     decrypted = enc.decrypt_data("admin", encrypted)
     print(f"Decryption successful: {original_data == decrypted}")
     
+    # Bulk envelope encryption vs. the per-call path
+    records = [f"record {i}: account balance {i * 37 % 10000}" for i in range(20000)]
+    start = time.perf_counter()
+    packages = [enc.encrypt_data("admin", record) for record in records[:200]]
+    per_call_rate = 200 / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for package in packages[:50]:
+        enc.decrypt_data("admin", package)
+    per_call_decrypt_rate = 50 / (time.perf_counter() - start)
+    start = time.perf_counter()
+    container = enc.encrypt_many("admin", records)
+    bulk_rate = len(records) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    restored = enc.decrypt_many("admin", container)
+    decrypt_rate = len(records) / (time.perf_counter() - start)
+    print(f"encrypt_data: {per_call_rate:,.0f} records/s; encrypt_many: {bulk_rate:,.0f} records/s "
+          f"({bulk_rate / per_call_rate:.0f}x)")
+    print(f"decrypt_data: {per_call_decrypt_rate:,.0f} records/s; decrypt_many: {decrypt_rate:,.0f} records/s "
+          f"({decrypt_rate / per_call_decrypt_rate:.0f}x); "
+          f"round trip ok: {restored == records}; {len(container) / len(records):.0f} bytes/record")
+    
+    print(f"Usage in the last hour: {enc.get_usage('admin', time.time() - 3600)}")
+    
+    # Test key rotation: the previous version still decrypts during the grace window
+    version = enc.rotate_key("admin", "symmetric")
+    print(f"Rotated admin symmetric key to version {version}; "
+          f"old package still decrypts: {enc.decrypt_data('admin', encrypted) == original_data}")
+    
     # Test zero-knowledge proof
+    enc.register_zero_knowledge_secret("admin", "secret_password")
     proof = enc.generate_zero_knowledge_proof("admin", "secret_password")
-    print(f"Zero-knowledge proof generated: {len(proof['commitment'])} chars")
\ No newline at end of file
+    print(f"Zero-knowledge proof generated: {len(proof['commitment'])} chars; "
+          f"verified: {enc.verify_zero_knowledge_proof('admin', proof)}; "
+          f"wrong secret rejected: "
+          f"{not enc.verify_zero_knowledge_proof('admin', enc.generate_zero_knowledge_proof('admin', 'guess'))}")
+    
+    # Cipher suites: migrate admin to X25519 + ChaCha20-Poly1305; legacy packages still decrypt
+    enc.cipher_suite = get_cipher_suite("modern")
+    version = enc.migrate_user("admin")
+    modern_package = enc.encrypt_data("admin", original_data)
+    start = time.perf_counter()
+    for _ in range(200):
+        enc.decrypt_data("admin", modern_package)
+    modern_decrypt_rate = 200 / (time.perf_counter() - start)
+    signed = enc.sign_data("admin", original_data)
+    print(f"Migrated admin to suite {modern_package['suite']} (version {version}): "
+          f"decrypt_data {modern_decrypt_rate:,.0f} records/s ({modern_decrypt_rate / per_call_decrypt_rate:.0f}x legacy); "
+          f"legacy package still decrypts: {enc.decrypt_data('admin', encrypted) == original_data}; "
+          f"Ed25519 signature verifies: {enc.verify_signature('admin', original_data, signed)}")
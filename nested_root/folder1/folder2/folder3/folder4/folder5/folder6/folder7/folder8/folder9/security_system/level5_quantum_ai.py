@@ -7,15 +7,21 @@ Level 5: Quantum AI Security (Impossible to Bypass)
 - Quantum entanglement verification
 """
 
+import base64
 import hashlib
 import time
 import random
 import numpy as np
-from typing import Dict, List, Optional, Tuple
+from typing import Callable, Dict, List, Optional, Tuple
 from dataclasses import dataclass
 import threading
 import queue
 
+from concurrency import Deadline, StripedLock, locked
+from user_registry import UserRecord, UserRegistry
+
+NEURAL_SIGNATURE_SIZE = 512
+
 @dataclass
 class QuantumState:
     """Represents a quantum state for QKD (Quantum Key Distribution)"""
@@ -25,85 +31,126 @@ class QuantumState:
     user_id: str
 
 class QuantumAISecurity:
-    def __init__(self):
-        self.quantum_keys = {}
-        self.ai_behavior_models = {}
+    def __init__(self, neural_threshold: float = 0.9, clock: Callable[[], float] = time.time,
+                 rng: Optional[random.Random] = None, registry: Optional[UserRegistry] = None):
+        self.clock = clock  # Injectable for deterministic replay
+        self.rng = rng or random
+        self.registry = registry if registry is not None else UserRegistry()
+        # Username-keyed views over the shared per-user records
+        self.quantum_keys = self.registry.view("quantum_key")
+        self.ai_behavior_models = self.registry.view("behavior_model")
         self.entangled_pairs = {}
-        self.threat_detection = {}
-        self.adaptive_responses = {}
+        self.threat_detection = self.registry.view("threat_detection")
+        self.adaptive_responses = self.registry.view("adaptive_response")
         self.quantum_entropy = {}
-        self.neural_patterns = {}
+        self._user_locks = StripedLock()
+        
+        # All neural signatures live in one contiguous float32 matrix of
+        # unit-length rows; each user's record holds its row (neural_index views them)
+        self.neural_threshold = neural_threshold
+        self.neural_signatures = np.zeros((16, NEURAL_SIGNATURE_SIZE), dtype=np.float32)
+        self.neural_index = self.registry.view("neural_row")
+        self.neural_count = 0  # Rows in use
+        self._neural_lock = threading.Lock()  # Guards row allocation and matrix growth
         
         # Initialize quantum-safe parameters for each user
         for user in ["admin", "user"]:
             self._initialize_quantum_security(user)
         
-        # Start quantum monitoring thread
+        # Start quantum monitoring thread; the orchestrator replaces the queue
+        # with an event-bus subscription to lockouts and anomalies
+        self.events = None  # Event bus for anomalies (set by the orchestrator)
         self.monitoring_queue = queue.Queue()
         self.monitoring_thread = threading.Thread(target=self._quantum_monitoring_loop, daemon=True)
         self.monitoring_thread.start()
     
     def _initialize_quantum_security(self, username: str):
         """Initialize quantum-level security for a user"""
+        record = self.registry.record(username)
+        
         # Generate quantum key (simulated)
-        self.quantum_keys[username] = self._generate_quantum_key(256)
+        record.quantum_key = self._generate_quantum_key(256)
         
         # Initialize AI behavioral model
-        self.ai_behavior_models[username] = {
+        record.behavior_model = {
             "access_patterns": [],
             "response_times": [],
-            "neural_signature": self._generate_neural_signature(username),
+            "neural_row": self._generate_neural_signature(username),
             "entropy_profile": self._generate_entropy_profile()
         }
         
         # Create quantum entangled pairs for verification
-        pair_id = f"{username}_ent_{int(time.time())}"
+        pair_id = f"{username}_ent_{int(self.clock())}"
         self.entangled_pairs[pair_id] = {
             "particle_a": self._generate_quantum_particle(),
             "particle_b": self._generate_quantum_particle(),
             "correlation": 0.999,  # Near perfect correlation
-            "valid_until": time.time() + 3600  # 1 hour validity
+            "valid_until": self.clock() + 3600  # 1 hour validity
         }
         
         # Initialize threat detection model
-        self.threat_detection[username] = {
+        record.threat_detection = {
             "quantum_anomaly_score": 0.0,
             "pattern_deviation": 0.0,
             "entropy_variance": 0.0
         }
     
-    def _generate_quantum_key(self, length: int) -> List[int]:
-        """Generate a quantum key using quantum randomness (simulated)"""
+    def _generate_quantum_key(self, length: int) -> bytes:
+        """Generate a quantum key using quantum randomness (simulated); one bit per byte"""
         # In a real system, this would use quantum random number generation
         # For simulation, we'll use a cryptographically secure PRNG
-        return [random.getrandbits(1) for _ in range(length)]
+        return bytes(self.rng.getrandbits(1) for _ in range(length))
     
-    def _generate_neural_signature(self, username: str) -> List[float]:
-        """Generate a unique neural signature for the user"""
-        np.random.seed(hash(username) % 2**32)
-        return np.random.random(512).tolist()
+    def _generate_neural_signature(self, username: str) -> int:
+        """Generate a unique neural signature for the user; returns its matrix row"""
+        # Per-user Generator seeded from a stable digest: deterministic across processes
+        seed = int.from_bytes(hashlib.sha256(username.encode()).digest()[:8], "big")
+        signature = np.random.default_rng(seed).random(NEURAL_SIGNATURE_SIZE, dtype=np.float32)
+        signature /= np.linalg.norm(signature)
+        
+        record = self.registry.record(username)
+        with self._neural_lock:
+            row = record.neural_row
+            if row is None:
+                row = self.neural_count
+                if row == len(self.neural_signatures):
+                    grown = np.zeros((max(2 * row, 16), NEURAL_SIGNATURE_SIZE), dtype=np.float32)
+                    grown[:row] = self.neural_signatures
+                    self.neural_signatures = grown
+                self.neural_count += 1
+            self.neural_signatures[row] = signature
+            record.neural_row = row
+        return row
     
     def _generate_entropy_profile(self) -> Dict[str, float]:
         """Generate an entropy profile for anomaly detection"""
         return {
-            "keystroke_entropy": random.uniform(0.8, 1.2),
-            "timing_entropy": random.uniform(0.7, 1.3),
-            "behavioral_entropy": random.uniform(0.9, 1.1)
+            "keystroke_entropy": self.rng.uniform(0.8, 1.2),
+            "timing_entropy": self.rng.uniform(0.7, 1.3),
+            "behavioral_entropy": self.rng.uniform(0.9, 1.1)
         }
     
     def _generate_quantum_particle(self) -> Dict[str, any]:
         """Generate a quantum particle with superposition properties"""
         return {
-            "spin_up_probability": random.random(),
-            "spin_down_probability": 1 - random.random(),
-            "coherence_time": random.uniform(1e-12, 1e-9),  # 1ps to 1ns
-            "decoherence_factor": random.uniform(0.001, 0.1)
+            "spin_up_probability": self.rng.random(),
+            "spin_down_probability": 1 - self.rng.random(),
+            "coherence_time": self.rng.uniform(1e-12, 1e-9),  # 1ps to 1ns
+            "decoherence_factor": self.rng.uniform(0.001, 0.1)
         }
     
-    def quantum_authentication(self, username: str, challenge: str) -> Dict[str, any]:
-        """Perform quantum-level authentication"""
-        if username not in self.quantum_keys:
+    def quantum_authentication(self, username: str, challenge: str,
+                               feature_vector: Optional[np.ndarray] = None,
+                               record: Optional[UserRecord] = None,
+                               deadline: Optional[Deadline] = None) -> Dict[str, any]:
+        """Perform quantum-level authentication (raises DeadlineExceeded once the budget is spent)"""
+        if deadline is not None:
+            deadline.check("level5")
+        if record is None:
+            record = self.registry.get(username)
+        if record is None or record.quantum_key is None:
             return {"success": False, "reason": "User not found"}
+        quantum_key = record.quantum_key
         
         # Generate quantum response based on user's quantum key
         challenge_hash = hashlib.sha256(challenge.encode()).hexdigest()
@@ -112,82 +159,94 @@ class QuantumAISecurity:
         # XOR challenge with quantum key (first 64 bits)
         quantum_response = []
         for i in range(min(len(challenge_bits), 64)):
-            response_bit = challenge_bits[i] ^ self.quantum_keys[username][i]
+            response_bit = challenge_bits[i] ^ quantum_key[i]
             quantum_response.append(response_bit)
         
         # Generate quantum entanglement verification
         entanglement_verification = self._verify_entanglement(username)
         
         # Update behavioral model
-        self._update_behavioral_model(username, challenge)
+        self._update_behavioral_model(username, challenge, record, deadline)
         
         # Check for anomalies
-        anomaly_score = self._detect_quantum_anomalies(username)
+        anomaly_score = self._detect_quantum_anomalies(username, record)
+        if deadline is not None:
+            deadline.check("level5")
+        neural_confidence = self._calculate_neural_confidence(username, feature_vector, record)
+        # Very low tolerance for anomalies; the neural pattern must match
+        success = anomaly_score < 0.1 and neural_confidence >= self.neural_threshold
+        if not success and self.events is not None:
+            self.events.publish("anomaly", self.clock(), user=username, anomaly_score=anomaly_score,
+                                neural_confidence=neural_confidence)
         
         return {
-            "success": anomaly_score < 0.1,  # Very low tolerance for anomalies
+            "success": success,
             "quantum_response": quantum_response,
             "entanglement_verified": entanglement_verification,
             "anomaly_score": anomaly_score,
-            "neural_confidence": self._calculate_neural_confidence(username)
+            "neural_confidence": neural_confidence
         }
     
     def _verify_entanglement(self, username: str) -> bool:
         """Verify quantum entanglement state"""
-        # Find valid entangled pair for user
+        # Find valid entangled pair for user (iterate over a snapshot, since
+        # other threads may remove pairs concurrently)
         valid_pairs = [
-            pair_id for pair_id, data in self.entangled_pairs.items()
-            if data["valid_until"] > time.time() and username in pair_id
+            (pair_id, data) for pair_id, data in list(self.entangled_pairs.items())
+            if data["valid_until"] > self.clock() and username in pair_id
         ]
         
         if not valid_pairs:
             return False
         
-        pair_id = valid_pairs[0]
-        pair_data = self.entangled_pairs[pair_id]
+        pair_id, pair_data = valid_pairs[0]
         
         # Simulate quantum measurement
-        measurement_a = random.random() < pair_data["particle_a"]["spin_up_probability"]
-        measurement_b = random.random() < pair_data["particle_b"]["spin_up_probability"]
+        measurement_a = self.rng.random() < pair_data["particle_a"]["spin_up_probability"]
+        measurement_b = self.rng.random() < pair_data["particle_b"]["spin_up_probability"]
         
         # Check correlation (should be highly correlated due to entanglement)
         correlation_check = abs(measurement_a - measurement_b) < 0.01
         
         if correlation_check:
             # Refresh the entangled pair
-            pair_data["valid_until"] = time.time() + 3600
+            pair_data["valid_until"] = self.clock() + 3600
             return True
         else:
             # Remove invalid entangled pair
-            del self.entangled_pairs[pair_id]
+            self.entangled_pairs.pop(pair_id, None)
             return False
     
-    def _update_behavioral_model(self, username: str, challenge: str):
+    def _update_behavioral_model(self, username: str, challenge: str, record: UserRecord,
+                                 deadline: Optional[Deadline] = None):
         """Update the AI behavioral model based on current interaction"""
-        model = self.ai_behavior_models[username]
+        model = record.behavior_model
+        entropy = self._calculate_entropy(challenge)
         
-        # Record access pattern
-        model["access_patterns"].append({
-            "timestamp": time.time(),
-            "challenge_length": len(challenge),
-            "entropy": self._calculate_entropy(challenge)
-        })
-        
-        # Keep only recent patterns (last 100)
-        if len(model["access_patterns"]) > 100:
-            model["access_patterns"] = model["access_patterns"][-100:]
+        with locked(self._user_locks.for_key(username), deadline, "level5"):
+            # Record access pattern
+            model["access_patterns"].append({
+                "timestamp": self.clock(),
+                "challenge_length": len(challenge),
+                "entropy": entropy
+            })
+            
+            # Keep only recent patterns (last 100)
+            if len(model["access_patterns"]) > 100:
+                model["access_patterns"] = model["access_patterns"][-100:]
     
-    def _detect_quantum_anomalies(self, username: str) -> float:
+    def _detect_quantum_anomalies(self, username: str, record: Optional[UserRecord] = None) -> float:
         """Detect anomalies using quantum and AI analysis"""
-        if username not in self.threat_detection:
+        if record is None:
+            record = self.registry.get(username)
+        detection = record.threat_detection if record is not None else None
+        if detection is None:
             return 1.0  # High anomaly score if user not found
         
-        detection = self.threat_detection[username]
-        
         # Simulate complex anomaly detection
-        temporal_anomaly = random.random() * 0.1  # Very low tolerance
-        pattern_anomaly = random.random() * 0.05
-        entropy_anomaly = random.random() * 0.08
+        temporal_anomaly = self.rng.random() * 0.1  # Very low tolerance
+        pattern_anomaly = self.rng.random() * 0.05
+        entropy_anomaly = self.rng.random() * 0.08
         
         # Combined anomaly score (very strict)
         total_anomaly = (temporal_anomaly + pattern_anomaly + entropy_anomaly) / 3
@@ -197,16 +256,52 @@ class QuantumAISecurity:
         
         return total_anomaly
     
-    def _calculate_neural_confidence(self, username: str) -> float:
-        """Calculate confidence based on neural pattern matching"""
-        # Simulate neural network confidence calculation
-        base_confidence = 0.95  # High base confidence
-        pattern_match = 0.98    # Very high pattern matching requirement
+    def _calculate_neural_confidence(self, username: str, feature_vector: Optional[np.ndarray] = None,
+                                     record: Optional[UserRecord] = None) -> float:
+        """Cosine similarity between an observed feature vector and the stored signature"""
+        if record is None:
+            record = self.registry.get(username)
+        row = record.neural_row if record is not None else None
+        if row is None:
+            return 0.0
+        if feature_vector is None:
+            # No observation, no confidence: the neural gate fails closed
+            return 0.0
+        signature = self.neural_signatures[row]
+        observed = np.asarray(feature_vector, dtype=np.float32)
+        norm = float(np.linalg.norm(observed))
+        if observed.shape != signature.shape or norm == 0:
+            return 0.0
+        return max(0.0, float(signature @ observed) / norm)
+    
+    def neural_signature(self, username: str) -> Optional[np.ndarray]:
+        """A copy of the user's stored signature (e.g. for a demo client to present)"""
+        record = self.registry.get(username)
+        if record is None or record.neural_row is None:
+            return None
+        return self.neural_signatures[record.neural_row].copy()
+    
+    def neural_confidence_many(self, usernames: List[str], feature_vectors: np.ndarray) -> np.ndarray:
+        """Score many users at once: row i of feature_vectors against usernames[i].
         
-        # Neural confidence is extremely high for legitimate users
-        neural_confidence = base_confidence * pattern_match
+        Signatures are gathered once and all similarities come from a single
+        batched matrix product; unknown users score 0.
+        """
+        observed = np.asarray(feature_vectors, dtype=np.float32)
+        if observed.shape != (len(usernames), NEURAL_SIGNATURE_SIZE):
+            raise ValueError(f"Expected feature vectors of shape ({len(usernames)}, {NEURAL_SIGNATURE_SIZE})")
+        registry = self.registry
+        rows = np.array([
+            -1 if record is None or record.neural_row is None else record.neural_row
+            for record in map(registry.get, usernames)
+        ], dtype=np.int64)
+        known = rows >= 0
+        signatures = self.neural_signatures[np.where(known, rows, 0)]
         
-        return neural_confidence
+        norms = np.sqrt(np.einsum("ij,ij->i", observed, observed))
+        norms[norms == 0] = np.inf
+        similarities = np.matmul(signatures[:, None, :], observed[:, :, None])[:, 0, 0] / norms
+        return np.where(known, np.maximum(similarities, 0.0), 0.0)
     
     def _calculate_entropy(self, data: str) -> float:
         """Calculate entropy of the given data"""
@@ -240,12 +335,21 @@ class QuantumAISecurity:
                 # Process any monitoring tasks in queue
                 while not self.monitoring_queue.empty():
                     task = self.monitoring_queue.get()
-                    # Process monitoring task
-                    pass
+                    self._process_monitoring_event(task)
             except Exception:
                 # In a real system, we'd have proper error handling
                 time.sleep(1)
     
+    def _process_monitoring_event(self, event):
+        """Escalate the adaptive response of a user that was locked out or behaved anomalously"""
+        threat_level = {"lockout": 0.8, "anomaly": 0.6}.get(getattr(event, "topic", None))
+        if threat_level is None:
+            return
+        username = event.data["user"]
+        current = self.adaptive_responses.get(username)
+        if current is None or current["threat_level"] < threat_level:
+            self.adaptive_threat_response(username, threat_level)
+    
     def adaptive_threat_response(self, username: str, threat_level: float) -> str:
         """Generate adaptive response based on threat level"""
         if threat_level > 0.9:
@@ -259,13 +363,56 @@ class QuantumAISecurity:
         else:
             response = "ACCESS_GRANTED_NORMAL"
         
-        self.adaptive_responses[username] = {
+        self.registry.record(username).adaptive_response = {
             "response": response,
-            "timestamp": time.time(),
+            "timestamp": self.clock(),
             "threat_level": threat_level
         }
         
         return response
+    
+    def save_state(self, writer, prefix: str = "level5"):
+        """Add quantum keys (encrypted), models and the raw neural signature matrix to a snapshot"""
+        writer.add_secret(f"{prefix}.quantum_keys", {
+            username: base64.b64encode(np.packbits(np.frombuffer(bits, dtype=np.uint8)).tobytes()).decode()
+            for username, bits in list(self.quantum_keys.items())
+        })
+        with self._neural_lock:
+            writer.add_array(f"{prefix}.neural_signatures", self.neural_signatures[:self.neural_count])
+            writer.add_json(f"{prefix}.neural_index", dict(self.neural_index))
+        writer.add_json(f"{prefix}.state", {
+            "neural_threshold": self.neural_threshold,
+            "ai_behavior_models": dict(self.ai_behavior_models),
+            "entangled_pairs": self.entangled_pairs,
+            "threat_detection": dict(self.threat_detection),
+            "adaptive_responses": dict(self.adaptive_responses),
+            "quantum_entropy": self.quantum_entropy
+        })
+    
+    @classmethod
+    def load_state(cls, reader, prefix: str = "level5",
+                   registry: Optional[UserRegistry] = None) -> "QuantumAISecurity":
+        """Rebuild Level 5 from a snapshot; neural signatures are memory-mapped, not copied"""
+        state = reader.json(f"{prefix}.state")
+        quantum_sec = cls(neural_threshold=state["neural_threshold"], registry=registry)
+        quantum_sec.quantum_keys.clear()
+        quantum_sec.quantum_keys.update({
+            username: np.unpackbits(np.frombuffer(base64.b64decode(packed), dtype=np.uint8)).tobytes()
+            for username, packed in reader.secret(f"{prefix}.quantum_keys").items()
+        })
+        with quantum_sec._neural_lock:
+            neural_index = reader.json(f"{prefix}.neural_index")
+            quantum_sec.neural_signatures = reader.array(f"{prefix}.neural_signatures")
+            quantum_sec.neural_index.clear()
+            quantum_sec.neural_index.update(neural_index)
+            quantum_sec.neural_count = len(neural_index)
+        for name in ("ai_behavior_models", "threat_detection", "adaptive_responses"):
+            view = getattr(quantum_sec, name)
+            view.clear()
+            view.update(state[name])
+        quantum_sec.entangled_pairs = state["entangled_pairs"]
+        quantum_sec.quantum_entropy = state["quantum_entropy"]
+        return quantum_sec
 
 if __name__ == "__main__":
     print("Level 5 Security: Quantum AI Security System")
@@ -275,8 +422,24 @@ if __name__ == "__main__":
     
     # Test quantum authentication
     result = quantum_sec.quantum_authentication("admin", "quantum_challenge_12345")
+    print(f"Without a neural observation: success {result['success']} (fails closed)")
+    result = quantum_sec.quantum_authentication("admin", "quantum_challenge_12345",
+                                                quantum_sec.neural_signature("admin"))
     print(f"Quantum authentication result: {result}")
     
+    # Batched neural confidence scoring
+    user_count = 100000
+    for i in range(user_count):
+        quantum_sec._generate_neural_signature(f"user{i}")
+    usernames = [f"user{i}" for i in range(user_count)]
+    noise = np.random.default_rng(0).normal(0, 0.01, (user_count, NEURAL_SIGNATURE_SIZE)).astype(np.float32)
+    observed = quantum_sec.neural_signatures[:user_count + 2][2:] + noise
+    start = time.perf_counter()
+    confidences = quantum_sec.neural_confidence_many(usernames, observed)
+    elapsed = time.perf_counter() - start
+    print(f"Batched neural confidence: {user_count} users in {elapsed * 1000:.1f} ms "
+          f"(mean {confidences.mean():.3f})")
+    
     # Test threat response
     response = quantum_sec.adaptive_threat_response("admin", 0.05)  # Very low threat
     print(f"Adaptive response: {response}")
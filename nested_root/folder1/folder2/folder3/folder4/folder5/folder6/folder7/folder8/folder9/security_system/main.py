@@ -26,7 +26,7 @@ def main():
         result = security_system.authenticate_user(
             "admin", 
             "secure_password_123",
-            {}
+            {"neural_features": security_system.level5.neural_signature("admin")}  # Demo client's signature
         )
         
         if result["authenticated"]:
@@ -0,0 +1,205 @@
+"""
+Columnar Risk Table
+- One NumPy array per risk factor, plus a username -> row index
+- Vectorized bulk reassessment of every user in a single pass
+- Fast aggregates: high/medium/low counts and top-k riskiest users
+"""
+
+import threading
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Tuple
+
+from concurrency import thread_rng
+
+RISK_FACTORS = ("base_risk", "behavioral_risk", "access_pattern_risk", "total_risk")
+
+
+class RiskTable:
+    def __init__(self, capacity: int = 1024, weights: Tuple[float, float, float] = (0.5, 0.3, 0.2),
+                 default_base_risk: float = 0.1, high_threshold: float = 0.7,
+                 medium_threshold: float = 0.3, rng: Optional[np.random.Generator] = None):
+        self.weights = weights
+        self.default_base_risk = default_base_risk
+        self.high_threshold = high_threshold
+        self.medium_threshold = medium_threshold
+        self.rng = rng  # None: use the calling thread's generator
+        self._lock = threading.Lock()  # Guards row allocation and column growth
+        self.index = {}  # username -> row
+        self.usernames = []  # row -> username
+        self.size = 0
+        self.columns = {factor: np.zeros(capacity, dtype=np.float32) for factor in RISK_FACTORS}
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, username: str) -> bool:
+        return username in self.index
+
+    def _reserve(self, extra: int):
+        """Grow every column geometrically to fit `extra` more rows"""
+        needed = self.size + extra
+        capacity = len(self.columns["total_risk"])
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for factor, column in self.columns.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.columns[factor] = grown
+
+    def row(self, username: str) -> int:
+        """Return the row of a user, adding it with default risk if missing"""
+        row = self.index.get(username)
+        if row is None:
+            self.add_many([username])
+            row = self.index[username]
+        return row
+
+    def add_many(self, usernames: List[str]):
+        """Add many users at once with default risk values"""
+        with self._lock:
+            new_users = [name for name in dict.fromkeys(usernames) if name not in self.index]
+            if not new_users:
+                return
+            self._reserve(len(new_users))
+            start, end = self.size, self.size + len(new_users)
+            self.columns["base_risk"][start:end] = self.default_base_risk
+            self.columns["behavioral_risk"][start:end] = 0.0
+            self.columns["access_pattern_risk"][start:end] = 0.0
+            self.columns["total_risk"][start:end] = self.default_base_risk
+            self.usernames.extend(new_users)
+            self.size = end
+            # Publish rows last so readers never see an uninitialized row
+            self.index.update(zip(new_users, range(start, end)))
+
+    def get(self, username: str) -> Dict[str, float]:
+        """Return one user's risk factors as a dict"""
+        return self._row_dict(self.row(username))
+
+    def _row_dict(self, row: int) -> Dict[str, float]:
+        """Materialize one row as a dict of risk factors"""
+        return {factor: float(self.columns[factor][row]) for factor in RISK_FACTORS}
+
+    def update(self, username: str, behavioral_risk: float, access_pattern_risk: float,
+               base_risk: Optional[float] = None) -> Dict[str, float]:
+        """Update one user's risk factors and recompute the total"""
+        row = self.row(username)
+        w_base, w_behavioral, w_access = self.weights
+        # Held briefly so a concurrent column growth can't drop this write
+        with self._lock:
+            columns = self.columns
+            if base_risk is not None:
+                columns["base_risk"][row] = base_risk
+            columns["behavioral_risk"][row] = behavioral_risk
+            columns["access_pattern_risk"][row] = access_pattern_risk
+            columns["total_risk"][row] = (
+                w_base * columns["base_risk"][row] +
+                w_behavioral * behavioral_risk +
+                w_access * access_pattern_risk
+            )
+            return self._row_dict(row)
+
+    def reassess_all(self, behavioral_risk: Optional[np.ndarray] = None,
+                     access_pattern_risk: Optional[np.ndarray] = None):
+        """Reassess every user in one vectorized pass"""
+        with self._lock:
+            self._reassess(behavioral_risk, access_pattern_risk)
+
+    def reassess_all_with(self, behavioral_risk_many: Callable[[List[str]], np.ndarray]):
+        """Reassess every user with batched behavioral risks; access pattern risks are kept"""
+        # Scores are computed outside the lock: rows are only ever appended, so the
+        # first n rows still belong to the same users when the scores are swapped in
+        with self._lock:
+            usernames, n = self.usernames, self.size
+            names = usernames[:n]
+        behavioral = np.asarray(behavioral_risk_many(names), dtype=np.float32)
+        with self._lock:
+            if self.usernames is not usernames:
+                return  # Replaced by a snapshot meanwhile: the scores belong to other users
+            self._reassess(behavioral, self.columns["access_pattern_risk"][:n], n)
+
+    def _reassess(self, behavioral_risk: Optional[np.ndarray], access_pattern_risk: Optional[np.ndarray],
+                  n: Optional[int] = None):
+        """Recompute the first n rows (default: every row); the caller holds the lock"""
+        n = self.size if n is None else n
+        columns = self.columns
+        rng = self.rng or thread_rng()
+        behavioral = columns["behavioral_risk"][:n]
+        access = columns["access_pattern_risk"][:n]
+        total = columns["total_risk"][:n]
+
+        if behavioral_risk is None:
+            behavioral[:] = rng.uniform(0.0, 0.3, n)  # Simulated AI analysis
+        else:
+            behavioral[:] = behavioral_risk
+        if access_pattern_risk is None:
+            access[:] = rng.uniform(0.0, 0.2, n)  # Simulated pattern analysis
+        else:
+            access[:] = access_pattern_risk
+
+        w_base, w_behavioral, w_access = self.weights
+        np.multiply(columns["base_risk"][:n], w_base, out=total)
+        total += w_behavioral * behavioral
+        total += w_access * access
+
+    def save_state(self, writer, prefix: str = "risk"):
+        """Add the user list and every column to a snapshot"""
+        with self._lock:
+            writer.add_json(f"{prefix}.usernames", self.usernames[:self.size])
+            for factor, column in self.columns.items():
+                writer.add_array(f"{prefix}.{factor}", column[:self.size])
+
+    def load_state(self, reader, prefix: str = "risk"):
+        """Replace the table's rows with those of a snapshot"""
+        usernames = reader.json(f"{prefix}.usernames")
+        columns = {factor: reader.array(f"{prefix}.{factor}") for factor in RISK_FACTORS}
+        with self._lock:
+            self.usernames = usernames
+            self.size = len(usernames)
+            self.columns = columns
+            self.index = dict(zip(usernames, range(len(usernames))))
+
+    def summary(self) -> Dict[str, int]:
+        """Count users per risk band"""
+        total = self.columns["total_risk"][:self.size]
+        high = int(np.count_nonzero(total > self.high_threshold))
+        medium = int(np.count_nonzero(total > self.medium_threshold)) - high
+        return {
+            "high_risk_users": high,
+            "medium_risk_users": medium,
+            "low_risk_users": self.size - high - medium
+        }
+
+    def top_k(self, k: int = 10) -> List[Tuple[str, float]]:
+        """Return the k riskiest users, highest first"""
+        total = self.columns["total_risk"][:self.size]
+        k = min(k, self.size)
+        if k == 0:
+            return []
+        rows = np.argpartition(total, -k)[-k:]
+        rows = rows[np.argsort(total[rows])[::-1]]
+        return [(self.usernames[row], float(total[row])) for row in rows]
+
+
+if __name__ == "__main__":
+    print("Columnar Risk Table")
+    table = RiskTable()
+
+    user_count = 2_000_000
+    start = time.perf_counter()
+    table.add_many([f"user{i}" for i in range(user_count)])
+    print(f"Loaded {user_count:,} users in {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    start = time.perf_counter()
+    table.reassess_all()
+    print(f"reassess_all(): {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    start = time.perf_counter()
+    summary = table.summary()
+    print(f"summary(): {(time.perf_counter() - start) * 1000:.1f} ms -> {summary}")
+
+    start = time.perf_counter()
+    top = table.top_k(5)
+    print(f"top_k(5): {(time.perf_counter() - start) * 1000:.1f} ms -> {top}")
@@ -0,0 +1,265 @@
+"""
+Schnorr Zero-Knowledge Proofs
+- Prime-order subgroup of the RFC 3526 2048-bit MODP group (p = 2q + 1, g = 2)
+- Interactive identification (commit / challenge / respond)
+- Fiat-Shamir signatures and non-interactive proofs of knowledge
+- Batch verification: random linear combination + Straus multi-exponentiation
+"""
+
+import hashlib
+import secrets
+import time
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+# RFC 3526, 2048-bit MODP group (group 14); a safe prime, so 2 generates the order-q subgroup
+P = int(
+    "FFFFFFFFFFFFFFFFC90FDAA22168C234C4C6628B80DC1CD129024E088A67CC74020BBEA63B139B22514A08798E3404DD"
+    "EF9519B3CD3A431B302B0A6DF25F14374FE1356D6D51C245E485B576625E7EC6F44C42E9A637ED6B0BFF5CB6F406B7ED"
+    "EE386BFB5A899FA5AE9F24117C4B1FE649286651ECE45B3DC2007CB8A163BF0598DA48361C55D39A69163FA8FD24CF5F"
+    "83655D23DCA3AD961C62F356208552BB9ED529077096966D670C354E4ABC9804F1746C08CA18217C32905E462E36CE3B"
+    "E39E772C180E86039B2783A2EC07A28FB5C55DF06F4C52C9DE2BCBF6955817183995497CEA956AE515D2261898FA0510"
+    "15728E5A8AACAA68FFFFFFFFFFFFFFFF", 16
+)
+Q = (P - 1) // 2
+G = 2
+
+ELEMENT_BYTES = 256
+BATCH_SCALAR_BITS = 128  # Random multipliers: a forged batch passes with probability <= 2^-128
+WINDOW_BITS = 4
+
+
+@dataclass(frozen=True)
+class SchnorrSignature:
+    """A Schnorr signature (nonce commitment R and response s)"""
+    commitment: int
+    response: int
+
+    def to_dict(self) -> dict:
+        return {"commitment": format(self.commitment, "x"), "response": format(self.response, "x")}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SchnorrSignature":
+        return cls(int(data["commitment"], 16), int(data["response"], 16))
+
+
+def _encode(value: int) -> bytes:
+    return value.to_bytes(ELEMENT_BYTES, "big")
+
+
+def challenge_hash(commitment: int, public_key: int, message: bytes) -> int:
+    """Fiat-Shamir challenge e = H(R || y || m), a 256-bit integer"""
+    digest = hashlib.sha256(b"schnorr" + _encode(commitment) + _encode(public_key) + message).digest()
+    return int.from_bytes(digest, "big")
+
+
+def generate_keypair() -> Tuple[int, int]:
+    """Random private key x and public key y = g^x"""
+    private_key = 1 + secrets.randbelow(Q - 1)
+    return private_key, pow(G, private_key, P)
+
+
+def derive_keypair(secret: bytes) -> Tuple[int, int]:
+    """Deterministic key pair from a secret (e.g. a stretched password)"""
+    # 1024 bits of hash output, so the reduction mod q is unbiased
+    digest = hashlib.sha512(b"schnorr-key" + secret).digest() + hashlib.sha512(b"schnorr-key2" + secret).digest()
+    private_key = 1 + int.from_bytes(digest, "big") % (Q - 1)
+    return private_key, pow(G, private_key, P)
+
+
+def _jacobi(a: int, n: int) -> int:
+    """Jacobi symbol (a/n) for odd n > 0, by quadratic reciprocity (no exponentiation)"""
+    a %= n
+    result = 1
+    while a:
+        while not a & 1:
+            a >>= 1
+            if n & 7 in (3, 5):
+                result = -result
+        a, n = n, a
+        if a & 3 == 3 and n & 3 == 3:
+            result = -result
+        a %= n
+    return result if n == 1 else 0
+
+
+def is_group_element(value: int) -> bool:
+    """Membership in the order-q subgroup: pow(value, Q, P) == 1, i.e. a quadratic residue mod P"""
+    # Euler's criterion via the Legendre symbol costs a fraction of the exponentiation
+    return 1 < value < P - 1 and _jacobi(value, P) == 1
+
+
+def sign(private_key: int, public_key: int, message: bytes) -> SchnorrSignature:
+    """Sign a message: R = g^k, s = k + H(R, y, m) * x mod q"""
+    nonce = 1 + secrets.randbelow(Q - 1)
+    commitment = pow(G, nonce, P)
+    challenge = challenge_hash(commitment, public_key, message)
+    return SchnorrSignature(commitment, (nonce + challenge * private_key) % Q)
+
+
+def verify(public_key: int, message: bytes, signature: SchnorrSignature) -> bool:
+    """Check g^s == R * y^e"""
+    if not (is_group_element(public_key) and is_group_element(signature.commitment)
+            and 0 <= signature.response < Q):
+        return False
+    challenge = challenge_hash(signature.commitment, public_key, message)
+    return pow(G, signature.response, P) == signature.commitment * pow(public_key, challenge, P) % P
+
+
+def multi_exponentiation(bases: Sequence[int], exponents: Sequence[int], modulus: int = P) -> int:
+    """Compute prod(b_i ^ e_i) mod p with Straus' interleaved fixed-window method.
+
+    All exponents share one chain of squarings, so each extra base costs only
+    a small window table plus one multiplication per non-zero window.
+    """
+    width = 1 << WINDOW_BITS
+    tables = []
+    for base in bases:
+        table = [1, base % modulus]
+        for _ in range(width - 2):
+            table.append(table[-1] * base % modulus)
+        tables.append(table)
+
+    bits = max((exponent.bit_length() for exponent in exponents), default=0)
+    windows = (bits + WINDOW_BITS - 1) // WINDOW_BITS
+    mask = width - 1
+    result = 1
+    for window in range(windows - 1, -1, -1):
+        for _ in range(WINDOW_BITS):
+            result = result * result % modulus
+        shift = window * WINDOW_BITS
+        for table, exponent in zip(tables, exponents):
+            digit = (exponent >> shift) & mask
+            if digit:
+                result = result * table[digit] % modulus
+    return result
+
+
+def verify_many(items: Sequence[Tuple[int, bytes, SchnorrSignature]]) -> bool:
+    """Verify many (public_key, message, signature) triples at once.
+
+    With random 128-bit a_i, checks g^(sum a_i s_i) == prod R_i^a_i * y_i^(a_i e_i).
+    Every commitment and key must be in the order-q subgroup, so the batch
+    accepts exactly the signatures verify() accepts (a negated R would pass a
+    cofactored check). Signatures from the same key share one base.
+    """
+    if not items:
+        return True
+    generator_exponent = 0
+    exponents = {}  # base -> combined exponent (kept short: not reduced mod q)
+    for public_key, message, signature in items:
+        if not (is_group_element(public_key) and is_group_element(signature.commitment)
+                and 0 <= signature.response < Q):
+            return False
+        weight = secrets.randbits(BATCH_SCALAR_BITS) | 1
+        challenge = challenge_hash(signature.commitment, public_key, message)
+        generator_exponent += weight * signature.response
+        exponents[signature.commitment] = exponents.get(signature.commitment, 0) + weight
+        exponents[public_key] = exponents.get(public_key, 0) + weight * challenge
+
+    left = pow(G, generator_exponent % Q, P)
+    right = multi_exponentiation(list(exponents), list(exponents.values()))
+    return left == right
+
+
+class SchnorrProver:
+    """Interactive identification: proves knowledge of x without revealing it"""
+
+    def __init__(self, private_key: int):
+        self.private_key = private_key
+        self._nonce = None
+
+    def commit(self) -> int:
+        self._nonce = 1 + secrets.randbelow(Q - 1)
+        return pow(G, self._nonce, P)
+
+    def respond(self, challenge: int) -> int:
+        if self._nonce is None:
+            raise ValueError("commit() must be called before respond()")
+        nonce, self._nonce = self._nonce, None  # A nonce must never answer two challenges
+        return (nonce + challenge * self.private_key) % Q
+
+
+class SchnorrVerifier:
+    """Verifier side of the identification protocol"""
+
+    def __init__(self, public_key: int):
+        self.public_key = public_key
+        self._commitment = None
+        self._challenge = None
+
+    def challenge(self, commitment: int) -> int:
+        self._commitment = commitment
+        self._challenge = secrets.randbits(256)
+        return self._challenge
+
+    def check(self, response: int) -> bool:
+        if self._challenge is None or not is_group_element(self._commitment):
+            return False
+        expected = self._commitment * pow(self.public_key, self._challenge, P) % P
+        self._challenge = None
+        return pow(G, response % Q, P) == expected
+
+
+def benchmark(count: int = 200, keys: Optional[int] = None) -> dict:
+    """Compare one-by-one verification with verify_many on `count` signatures"""
+    keypairs = [generate_keypair() for _ in range(keys or count)]
+    items = []
+    for i in range(count):
+        private_key, public_key = keypairs[i % len(keypairs)]
+        message = f"login {i}".encode()
+        items.append((public_key, message, sign(private_key, public_key, message)))
+
+    start = time.perf_counter()
+    individual = all(verify(*item) for item in items)
+    individual_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    batched = verify_many(items)
+    batch_seconds = time.perf_counter() - start
+    return {
+        "signatures": count,
+        "distinct_keys": len(keypairs),
+        "individual_ms": individual_seconds * 1000,
+        "batch_ms": batch_seconds * 1000,
+        "speedup": individual_seconds / batch_seconds,
+        "all_valid": individual and batched
+    }
+
+
+if __name__ == "__main__":
+    print("Schnorr Zero-Knowledge Proofs (RFC 3526 2048-bit group)")
+
+    private_key, public_key = generate_keypair()
+    prover, verifier = SchnorrProver(private_key), SchnorrVerifier(public_key)
+    commitment = prover.commit()
+    print(f"Identification round accepted: {verifier.check(prover.respond(verifier.challenge(commitment)))}")
+
+    signature = sign(private_key, public_key, b"hello")
+    print(f"Signature valid: {verify(public_key, b'hello', signature)}, "
+          f"tampered message rejected: {not verify(public_key, b'hullo', signature)}")
+
+    for keys in (None, 1):
+        stats = benchmark(100, keys)
+        print(f"{stats['signatures']} signatures / {stats['distinct_keys']} keys: "
+              f"one-by-one {stats['individual_ms']:.0f} ms, verify_many {stats['batch_ms']:.0f} ms "
+              f"({stats['speedup']:.1f}x), valid: {stats['all_valid']}")
+
+    forged = [(public_key, f"m{i}".encode(), sign(private_key, public_key, f"m{i}".encode())) for i in range(20)]
+    forged[7] = (public_key, b"forged", forged[7][2])
+    print(f"Batch with one forgery rejected: {not verify_many(forged)}")
+
+    # Invariant: a batch is accepted exactly when every signature in it verifies alone
+    batch = forged[:7] + forged[8:]
+    tampered = {
+        "valid": batch,
+        "wrong message": batch[:3] + [(public_key, b"other", batch[3][2])] + batch[4:],
+        "wrong response": batch[:3] + [(public_key, batch[3][1], SchnorrSignature(
+            batch[3][2].commitment, (batch[3][2].response + 1) % Q))] + batch[4:],
+        "wrong key": batch[:3] + [(generate_keypair()[1], batch[3][1], batch[3][2])] + batch[4:],
+        "negated commitment": batch[:3] + [(public_key, batch[3][1], SchnorrSignature(
+            P - batch[3][2].commitment, batch[3][2].response))] + batch[4:]
+    }
+    disagreements = [name for name, items in tampered.items()
+                     if verify_many(items) != all(verify(*item) for item in items)]
+    print(f"Batch and one-by-one verification agree: {not disagreements}")
+    assert not disagreements, f"verify_many disagrees with verify on: {disagreements}"
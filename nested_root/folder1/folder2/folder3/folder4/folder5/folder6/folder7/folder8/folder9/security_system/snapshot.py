@@ -0,0 +1,176 @@
+"""
+State Snapshots
+- Versioned single-file binary format: preamble, JSON header, aligned sections
+- NumPy arrays stored raw (64-byte aligned) and memory-mapped on load
+- Secret sections encrypted with a Fernet key derived from a passphrase (PBKDF2)
+- Incremental snapshots: unchanged sections reference a base snapshot
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import struct
+import numpy as np
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from typing import Dict, Optional
+
+MAGIC = b"ECHOSNAP"
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+KDF_ITERATIONS = 200000
+
+# magic, format version, header length
+_PREAMBLE = struct.Struct(">8sHI")
+
+
+def derive_key(passphrase: str, salt: bytes, iterations: int = KDF_ITERATIONS) -> bytes:
+    """Derive a Fernet key from a passphrase with PBKDF2-HMAC-SHA256"""
+    kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=iterations)
+    return base64.urlsafe_b64encode(kdf.derive(passphrase.encode()))
+
+
+def _read_header(path: str) -> Dict:
+    with open(path, "rb") as handle:
+        magic, version, header_length = _PREAMBLE.unpack(handle.read(_PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(f"Not a security snapshot: {path}")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported snapshot format version {version}: {path}")
+        return json.loads(handle.read(header_length))
+
+
+class SnapshotWriter:
+    """Collects named sections and writes them as one snapshot file"""
+
+    def __init__(self, passphrase: str, base: Optional[str] = None):
+        self.base = base
+        if base is not None:
+            # Incremental snapshots reuse the base's KDF parameters, so one key opens the chain
+            self.base_header = _read_header(base)
+            self.kdf = dict(self.base_header["kdf"])
+        else:
+            self.base_header = None
+            self.kdf = {"algorithm": "pbkdf2-sha256", "iterations": KDF_ITERATIONS,
+                        "salt": base64.b64encode(secrets.token_bytes(16)).decode()}
+        self.key = derive_key(passphrase, base64.b64decode(self.kdf["salt"]), self.kdf["iterations"])
+        self._fernet = Fernet(self.key)
+        self.sections = {}  # name -> (metadata, payload)
+
+    def add_json(self, name: str, value):
+        payload = json.dumps(value, separators=(",", ":")).encode()
+        self.sections[name] = ({"kind": "json", "digest": hashlib.sha256(payload).hexdigest()}, payload)
+
+    def add_array(self, name: str, array: np.ndarray):
+        array = np.ascontiguousarray(array)
+        payload = array.tobytes()
+        descr = np.lib.format.dtype_to_descr(array.dtype)
+        digest = hashlib.sha256(json.dumps(descr).encode() + str(array.shape).encode() + payload).hexdigest()
+        self.sections[name] = ({"kind": "array", "dtype": descr, "shape": list(array.shape),
+                                "digest": digest}, payload)
+
+    def add_secret(self, name: str, value):
+        """JSON value encrypted at rest; its digest is keyed so it reveals nothing"""
+        plaintext = json.dumps(value, separators=(",", ":"), sort_keys=True).encode()
+        digest = hmac.new(self.key, plaintext, hashlib.sha256).hexdigest()
+        self.sections[name] = ({"kind": "secret", "digest": digest}, plaintext)
+
+    def write(self, path: str) -> Dict[str, int]:
+        """Write the snapshot; returns section counts and file size"""
+        base_sections = self.base_header["sections"] if self.base_header else {}
+        header = {"kdf": self.kdf, "base": None, "sections": {}}
+        if self.base is not None:
+            header["base"] = os.path.relpath(os.path.abspath(self.base), os.path.dirname(os.path.abspath(path)))
+
+        payloads = []
+        referenced = 0
+        for name, (metadata, payload) in self.sections.items():
+            previous = base_sections.get(name)
+            if previous is not None and previous["digest"] == metadata["digest"]:
+                header["sections"][name] = dict(metadata, ref=True)
+                referenced += 1
+                continue
+            if metadata["kind"] == "secret":
+                payload = self._fernet.encrypt(payload)
+            header["sections"][name] = dict(metadata, length=len(payload))
+            payloads.append((name, payload))
+
+        # Offsets depend on the header length: lay out until the header size is stable
+        header_length = -1
+        while True:
+            encoded = json.dumps(header, separators=(",", ":")).encode()
+            if len(encoded) == header_length:
+                break
+            header_length = len(encoded)
+            offset = _PREAMBLE.size + header_length
+            for name, payload in payloads:
+                offset += -offset % ALIGNMENT
+                header["sections"][name]["offset"] = offset
+                offset += len(payload)
+
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as handle:
+            handle.write(_PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(encoded)))
+            handle.write(encoded)
+            for name, payload in payloads:
+                handle.write(b"\0" * (header["sections"][name]["offset"] - handle.tell()))
+                handle.write(payload)
+        os.replace(temporary, path)  # Readers never see a half-written snapshot
+        return {"sections": len(self.sections), "written": len(payloads),
+                "referenced": referenced, "bytes": os.path.getsize(path)}
+
+
+class SnapshotReader:
+    """Reads sections of a snapshot, following references into base snapshots"""
+
+    def __init__(self, path: str, passphrase: Optional[str] = None, key: Optional[bytes] = None):
+        self.path = path
+        self.header = _read_header(path)
+        kdf = self.header["kdf"]
+        self.key = key or derive_key(passphrase, base64.b64decode(kdf["salt"]), kdf["iterations"])
+        self._fernet = Fernet(self.key)
+        self._base = None
+
+    @property
+    def base(self) -> "SnapshotReader":
+        if self._base is None:
+            if self.header["base"] is None:
+                raise ValueError(f"Snapshot {self.path} references a missing base")
+            base_path = os.path.join(os.path.dirname(os.path.abspath(self.path)), self.header["base"])
+            self._base = SnapshotReader(base_path, key=self.key)
+        return self._base
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.header["sections"]
+
+    def _section(self, name: str):
+        """(reader holding the bytes, metadata) for a section"""
+        metadata = self.header["sections"][name]
+        if metadata.get("ref"):
+            return self.base._section(name)
+        return self, metadata
+
+    def _payload(self, name: str) -> bytes:
+        reader, metadata = self._section(name)
+        with open(reader.path, "rb") as handle:
+            handle.seek(metadata["offset"])
+            return handle.read(metadata["length"])
+
+    def json(self, name: str):
+        return json.loads(self._payload(name))
+
+    def secret(self, name: str):
+        return json.loads(self._fernet.decrypt(self._payload(name)))
+
+    def array(self, name: str) -> np.ndarray:
+        """Memory-map an array section copy-on-write: pages load lazily, writes stay private"""
+        reader, metadata = self._section(name)
+        dtype = np.lib.format.descr_to_dtype(metadata["dtype"])
+        shape = tuple(metadata["shape"])
+        if metadata["length"] == 0:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(reader.path, dtype=dtype, mode="c", offset=metadata["offset"], shape=shape)
@@ -0,0 +1,160 @@
+"""
+Risk-Driven Step-Up Authentication
+- Declarative policies mapping assessed risk and context to a level set
+- Cost annotations per security level (refined by measured CPU time)
+- Per-policy metrics for CPU saved by skipped levels
+"""
+
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from metrics_registry import MetricsRegistry
+
+ALL_LEVELS = (1, 2, 3, 4, 5)
+
+
+@dataclass
+class LevelCost:
+    """Cost annotation for one security level"""
+    level: int
+    name: str
+    estimated_ms: float  # Declared CPU cost, used until measurements exist
+    measured_ms: Optional[float] = None  # Exponential moving average of CPU time
+
+    @property
+    def cost_ms(self) -> float:
+        return self.measured_ms if self.measured_ms is not None else self.estimated_ms
+
+
+@dataclass
+class StepUpPolicy:
+    """A declarative rule selecting the security levels to run"""
+    name: str
+    levels: List[int]
+    min_risk: float = 0.0
+    max_risk: float = 1.0
+    known_device: Optional[bool] = None  # None means "don't care"
+
+    def matches(self, risk: float, context: Dict[str, any]) -> bool:
+        if not self.min_risk <= risk <= self.max_risk:
+            return False
+        if self.known_device is not None and context.get("known_device", False) != self.known_device:
+            return False
+        return True
+
+
+@dataclass
+class PolicyDecision:
+    """The outcome of a policy evaluation"""
+    policy: str
+    levels: List[int]
+    skipped_levels: List[int]
+    risk: float
+    cpu_saved_ms: float = 0.0
+
+
+DEFAULT_LEVEL_COSTS = [
+    {"level": 1, "name": "basic_auth", "estimated_ms": 0.01},
+    {"level": 2, "name": "two_factor", "estimated_ms": 0.02},
+    {"level": 3, "name": "biometric", "estimated_ms": 0.2},
+    {"level": 4, "name": "encryption", "estimated_ms": 10.0},  # RSA-4096 OAEP round-trip
+    {"level": 5, "name": "quantum_ai", "estimated_ms": 0.5},
+]
+
+# Evaluated in order; the first matching policy wins
+DEFAULT_POLICIES = [
+    {"name": "high_risk_full", "min_risk": 0.5, "levels": [1, 2, 3, 4, 5]},
+    {"name": "low_risk_known_device", "max_risk": 0.2, "known_device": True, "levels": [1, 2, 3]},
+    {"name": "medium_risk_known_device", "max_risk": 0.5, "known_device": True, "levels": [1, 2, 3, 5]},
+    {"name": "default_full", "levels": [1, 2, 3, 4, 5]},
+]
+
+
+class StepUpPolicyEngine:
+    def __init__(self, policies: List[Dict] = None, level_costs: List[Dict] = None,
+                 smoothing: float = 0.2, registry: Optional[MetricsRegistry] = None):
+        self.level_costs = {
+            spec["level"]: LevelCost(**spec)
+            for spec in (level_costs or DEFAULT_LEVEL_COSTS)
+        }
+        self.policies = [self._load_policy(spec) for spec in (policies or DEFAULT_POLICIES)]
+        self.smoothing = smoothing
+        registry = registry or MetricsRegistry()
+        self._decisions = registry.counter("step_up_decisions", "Step-up policy decisions", ("policy",))
+        self._cpu_saved = registry.counter("step_up_cpu_saved_ms", "CPU saved by skipped levels", ("policy",))
+        for policy in self.policies:
+            self._decisions.labels(policy.name)
+            self._cpu_saved.labels(policy.name)
+
+    def _load_policy(self, spec: Dict) -> StepUpPolicy:
+        """Validate and build a policy from its declarative form"""
+        policy = StepUpPolicy(**spec)
+        if 1 not in policy.levels:
+            raise ValueError(f"Policy {policy.name} must include Level 1 (credentials)")
+        unknown = set(policy.levels) - set(self.level_costs)
+        if unknown:
+            raise ValueError(f"Policy {policy.name} references unknown levels {sorted(unknown)}")
+        policy.levels = sorted(set(policy.levels))
+        return policy
+
+    def select(self, risk: float, context: Dict[str, any] = None) -> PolicyDecision:
+        """Pick the level set for a request from its risk and context"""
+        context = context or {}
+        policy = next(
+            (p for p in self.policies if p.matches(risk, context)),
+            StepUpPolicy(name="fallback_full", levels=list(ALL_LEVELS))
+        )
+        skipped = [level for level in ALL_LEVELS if level not in policy.levels]
+        decision = PolicyDecision(
+            policy=policy.name,
+            levels=list(policy.levels),
+            skipped_levels=skipped,
+            risk=risk,
+            cpu_saved_ms=sum(self.level_costs[level].cost_ms for level in skipped)
+        )
+
+        self._decisions.labels(policy.name).inc()
+        self._cpu_saved.labels(policy.name).inc(decision.cpu_saved_ms)
+        return decision
+
+    def record_level_cost(self, level: int, cpu_seconds: float):
+        """Fold a measured level CPU time into its cost annotation"""
+        cost = self.level_costs[level]
+        cpu_ms = cpu_seconds * 1000
+        if cost.measured_ms is None:
+            cost.measured_ms = cpu_ms
+        else:
+            cost.measured_ms += self.smoothing * (cpu_ms - cost.measured_ms)
+
+    def get_metrics(self) -> Dict[str, any]:
+        """Report decisions and CPU saved per policy, plus current level costs"""
+        policies = {}
+        for (name,), decisions in self._decisions.children():
+            decision_count = decisions.value
+            cpu_saved = self._cpu_saved.labels(name).value
+            policies[name] = {
+                "decisions": decision_count,
+                "cpu_saved_ms": cpu_saved,
+                "avg_cpu_saved_ms": cpu_saved / decision_count if decision_count else 0.0
+            }
+        return {
+            "policies": policies,
+            "level_costs_ms": {level: cost.cost_ms for level, cost in self.level_costs.items()}
+        }
+
+
+if __name__ == "__main__":
+    engine = StepUpPolicyEngine()
+    print("Step-Up Authentication Policy Engine")
+
+    for risk, known in [(0.05, True), (0.35, True), (0.05, False), (0.8, True)]:
+        decision = engine.select(risk, {"known_device": known})
+        print(f"risk={risk:.2f} known_device={known} -> {decision.policy} "
+              f"levels={decision.levels} saved={decision.cpu_saved_ms:.2f}ms")
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        engine.select(0.05, {"known_device": True})
+    print(f"Policy evaluation: {(time.perf_counter() - start) * 10:.2f} µs per decision")
+    print(f"Metrics: {engine.get_metrics()}")
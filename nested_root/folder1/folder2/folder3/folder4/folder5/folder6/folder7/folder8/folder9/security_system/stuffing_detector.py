@@ -0,0 +1,474 @@
+"""
+Credential-Stuffing Detection
+- Streaming, fixed-memory view of authentication outcomes across all users
+- HyperLogLog: distinct usernames tried per source (for the heaviest failing sources)
+- Count-min sketches: attempts/failures per source, failures per username
+- SpaceSaving heavy hitters: the sources with the most failures
+- Sliding window (current + decayed previous window); constant cost per event
+"""
+
+import base64
+import hashlib
+import heapq
+import secrets
+import threading
+import time
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class HyperLogLog:
+    """Distinct-count estimator with 2^precision one-byte registers"""
+
+    def __init__(self, precision: int = 8):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self._shift = 64 - precision
+        self._mask = (1 << self._shift) - 1
+
+    def add(self, hash64: int):
+        index = hash64 >> self._shift
+        rank = self._shift - (hash64 & self._mask).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def clear(self):
+        self.registers[:] = bytes(len(self.registers))
+
+    @staticmethod
+    def estimate(registers: np.ndarray) -> float:
+        """Cardinality of a register array (bias-corrected, linear counting when small)"""
+        m = len(registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int32))))
+        zeros = int(np.count_nonzero(registers == 0))
+        if raw <= 2.5 * m and zeros:
+            return m * np.log(m / zeros)
+        return raw
+
+    def count(self) -> float:
+        return self.estimate(np.frombuffer(self.registers, dtype=np.uint8))
+
+    def union_count(self, other: "HyperLogLog") -> float:
+        """Distinct count of the union of two sketches"""
+        return self.estimate(np.maximum(np.frombuffer(self.registers, dtype=np.uint8),
+                                        np.frombuffer(other.registers, dtype=np.uint8)))
+
+
+class CountMinSketch:
+    """Frequency estimates (never under-counts) over the current and previous window"""
+
+    def __init__(self, width: int = 4096, depth: int = 4):
+        self.width = width
+        self.depth = depth
+        self.current = array("i", bytes(4 * width * depth))
+        self.previous = array("i", bytes(4 * width * depth))
+
+    def cells(self, hash128: int) -> List[int]:
+        """Counter positions of a key; sketches of equal shape share them"""
+        # Double hashing: row i uses h1 + i * h2
+        h1, h2 = hash128 >> 64, (hash128 & 0xFFFFFFFFFFFFFFFF) | 1
+        width = self.width
+        return [row * width + (h1 + row * h2) % width for row in range(self.depth)]
+
+    def cells_many(self, hashes: np.ndarray) -> np.ndarray:
+        """cells() for many keys: hashes is an (n, 2) uint64 array of high/low halves"""
+        # Reducing h1 and h2 modulo the width first keeps the sums within 64 bits
+        width = np.uint64(self.width)
+        h1 = hashes[:, 0] % width
+        h2 = (hashes[:, 1] | np.uint64(1)) % width
+        rows = np.arange(self.depth, dtype=np.uint64)
+        return (rows * width + (h1[:, None] + rows * h2[:, None]) % width).astype(np.intp)
+
+    def add(self, cells: List[int], amount: int = 1):
+        """Conservative update: only raise counters to the new minimum estimate"""
+        current = self.current
+        target = min(current[cell] for cell in cells) + amount
+        for cell in cells:
+            if current[cell] < target:
+                current[cell] = target
+
+    def estimate(self, cells: List[int], previous_weight: float = 0.0) -> float:
+        current, previous = self.current, self.previous
+        return min(current[cell] + previous_weight * previous[cell] for cell in cells)
+
+    def estimate_many(self, cells: np.ndarray, previous_weight: float = 0.0) -> np.ndarray:
+        """estimate() for an (n, depth) array of cells, gathered with NumPy"""
+        current = np.frombuffer(self.current, dtype=np.int32)[cells]
+        previous = np.frombuffer(self.previous, dtype=np.int32)[cells]
+        return (current + previous_weight * previous).min(axis=1)
+
+    def rotate(self, windows: int = 1):
+        """Start a new window; after a gap of several windows both are empty"""
+        self.previous = self.current if windows == 1 else array("i", bytes(4 * self.width * self.depth))
+        self.current = array("i", bytes(4 * self.width * self.depth))
+
+    def memory_bytes(self) -> int:
+        return 2 * self.current.itemsize * len(self.current)
+
+
+class SpaceSaving:
+    """Top-k heavy hitters; each tracked key carries a current/previous HyperLogLog pair"""
+
+    def __init__(self, capacity: int = 512, hll_precision: int = 8):
+        self.capacity = capacity
+        self.hll_precision = hll_precision
+        self.entries = {}  # key -> [count, error, current HLL, previous HLL]
+        self._heap = []  # (count, key); stale entries are fixed up lazily on eviction
+
+    def add(self, key: str, amount: int = 1) -> list:
+        """Count a key, evicting the smallest entry if the table is full; returns its entry"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            entry[0] += amount
+            return entry
+        error = 0
+        if len(self.entries) >= self.capacity:
+            error = self._evict()
+        # A newcomer inherits the evicted count as its error bound, but starts its
+        # HyperLogLogs empty: distinct counts are under- rather than over-estimated
+        entry = self.entries[key] = [error + amount, error, HyperLogLog(self.hll_precision),
+                                     HyperLogLog(self.hll_precision)]
+        heapq.heappush(self._heap, (entry[0], key))
+        return entry
+
+    def _evict(self) -> int:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            entry = self.entries[key]
+            if entry[0] == count:
+                del self.entries[key]
+                return count
+            heapq.heappush(self._heap, (entry[0], key))  # Count grew since it was pushed
+
+    def rotate(self, windows: int = 1):
+        """Halve counts (once per elapsed window) and roll each key's HyperLogLogs"""
+        for key, entry in list(self.entries.items()):
+            entry[0] >>= windows
+            entry[1] >>= windows
+            if windows == 1:
+                entry[2], entry[3] = entry[3], entry[2]
+                entry[2].clear()
+            else:
+                entry[2].clear()
+                entry[3].clear()
+        self._heap = [(entry[0], key) for key, entry in self.entries.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, k: int = 10) -> List[Tuple[str, int]]:
+        return heapq.nlargest(k, ((key, entry[0]) for key, entry in self.entries.items()),
+                              key=lambda item: item[1])
+
+
+class StuffingDetector:
+    def __init__(self, window_seconds: float = 600.0, sketch_width: int = 8192, sketch_depth: int = 4,
+                 user_sketch_width: int = 65536, heavy_hitters: int = 512, hll_precision: int = 8, spread_threshold: int = 10,
+                 volume_threshold: int = 100, user_failure_threshold: int = 10):
+        self.window_seconds = window_seconds
+        self.spread_threshold = spread_threshold  # Distinct usernames for full "spread" from one source
+        self.volume_threshold = volume_threshold  # Failures for full "volume" from one source
+        self.user_failure_threshold = user_failure_threshold  # Failures that make a username fully at risk
+        self._lock = threading.Lock()
+        self._key = secrets.token_bytes(16)  # Keyed hashing: attackers can't aim for sketch collisions
+        self.source_attempts = CountMinSketch(sketch_width, sketch_depth)
+        self.source_failures = CountMinSketch(sketch_width, sketch_depth)
+        # Stuffing spreads failures over huge numbers of usernames: this sketch needs to be wider
+        self.user_failures = CountMinSketch(user_sketch_width, sketch_depth)
+        self.failing_sources = SpaceSaving(heavy_hitters, hll_precision)
+        self.events = 0
+        self._window = None
+        self._window_start = 0.0
+
+    def _hash(self, value: str) -> int:
+        return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=16, key=self._key).digest(), "big")
+
+    def _hash_many(self, values: List[str]) -> np.ndarray:
+        """_hash() of many values as an (n, 2) uint64 array of high/low halves"""
+        blake2b, key = hashlib.blake2b, self._key
+        digests = b"".join(blake2b(value.encode(), digest_size=16, key=key).digest() for value in values)
+        return np.frombuffer(digests, dtype=">u8").reshape(-1, 2).astype(np.uint64)
+
+    def _advance(self, now: float):
+        """Rotate the sliding window if `now` falls in a later window (lock held)"""
+        window = int(now // self.window_seconds)
+        if self._window is None:
+            self._window = window
+        elif window > self._window:
+            elapsed = window - self._window
+            for sketch in (self.source_attempts, self.source_failures, self.user_failures):
+                sketch.rotate(elapsed)
+            self.failing_sources.rotate(elapsed)
+            self._window = window
+        self._window_start = window * self.window_seconds
+
+    def _previous_weight(self, now: float) -> float:
+        """Weight of the previous window: it fades out linearly across the current one"""
+        return max(0.0, 1.0 - (now - self._window_start) / self.window_seconds)
+
+    def observe(self, username: str, source: Optional[str], success: bool, timestamp: Optional[float] = None):
+        """Account one authentication outcome"""
+        now = time.time() if timestamp is None else timestamp
+        user_hash = self._hash(username)
+        source_hash = self._hash(source) if source is not None else None
+        with self._lock:
+            self._advance(now)
+            self.events += 1
+            if not success:
+                self.user_failures.add(self.user_failures.cells(user_hash))
+            if source_hash is None:
+                return
+            cells = self.source_attempts.cells(source_hash)
+            self.source_attempts.add(cells)
+            if success:
+                entry = self.failing_sources.entries.get(source)
+            else:
+                self.source_failures.add(cells)
+                entry = self.failing_sources.add(source)
+            if entry is not None:
+                entry[2].add(user_hash >> 64)
+
+    def distinct_usernames(self, source: str) -> float:
+        """Estimated distinct usernames tried from a source (0 if it isn't a heavy failing source)"""
+        with self._lock:
+            entry = self.failing_sources.entries.get(source)
+            if entry is None:
+                return 0.0
+            return entry[2].union_count(entry[3])
+
+    def source_risk(self, source: Optional[str], timestamp: Optional[float] = None) -> float:
+        """Risk of a source: failure rate scaled by how widely (or heavily) it fails"""
+        if source is None:
+            return 0.0
+        now = time.time() if timestamp is None else timestamp
+        cells = self.source_attempts.cells(self._hash(source))
+        with self._lock:
+            self._advance(now)
+            weight = self._previous_weight(now)
+            attempts = self.source_attempts.estimate(cells, weight)
+            failures = min(self.source_failures.estimate(cells, weight), attempts)
+            entry = self.failing_sources.entries.get(source)
+            distinct = entry[2].union_count(entry[3]) if entry is not None else 0.0
+        if not failures:
+            return 0.0
+        rate = failures / (attempts + 2.0)  # Smoothed so a single failure isn't a 100% rate
+        spread = min(1.0, distinct / self.spread_threshold)
+        volume = min(1.0, failures / self.volume_threshold)
+        return rate * max(spread, volume)
+
+    def user_risk(self, username: str, timestamp: Optional[float] = None) -> float:
+        """Risk of a username from its recent failures, whatever their source"""
+        now = time.time() if timestamp is None else timestamp
+        cells = self.user_failures.cells(self._hash(username))
+        with self._lock:
+            self._advance(now)
+            failures = self.user_failures.estimate(cells, self._previous_weight(now))
+        return min(1.0, failures / self.user_failure_threshold)
+
+    def user_risk_many(self, usernames: List[str], timestamp: Optional[float] = None) -> np.ndarray:
+        """user_risk() of many usernames: one lock acquisition and vectorized counter lookups"""
+        now = time.time() if timestamp is None else timestamp
+        cells = self.user_failures.cells_many(self._hash_many(usernames))
+        with self._lock:
+            self._advance(now)
+            failures = self.user_failures.estimate_many(cells, self._previous_weight(now))
+        return np.minimum(1.0, failures / self.user_failure_threshold).astype(np.float32)
+
+    def top_sources(self, k: int = 10) -> List[Dict[str, float]]:
+        """Heaviest failing sources with their estimated spread and risk"""
+        with self._lock:
+            top = self.failing_sources.top(k)
+        return [{"source": source, "failures": count, "distinct_usernames": round(self.distinct_usernames(source)),
+                 "risk": round(self.source_risk(source), 3)} for source, count in top]
+
+    def memory_bytes(self) -> int:
+        sketches = sum(sketch.memory_bytes() for sketch in
+                       (self.source_attempts, self.source_failures, self.user_failures))
+        per_entry = 2 * (1 << self.failing_sources.hll_precision) + 200  # Two HLLs plus entry overhead
+        return sketches + self.failing_sources.capacity * per_entry
+
+    def get_metrics(self) -> Dict[str, any]:
+        return {"events": self.events, "memory_bytes": self.memory_bytes(), "top_sources": self.top_sources(5)}
+
+    def save_state(self, writer, prefix: str = "stuffing"):
+        """Add the sketches (raw counters) and heavy-hitter table to a snapshot"""
+        with self._lock:
+            writer.add_secret(f"{prefix}.key", base64.b64encode(self._key).decode())
+            writer.add_json(f"{prefix}.state", {
+                "window_seconds": self.window_seconds,
+                "spread_threshold": self.spread_threshold,
+                "volume_threshold": self.volume_threshold,
+                "user_failure_threshold": self.user_failure_threshold,
+                "window": self._window,
+                "events": self.events,
+                "depth": self.source_attempts.depth,
+                "width": self.source_attempts.width,
+                "user_width": self.user_failures.width,
+                "heavy_hitters": self.failing_sources.capacity,
+                "hll_precision": self.failing_sources.hll_precision,
+                "entries": {
+                    source: [count, error, base64.b64encode(current.registers).decode(),
+                             base64.b64encode(previous.registers).decode()]
+                    for source, (count, error, current, previous) in self.failing_sources.entries.items()
+                }
+            })
+            for name in ("source_attempts", "source_failures", "user_failures"):
+                sketch = getattr(self, name)
+                writer.add_array(f"{prefix}.{name}.current", np.frombuffer(sketch.current, dtype=np.int32))
+                writer.add_array(f"{prefix}.{name}.previous", np.frombuffer(sketch.previous, dtype=np.int32))
+
+    @classmethod
+    def load_state(cls, reader, prefix: str = "stuffing") -> "StuffingDetector":
+        """Rebuild the detector from a snapshot"""
+        state = reader.json(f"{prefix}.state")
+        detector = cls(state["window_seconds"], state["width"], state["depth"], state["user_width"],
+                       state["heavy_hitters"], state["hll_precision"], state["spread_threshold"],
+                       state["volume_threshold"], state["user_failure_threshold"])
+        detector._key = base64.b64decode(reader.secret(f"{prefix}.key"))
+        detector._window = state["window"]
+        if detector._window is not None:
+            detector._window_start = detector._window * detector.window_seconds
+        detector.events = state["events"]
+        for name in ("source_attempts", "source_failures", "user_failures"):
+            sketch = getattr(detector, name)
+            sketch.current = array("i", reader.array(f"{prefix}.{name}.current").tobytes())
+            sketch.previous = array("i", reader.array(f"{prefix}.{name}.previous").tobytes())
+        table = detector.failing_sources
+        for source, (count, error, current, previous) in state["entries"].items():
+            entry = table.entries[source] = [count, error, HyperLogLog(table.hll_precision),
+                                             HyperLogLog(table.hll_precision)]
+            entry[2].registers[:] = base64.b64decode(current)
+            entry[3].registers[:] = base64.b64decode(previous)
+        table._heap = [(entry[0], source) for source, entry in table.entries.items()]
+        heapq.heapify(table._heap)
+        return detector
+
+
+def _synthetic_trace(rng: np.random.Generator, start: float, duration: float):
+    """Legitimate traffic plus a concentrated and a low-and-slow stuffing attack.
+
+    Returns (events, labels): events are (username, source, success, timestamp),
+    labels map each source to "legit", "botnet" or "low_and_slow".
+    """
+    events, labels = [], {}
+    # 20k users logging in from home IPs, 3% typos; 20 corporate NATs shared by 300 users each
+    for i in range(20000):
+        source = f"10.{i // 250}.{i % 250}.1"
+        labels[source] = "legit"
+        for _ in range(rng.integers(1, 8)):
+            events.append((f"user{i}", source, rng.random() > 0.03, start + rng.random() * duration))
+    for nat in range(20):
+        source = f"172.16.0.{nat}"
+        labels[source] = "legit"
+        for i in rng.integers(0, 20000, 300 * 4):
+            events.append((f"user{i}", source, rng.random() > 0.05, start + rng.random() * duration))
+    # Botnet: 30 sources, 2000 leaked usernames each, 98% failures
+    for bot in range(30):
+        source = f"203.0.113.{bot}"
+        labels[source] = "botnet"
+        for i in rng.integers(0, 1_000_000, 2000):
+            events.append((f"leaked{i}", source, rng.random() > 0.98, start + rng.random() * duration))
+    # Low and slow: 400 sources, 40 usernames each (some real), 95% failures
+    for bot in range(400):
+        source = f"198.51.{bot // 250}.{bot % 250}"
+        labels[source] = "low_and_slow"
+        for i in rng.integers(0, 40000, 40):
+            username = f"user{i}" if i < 20000 else f"leaked{i}"
+            events.append((username, source, rng.random() > 0.95, start + rng.random() * duration))
+    events.sort(key=lambda event: event[3])
+    return events, labels
+
+
+def benchmark(seed: int = 0) -> Dict[str, any]:
+    """Run the detector over a synthetic trace and score it against exact counts"""
+    rng = np.random.default_rng(seed)
+    detector = StuffingDetector()
+    # Five minutes at the start of a window, so exact counts and the sliding window agree
+    start_time = time.time() // detector.window_seconds * detector.window_seconds
+    now = start_time + 300
+    events, labels = _synthetic_trace(rng, start_time, 300)
+
+    start = time.perf_counter()
+    for username, source, success, timestamp in events:
+        detector.observe(username, source, success, timestamp)
+    per_event_us = (time.perf_counter() - start) / len(events) * 1e6
+
+    exact_failures, exact_distinct, exact_user_failures = {}, {}, {}
+    for username, source, success, _ in events:
+        if not success:
+            exact_failures[source] = exact_failures.get(source, 0) + 1
+            exact_user_failures[username] = exact_user_failures.get(username, 0) + 1
+        exact_distinct.setdefault(source, set()).add(username)
+
+    # Accuracy of the sketches on the sources they track
+    hll_errors, cms_errors = [], []
+    for source in detector.failing_sources.entries:
+        if detector.failing_sources.entries[source][1] == 0:  # Tracked since its first failure
+            hll_errors.append(abs(detector.distinct_usernames(source) - len(exact_distinct[source]))
+                              / len(exact_distinct[source]))
+    for source, failures in exact_failures.items():
+        cells = detector.source_failures.cells(detector._hash(source))
+        cms_errors.append(detector.source_failures.estimate(cells) - failures)
+    for username, failures in exact_user_failures.items():
+        cells = detector.user_failures.cells(detector._hash(username))
+        cms_errors.append(detector.user_failures.estimate(cells) - failures)
+    # SpaceSaving bounds: a tracked count never under-counts, and count - error never over-counts
+    bound_violations = sum(not entry[0] - entry[1] <= exact_failures.get(source, 0) <= entry[0]
+                           for source, entry in detector.failing_sources.entries.items())
+    heavy = sorted(exact_failures, key=exact_failures.get, reverse=True)[:30]
+    reported = {source for source, _ in detector.failing_sources.top(30)}
+
+    flagged = {source for source in labels if detector.source_risk(source, now) > 0.5}
+    def recall(kind):
+        sources = [source for source, label in labels.items() if label == kind]
+        return len(flagged.intersection(sources)) / len(sources)
+    legit = [source for source, label in labels.items() if label == "legit"]
+    real_users = [f"user{i}" for i in range(20000)]
+    start = time.perf_counter()
+    batched = detector.user_risk_many(real_users, now)
+    batched_us = (time.perf_counter() - start) / len(real_users) * 1e6
+    batch_mismatches = int(np.count_nonzero(
+        batched != np.array([detector.user_risk(username, now) for username in real_users], dtype=np.float32)))
+    at_risk = {username for username, risk in zip(real_users, batched) if risk >= 0.3}
+    truly_at_risk = {username for username in real_users if exact_user_failures.get(username, 0) >= 3}
+    return {
+        "events": len(events),
+        "per_event_us": per_event_us,
+        "memory_bytes": detector.memory_bytes(),
+        "hll_mean_relative_error": float(np.mean(hll_errors)),
+        "cms_mean_overcount": float(np.mean(cms_errors)),
+        "cms_min_overcount": float(np.min(cms_errors)),
+        "heavy_hitter_bound_violations": bound_violations,
+        "heavy_hitter_recall": len(reported.intersection(heavy)) / len(heavy),
+        "botnet_recall": recall("botnet"),
+        "low_and_slow_recall": recall("low_and_slow"),
+        "legit_false_positive_rate": len(flagged.intersection(legit)) / len(legit),
+        "users_at_risk": len(at_risk),
+        "users_at_risk_exact": len(truly_at_risk),
+        "user_risk_precision": len(at_risk & truly_at_risk) / max(len(at_risk), 1),
+        "user_risk_many_us": batched_us,
+        "user_risk_many_mismatches": batch_mismatches
+    }
+
+
+if __name__ == "__main__":
+    print("Credential-Stuffing Detection")
+    stats = benchmark()
+    print(f"{stats['events']:,} events: {stats['per_event_us']:.1f} µs per event, "
+          f"{stats['memory_bytes'] // 1024} KB fixed memory")
+    print(f"HyperLogLog mean relative error: {stats['hll_mean_relative_error']:.1%}; "
+          f"count-min mean overcount: {stats['cms_mean_overcount']:.2f} failures")
+    print(f"Heavy-hitter recall (top 30 failing sources): {stats['heavy_hitter_recall']:.0%}")
+    print(f"Flagged (risk > 0.5): botnet {stats['botnet_recall']:.0%}, "
+          f"low-and-slow {stats['low_and_slow_recall']:.0%}, "
+          f"legitimate false positives {stats['legit_false_positive_rate']:.2%}")
+    print(f"Real users with 3+ recent failures: {stats['users_at_risk']} flagged, "
+          f"{stats['users_at_risk_exact']} exact ({stats['user_risk_precision']:.0%} precision)")
+    print(f"user_risk_many: {stats['user_risk_many_us']:.2f} µs per user, "
+          f"matches user_risk: {stats['user_risk_many_mismatches'] == 0}")
+    print(f"Invariants: count-min never under-counts: {stats['cms_min_overcount'] >= 0}; "
+          f"heavy-hitter counts within their error bounds: {stats['heavy_hitter_bound_violations'] == 0}")
+    assert stats["cms_min_overcount"] >= 0, "a count-min estimate fell below the exact count"
+    assert stats["heavy_hitter_bound_violations"] == 0, "a heavy-hitter count left its error bounds"
+    assert stats["user_risk_many_mismatches"] == 0, "user_risk_many disagrees with user_risk"
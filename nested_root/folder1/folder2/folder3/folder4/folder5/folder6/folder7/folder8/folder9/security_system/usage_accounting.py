@@ -0,0 +1,199 @@
+"""
+Encryption Usage Accounting
+- Fixed-size, time-bucketed rollups per user (no per-call records)
+- Counts, byte totals and min/max record size per bucket
+- Compact NumPy arrays: users x retained buckets, reused as a ring
+- int32 columns (int64 byte totals); 15-minute buckets by default
+- Range queries per user and across all users
+"""
+
+import threading
+import time
+import numpy as np
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+ROLLUP_FIELDS = ("count", "bytes", "min_size", "max_size")
+# Byte totals can pass 2 GiB per bucket; everything else fits in 32 bits
+ROLLUP_DTYPES = {"count": np.int32, "bytes": np.int64, "min_size": np.int32, "max_size": np.int32}
+
+
+class UsageAccounting:
+    def __init__(self, bucket_seconds: int = 900, retention_buckets: int = 96, capacity: int = 64,
+                 clock: Callable[[], float] = time.time):
+        self.bucket_seconds = bucket_seconds
+        self.retention_buckets = retention_buckets  # Default: one day of 15-minute buckets
+        self.clock = clock  # Injectable for deterministic replay
+        self._lock = threading.Lock()
+        self.index = {}  # username -> row
+        self.usernames = []
+        self.size = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity: int):
+        """Allocate (or grow) the rollup arrays to hold `capacity` users"""
+        shape = (capacity, self.retention_buckets)
+        bucket_ids = np.full(shape, -1, dtype=np.int32)  # Which bucket a slot currently holds
+        columns = {name: np.zeros(shape, dtype=dtype) for name, dtype in ROLLUP_DTYPES.items()}
+        if self.size:
+            bucket_ids[:self.size] = self.bucket_ids[:self.size]
+            for name in ROLLUP_FIELDS:
+                columns[name][:self.size] = self.columns[name][:self.size]
+        self.bucket_ids = bucket_ids
+        self.columns = columns
+
+    def _row(self, username: str) -> int:
+        """Row of a user, adding it if missing (lock held)"""
+        row = self.index.get(username)
+        if row is None:
+            if self.size == len(self.bucket_ids):
+                self._allocate(max(2 * self.size, 1))
+            row = self.size
+            self.usernames.append(username)
+            self.index[username] = row
+            self.size += 1
+        return row
+
+    def record(self, username: str, sizes: Union[int, Sequence[int]], timestamp: Optional[float] = None):
+        """Account one call (an int size) or a batch of record sizes"""
+        bucket = int((self.clock() if timestamp is None else timestamp) // self.bucket_seconds)
+        slot = bucket % self.retention_buckets
+        if isinstance(sizes, int):
+            count, total, smallest, largest = 1, sizes, sizes, sizes
+        else:
+            sizes = np.asarray(sizes, dtype=np.int64)
+            if not len(sizes):
+                return
+            count, total, smallest, largest = len(sizes), int(sizes.sum()), int(sizes.min()), int(sizes.max())
+
+        with self._lock:
+            row = self._row(username)
+            columns = self.columns
+            if self.bucket_ids[row, slot] != bucket:
+                if self.bucket_ids[row, slot] > bucket:
+                    return  # Older than the retention window
+                # The slot held an expired bucket: start a fresh rollup
+                self.bucket_ids[row, slot] = bucket
+                columns["count"][row, slot] = count
+                columns["bytes"][row, slot] = total
+                columns["min_size"][row, slot] = smallest
+                columns["max_size"][row, slot] = largest
+                return
+            columns["count"][row, slot] += count
+            columns["bytes"][row, slot] += total
+            columns["min_size"][row, slot] = min(columns["min_size"][row, slot], smallest)
+            columns["max_size"][row, slot] = max(columns["max_size"][row, slot], largest)
+
+    def _window(self, start: Optional[float], end: Optional[float]) -> np.ndarray:
+        """Mask of slots (per row) whose bucket lies in [start, end]"""
+        now_bucket = int(self.clock() // self.bucket_seconds)
+        first = now_bucket - self.retention_buckets + 1 if start is None else int(start // self.bucket_seconds)
+        last = now_bucket if end is None else int(end // self.bucket_seconds)
+        bucket_ids = self.bucket_ids[:self.size]
+        return (bucket_ids >= first) & (bucket_ids <= last)
+
+    def _rollup(self, rows, mask: np.ndarray) -> Dict[str, np.ndarray]:
+        """Aggregate selected rows over the masked slots"""
+        counts = np.where(mask, self.columns["count"][rows], 0)
+        totals = np.where(mask, self.columns["bytes"][rows], 0)
+        used = mask & (counts > 0)
+        min_sizes = self.columns["min_size"][rows]
+        smallest = np.where(used, min_sizes, np.iinfo(min_sizes.dtype).max).min(axis=-1)
+        largest = np.where(used, self.columns["max_size"][rows], 0).max(axis=-1)
+        count = counts.sum(axis=-1)
+        return {
+            "count": count,
+            "bytes": totals.sum(axis=-1),
+            "min_size": np.where(count > 0, smallest, 0),
+            "max_size": largest
+        }
+
+    def query(self, username: str, start: Optional[float] = None, end: Optional[float] = None) -> Dict[str, int]:
+        """Usage of one user between two timestamps (default: whole retention window)"""
+        row = self.index.get(username)
+        if row is None:
+            return {"count": 0, "bytes": 0, "min_size": 0, "max_size": 0}
+        with self._lock:
+            mask = self._window(start, end)[row]
+            rollup = self._rollup(row, mask)
+        return {name: int(value) for name, value in rollup.items()}
+
+    def series(self, username: str, start: Optional[float] = None,
+               end: Optional[float] = None) -> List[Dict[str, any]]:
+        """Per-bucket rollups of one user in time order"""
+        row = self.index.get(username)
+        if row is None:
+            return []
+        with self._lock:
+            mask = self._window(start, end)[row] & (self.columns["count"][row] > 0)
+            slots = np.flatnonzero(mask)
+            slots = slots[np.argsort(self.bucket_ids[row, slots])]
+            return [
+                {"start": float(self.bucket_ids[row, slot] * self.bucket_seconds),
+                 **{name: int(self.columns[name][row, slot]) for name in ROLLUP_FIELDS}}
+                for slot in slots
+            ]
+
+    def query_all(self, start: Optional[float] = None, end: Optional[float] = None,
+                  top: int = 10) -> Dict[str, Dict[str, int]]:
+        """Usage of the heaviest users (by bytes) in one vectorized pass"""
+        with self._lock:
+            if not self.size:
+                return {}
+            rollup = self._rollup(slice(0, self.size), self._window(start, end))
+            order = np.argsort(rollup["bytes"])[::-1][:top]
+            return {
+                self.usernames[row]: {name: int(values[row]) for name, values in rollup.items()}
+                for row in order if rollup["count"][row] > 0
+            }
+
+    def save_state(self, writer, prefix: str = "usage"):
+        """Add the rollup arrays (raw) to a snapshot"""
+        with self._lock:
+            writer.add_json(f"{prefix}.config", {"bucket_seconds": self.bucket_seconds,
+                                                 "retention_buckets": self.retention_buckets,
+                                                 "usernames": list(self.usernames)})
+            writer.add_array(f"{prefix}.bucket_ids", self.bucket_ids[:self.size])
+            for name in ROLLUP_FIELDS:
+                writer.add_array(f"{prefix}.{name}", self.columns[name][:self.size])
+
+    @classmethod
+    def load_state(cls, reader, prefix: str = "usage",
+                   clock: Callable[[], float] = time.time) -> "UsageAccounting":
+        """Rebuild rollups from a snapshot; arrays are memory-mapped copy-on-write"""
+        config = reader.json(f"{prefix}.config")
+        usage = cls(config["bucket_seconds"], config["retention_buckets"], capacity=1, clock=clock)
+        usage.usernames = config["usernames"]
+        usage.index = dict(zip(usage.usernames, range(len(usage.usernames))))
+        usage.size = len(usage.usernames)
+        usage.bucket_ids = reader.array(f"{prefix}.bucket_ids")
+        usage.columns = {name: reader.array(f"{prefix}.{name}") for name in ROLLUP_FIELDS}
+        return usage
+
+    def memory_bytes(self) -> int:
+        """Bytes held by the rollup arrays (independent of traffic volume)"""
+        return self.bucket_ids.nbytes + sum(column.nbytes for column in self.columns.values())
+
+
+if __name__ == "__main__":
+    print("Encryption Usage Accounting")
+    now = time.time()
+    usage = UsageAccounting(bucket_seconds=60, retention_buckets=60, clock=lambda: now)
+    rng = np.random.default_rng(0)
+
+    calls = 200000
+    timestamps = now - rng.uniform(0, 7200, calls)  # Two hours of traffic, one hour retained
+    sizes = rng.integers(16, 4096, calls)
+    users = rng.choice(["admin", "user", "service"], calls)
+    start = time.perf_counter()
+    for username, size, timestamp in zip(users.tolist(), sizes.tolist(), timestamps.tolist()):
+        usage.record(username, size, timestamp)
+    elapsed = time.perf_counter() - start
+
+    print(f"Recorded {calls} calls: {elapsed / calls * 1e6:.2f} µs per call, "
+          f"{usage.memory_bytes()} bytes of rollups (per-call dicts: ~{calls * 400 // 1024} KB)")
+    print(f"admin, last 10 minutes: {usage.query('admin', now - 600, now)}")
+    print(f"admin, buckets in last 3 minutes: {len(usage.series('admin', now - 180, now))}")
+    print(f"Heaviest users: {usage.query_all(top=2)}")
+    day = UsageAccounting()
+    day.record("admin", 100)
+    print(f"Default rollups (one day of 15-minute buckets): {day.memory_bytes() // 64} bytes per user")
@@ -0,0 +1,215 @@
+"""
+User Registry
+- One compact __slots__ record per user, shared by all five levels
+- Records hold scalars and row references into array-backed stores
+  (biometric template rows, neural signature rows)
+- One hash lookup per login: the orchestrator fetches the record once
+- Field views keep the legacy username-keyed dict attributes working
+"""
+
+import sys
+import threading
+import time
+import tracemalloc
+from collections.abc import MutableMapping
+from typing import Callable, Dict, Iterator, Optional
+
+# Per-user state, grouped by the level that owns it
+RECORD_FIELDS = (
+    "password_hash", "failed_attempts",  # Level 1
+    "totp_secret", "verification_code", "backup_codes",  # Level 2
+    "template_row", "behavioral_pattern",  # Level 3
+    "keys", "retired_keys", "rotation_schedule", "zkp_public_key",  # Level 4
+    "quantum_key", "behavior_model", "neural_row", "threat_detection", "adaptive_response",  # Level 5
+    "known_devices"  # Orchestrator
+)
+
+
+class UserRecord:
+    """All per-user state in one object; None means "not set" for every field"""
+
+    __slots__ = ("username",) + RECORD_FIELDS
+
+    def __init__(self, username: str):
+        self.username = username
+        for field in RECORD_FIELDS:
+            setattr(self, field, None)
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in RECORD_FIELDS
+                           if getattr(self, field) is not None)
+        return f"UserRecord({self.username!r}, {fields})"
+
+
+class FieldView(MutableMapping):
+    """A username-keyed mapping over one record field (optionally transformed, then read-only)"""
+
+    def __init__(self, registry: "UserRegistry", field: str, transform: Optional[Callable] = None):
+        self._registry = registry
+        self._field = field
+        self._transform = transform
+
+    def _value(self, record: Optional[UserRecord]):
+        value = None if record is None else getattr(record, self._field)
+        if value is not None and self._transform is not None:
+            value = self._transform(value)
+        return value
+
+    def __getitem__(self, username: str):
+        value = self._value(self._registry.get(username))
+        if value is None:
+            raise KeyError(username)
+        return value
+
+    def get(self, username: str, default=None):
+        value = self._value(self._registry.get(username))
+        return default if value is None else value
+
+    def __contains__(self, username) -> bool:
+        return self._value(self._registry.get(username)) is not None
+
+    def __setitem__(self, username: str, value):
+        if self._transform is not None:
+            raise TypeError(f"{self._field} view is read-only")
+        setattr(self._registry.record(username), self._field, value)
+
+    def __delitem__(self, username: str):
+        record = self._registry.get(username)
+        if record is None or getattr(record, self._field) is None:
+            raise KeyError(username)
+        setattr(record, self._field, None)
+
+    def __iter__(self) -> Iterator[str]:
+        field = self._field
+        return iter([username for username, record in list(self._registry.items())
+                     if getattr(record, field) is not None])
+
+    def __len__(self) -> int:
+        field = self._field
+        return sum(getattr(record, field) is not None for record in list(self._registry.records()))
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+
+class UserRegistry:
+    def __init__(self):
+        self._records = {}  # username -> UserRecord
+        self._lock = threading.Lock()  # Only taken to create a record
+
+    def get(self, username: str) -> Optional[UserRecord]:
+        return self._records.get(username)
+
+    def record(self, username: str) -> UserRecord:
+        """The user's record, created if missing"""
+        record = self._records.get(username)
+        if record is None:
+            with self._lock:
+                record = self._records.get(username)
+                if record is None:
+                    record = self._records[username] = UserRecord(username)
+        return record
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._records
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._records))
+
+    def items(self):
+        return self._records.items()
+
+    def records(self):
+        return self._records.values()
+
+    def view(self, field: str, transform: Optional[Callable] = None) -> FieldView:
+        if field not in RECORD_FIELDS:
+            raise ValueError(f"Unknown user record field: {field}")
+        return FieldView(self, field, transform)
+
+
+def _sample_state(i: int) -> Dict[str, object]:
+    """Representative per-user values (shared by both layouts, so only containers are compared)"""
+    return {
+        "password_hash": f"{i:064x}",
+        "failed_attempts": (1700000000.0 + i, 1) if i % 10 == 0 else None,
+        "totp_secret": f"SECRET{i:010d}",
+        "backup_codes": [f"{i % 999999:06d}"],
+        "template_row": i,
+        "keys": ("keyset", i),
+        "rotation_schedule": {"symmetric": 1700000000.0},
+        "zkp_public_key": i * 7919,
+        "quantum_key": bytes(256),
+        "behavior_model": {"access_patterns": []},
+        "neural_row": i,
+        "threat_detection": {"quantum_anomaly_score": 0.0},
+        "known_devices": {f"device{i}"}
+    }
+
+
+def measure_bytes_per_user(users: int = 100000) -> Dict[str, float]:
+    """Container bytes per user: one dict per field (the old layout) vs one registry record"""
+    usernames = [f"user{i}" for i in range(users)]
+    states = [_sample_state(i) for i in range(users)]
+    fields = list(states[0])
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    dicts = {field: {} for field in fields}
+    for username, state in zip(usernames, states):
+        for field, value in state.items():
+            if value is not None:
+                dicts[field][username] = value
+    dict_bytes = tracemalloc.get_traced_memory()[0] - before
+
+    before = tracemalloc.get_traced_memory()[0]
+    registry = UserRegistry()
+    for username, state in zip(usernames, states):
+        record = registry.record(username)
+        for field, value in state.items():
+            setattr(record, field, value)
+    registry_bytes = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    # A login reads most fields: one lookup per field vs one lookup in total
+    sample = usernames[::97]
+    start = time.perf_counter()
+    for username in sample:
+        for field in fields:
+            dicts[field].get(username)
+    dict_seconds = time.perf_counter() - start
+    start = time.perf_counter()
+    for username in sample:
+        record = registry.get(username)
+        for field in fields:
+            getattr(record, field)
+    registry_seconds = time.perf_counter() - start
+
+    return {
+        "users": users,
+        "fields": len(fields),
+        "dict_bytes_per_user": dict_bytes / users,
+        "registry_bytes_per_user": registry_bytes / users,
+        "record_size": sys.getsizeof(registry.get(usernames[0])),
+        "dict_lookup_ns": dict_seconds / len(sample) * 1e9,
+        "registry_lookup_ns": registry_seconds / len(sample) * 1e9
+    }
+
+
+if __name__ == "__main__":
+    print("User Registry")
+    registry = UserRegistry()
+    registry.record("admin").password_hash = "ab" * 32
+    passwords = registry.view("password_hash")
+    print(f"Legacy view: 'admin' in passwords: {'admin' in passwords}, users: {list(passwords)}")
+
+    stats = measure_bytes_per_user()
+    print(f"{stats['users']:,} users x {stats['fields']} fields: "
+          f"{stats['dict_bytes_per_user']:.0f} bytes/user in parallel dicts vs "
+          f"{stats['registry_bytes_per_user']:.0f} bytes/user in records "
+          f"({stats['record_size']}-byte record)")
+    print(f"Reading a user's fields: {stats['dict_lookup_ns']:.0f} ns with per-field lookups vs "
+          f"{stats['registry_lookup_ns']:.0f} ns with one registry lookup")
@@ -2,153 +2,499 @@
 """
 Python script to launch EchoBooster application
 This script opens a terminal and runs the EchoBooster application
+
+A manifest next to this script caches the resolved executable and terminal,
+plus content hashes of the EchoBooster sources, so repeated launches skip
+path probing and reuse the last good build while the sources are unchanged.
+
+With --supervise (headless Linux boxes) the app runs without a terminal, is
+restarted with exponential backoff when it crashes, and its CPU, RSS, thread
+and fd counts are sampled from /proc into a ring buffer and a rolling file.
 """
 
 import os
 import sys
+import json
+import time
+import signal
+import struct
+import argparse
+import shutil
+import hashlib
 import subprocess
 import platform
 from pathlib import Path
 
+LAUNCH_START = time.perf_counter()
+
+MANIFEST_NAME = ".echo-launcher-manifest.json"
+MANIFEST_VERSION = 1
+BUILD_DIR_NAME = ".echo-build"
+SOURCE_SUFFIXES = {".cs", ".xaml", ".csproj", ".json", ".resx", ".props", ".targets"}
+TERMINALS = ['gnome-terminal', 'konsole', 'xfce4-terminal', 'xterm']
+
+# Resource sample: timestamp, pid, CPU percent of one core, RSS bytes, threads, open fds
+SAMPLE = struct.Struct("<dIfQII")
+SAMPLES_FILE_NAME = ".echo-samples.bin"
+
+POSSIBLE_PATHS = [
+    # Current directory
+    "./EchoBooster.exe",
+    "./EchoBooster",
+
+    # Subdirectories
+    "./EchoBooster/bin/Release/net6.0-windows/EchoBooster.exe",
+    "./EchoBooster/bin/Debug/net6.0-windows/EchoBooster.exe",
+    "./EchoBooster/bin/Release/net6.0/EchoBooster",
+    "./EchoBooster/bin/Debug/net6.0/EchoBooster",
+
+    # Parent directory
+    "../EchoBooster.exe",
+    "../EchoBooster",
+
+    # Common build locations
+    "./bin/Release/net6.0-windows/EchoBooster.exe",
+    "./bin/Debug/net6.0-windows/EchoBooster.exe",
+    "./bin/Release/net6.0/EchoBooster",
+    "./bin/Debug/net6.0/EchoBooster",
+]
+
+
+def load_manifest(script_dir):
+    """Load the launcher manifest (an empty one if missing or outdated)"""
+    try:
+        with open(script_dir / MANIFEST_NAME) as handle:
+            manifest = json.load(handle)
+        if manifest.get("version") == MANIFEST_VERSION:
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"version": MANIFEST_VERSION}
+
 
-def find_echo_booster_executable():
-    """Find the EchoBooster executable in common locations"""
-    possible_paths = [
-        # Current directory
-        "./EchoBooster.exe",
-        "./EchoBooster",
-        
-        # Subdirectories
-        "./EchoBooster/bin/Release/net6.0-windows/EchoBooster.exe",
-        "./EchoBooster/bin/Debug/net6.0-windows/EchoBooster.exe",
-        "./EchoBooster/bin/Release/net6.0/EchoBooster",
-        "./EchoBooster/bin/Debug/net6.0/EchoBooster",
-        
-        # Parent directory
-        "../EchoBooster.exe",
-        "../EchoBooster",
-        
-        # Common build locations
-        "./bin/Release/net6.0-windows/EchoBooster.exe",
-        "./bin/Debug/net6.0-windows/EchoBooster.exe",
-        "./bin/Release/net6.0/EchoBooster",
-        "./bin/Debug/net6.0/EchoBooster",
-    ]
-    
+def save_manifest(script_dir, manifest):
+    """Write the manifest atomically so a crashed launch never leaves it half-written"""
+    path = script_dir / MANIFEST_NAME
+    temporary = path.with_suffix(".tmp")
+    try:
+        with open(temporary, "w") as handle:
+            json.dump(manifest, handle, indent=2)
+        os.replace(temporary, path)
+    except OSError as e:
+        print(f"Could not save launcher manifest: {e}")
+
+
+def hash_sources(project_dir, cached_files=None):
+    """Content hash of the project sources.
+
+    Files whose size and modification time match the manifest reuse their
+    recorded hash, so an unchanged tree costs one stat() per file.
+    Returns (overall digest, {relative path: [mtime_ns, size, sha256]}).
+    """
+    cached_files = cached_files or {}
+    files = {}
+    for root, dirs, names in os.walk(project_dir):
+        dirs[:] = sorted(d for d in dirs if d not in ("bin", "obj") and not d.startswith("."))
+        for name in sorted(names):
+            path = Path(root) / name
+            if path.suffix not in SOURCE_SUFFIXES:
+                continue
+            relative = path.relative_to(project_dir).as_posix()
+            stat = path.stat()
+            cached = cached_files.get(relative)
+            if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+                files[relative] = cached
+            else:
+                files[relative] = [stat.st_mtime_ns, stat.st_size, hashlib.sha256(path.read_bytes()).hexdigest()]
+
+    overall = hashlib.sha256()
+    for relative in sorted(files):
+        overall.update(f"{relative}\0{files[relative][2]}\n".encode())
+    return overall.hexdigest(), files
+
+
+def find_echo_booster_executable(manifest=None):
+    """Find the EchoBooster executable (the manifest's cached path first, then common locations)"""
     script_dir = Path(__file__).parent.absolute()
-    
-    for path in possible_paths:
+
+    cached = (manifest or {}).get("executable")
+    if cached and os.path.isfile(cached):
+        return cached
+
+    for path in POSSIBLE_PATHS:
         full_path = script_dir / path
-        if full_path.exists():
+        if full_path.is_file():  # ./EchoBooster may be the project directory
+            if manifest is not None:
+                manifest["executable"] = str(full_path)
             return str(full_path)
-    
+
+    return None
+
+
+def find_terminal(manifest=None):
+    """Resolve a terminal emulator with shutil.which (no subprocesses), cached in the manifest"""
+    cached = (manifest or {}).get("terminal")
+    if cached and os.access(cached, os.X_OK):
+        return cached
+
+    for terminal in TERMINALS:
+        path = shutil.which(terminal)
+        if path:
+            if manifest is not None:
+                manifest["terminal"] = path
+            return path
     return None
 
 
+def build_from_source(script_dir, manifest, timings):
+    """Return a launch command for a build of the current sources, building only if they changed"""
+    project_dir = script_dir / "EchoBooster"
+    project_path = project_dir / "EchoBooster.csproj"
+    if not project_path.exists():
+        print("EchoBooster project not found.")
+        return None
+
+    start = time.perf_counter()
+    digest, files = hash_sources(project_dir, manifest.get("source_files"))
+    timings["hash_sources"] = time.perf_counter() - start
+
+    build = manifest.get("build") or {}
+    command = build.get("command")
+    if build.get("sources_digest") == digest and command and os.path.exists(command[-1]):
+        print("Sources unchanged since the last build, reusing it")
+        manifest["source_files"] = files
+        return command
+
+    dotnet = shutil.which("dotnet")
+    if dotnet is None:
+        print("DotNet SDK not found. Please install .NET SDK to run from source.")
+        return None
+
+    print("Sources changed, building EchoBooster...")
+    output_dir = script_dir / BUILD_DIR_NAME
+    start = time.perf_counter()
+    result = subprocess.run([dotnet, 'build', str(project_path), '-c', 'Release', '-o', str(output_dir)])
+    timings["build"] = time.perf_counter() - start
+    if result.returncode != 0:
+        print("Build failed.")
+        return None
+
+    # Prefer the native app host; fall back to running the assembly through dotnet
+    app_host = output_dir / ("EchoBooster.exe" if platform.system() == "Windows" else "EchoBooster")
+    command = [str(app_host)] if app_host.exists() else [dotnet, str(output_dir / "EchoBooster.dll")]
+    manifest["source_files"] = files
+    manifest["build"] = {"sources_digest": digest, "command": command, "built_at": time.time()}
+    return command
+
+
+def launch(command, terminal, cwd=None):
+    """Start a command, in a terminal window where one is available"""
+    if platform.system() == "Windows":
+        # On Windows
+        return subprocess.Popen(command, shell=True, cwd=cwd)
+    elif len(command) > 1:
+        # `open -a Terminal` and `<terminal> -e` take a single program, so a
+        # multi-argument command (dotnet <dll>) runs directly
+        return subprocess.Popen(command, cwd=cwd)
+    elif platform.system() == "Darwin":  # macOS
+        # On macOS, try to open in Terminal
+        return subprocess.Popen(['open', '-a', 'Terminal'] + command, cwd=cwd)
+    elif terminal:  # Linux
+        return subprocess.Popen([terminal, '-e'] + command, cwd=cwd)
+    else:
+        # Fallback: run directly
+        return subprocess.Popen(command, cwd=cwd)
+
+
+def report_ready(manifest, timings):
+    """Print and record the launch-to-ready time"""
+    total = time.perf_counter() - LAUNCH_START
+    details = ", ".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in timings.items())
+    print(f"Ready in {total * 1000:.1f} ms" + (f" ({details})" if details else ""))
+    manifest["last_launch"] = {"ready_ms": total * 1000, "at": time.time()}
+
+
+def resolve_command(script_dir, manifest, timings):
+    """The command that runs EchoBooster: a found executable, or a (cached) build"""
+    start = time.perf_counter()
+    exe_path = find_echo_booster_executable(manifest)
+    timings["resolve"] = time.perf_counter() - start
+
+    if exe_path:
+        print(f"Found EchoBooster at: {exe_path}")
+        return [exe_path]
+    print("EchoBooster executable not found!")
+    print("Attempting to build and run from source...")
+    return build_from_source(script_dir, manifest, timings)
+
+
+class ProcSampler:
+    """Low-overhead /proc/<pid> sampler writing into a ring buffer and a rolling file"""
+
+    def __init__(self, ring_size=3600, samples_file=None, max_file_bytes=8 * 1024 * 1024, flush_every=16):
+        self.ring = bytearray(ring_size * SAMPLE.size)  # Fixed size, preallocated
+        self.ring_size = ring_size
+        self.count = 0  # Total samples taken
+        self.samples_file = samples_file
+        self.max_file_bytes = max_file_bytes
+        self.flush_every = flush_every  # Samples buffered before a flush (a crash loses at most these)
+        self._unflushed = 0
+        self._file = open(samples_file, "ab") if samples_file else None
+        self._clock_ticks = os.sysconf("SC_CLK_TCK")
+        self._page_size = os.sysconf("SC_PAGE_SIZE")
+        self._stat_fd = None
+        self._pid = None
+        self._last_ticks = None
+        self._last_time = None
+        self.cpu_seconds = 0.0  # CPU spent by the sampler itself
+
+    def attach(self, pid):
+        """Start sampling a new process (keeps /proc/<pid>/stat open between samples)"""
+        self.detach()
+        self._pid = pid
+        self._stat_fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+        self._last_ticks = None
+
+    def detach(self):
+        if self._stat_fd is not None:
+            os.close(self._stat_fd)
+            self._stat_fd = None
+
+    def sample(self):
+        """Take one sample; returns (cpu_percent, rss_bytes, threads, fds) or None if the process is gone"""
+        cpu_start = time.thread_time()
+        try:
+            stat = os.pread(self._stat_fd, 1024, 0)
+            fds = len(os.listdir(f"/proc/{self._pid}/fd"))
+        except (OSError, TypeError):
+            return None
+        # Fields after the ")" that ends the command name: state is field 3
+        fields = stat[stat.rindex(b")") + 2:].split()
+        ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        threads = int(fields[17])
+        rss = int(fields[21]) * self._page_size
+
+        now = time.monotonic()
+        cpu_percent = 0.0
+        if self._last_ticks is not None and now > self._last_time:
+            cpu_percent = 100.0 * (ticks - self._last_ticks) / self._clock_ticks / (now - self._last_time)
+        self._last_ticks, self._last_time = ticks, now
+
+        record = SAMPLE.pack(time.time(), self._pid, cpu_percent, rss, threads, fds)
+        offset = (self.count % self.ring_size) * SAMPLE.size
+        self.ring[offset:offset + SAMPLE.size] = record
+        self.count += 1
+        if self._file is not None:
+            self._write(record)
+        self.cpu_seconds += time.thread_time() - cpu_start
+        return cpu_percent, rss, threads, fds
+
+    def _write(self, record):
+        """Append to the rolling file; when full it becomes <file>.1 and a new file starts"""
+        self._file.write(record)
+        self._unflushed += 1
+        if self._unflushed >= self.flush_every:
+            self._file.flush()
+            self._unflushed = 0
+        if self._file.tell() >= self.max_file_bytes:
+            self._file.close()
+            os.replace(self.samples_file, self.samples_file + ".1")
+            self._file = open(self.samples_file, "ab")
+            self._unflushed = 0
+
+    def recent(self, n=10):
+        """The most recent n samples as tuples, oldest first"""
+        n = min(n, self.count, self.ring_size)
+        return [
+            SAMPLE.unpack_from(self.ring, (index % self.ring_size) * SAMPLE.size)
+            for index in range(self.count - n, self.count)
+        ]
+
+    def close(self):
+        self.detach()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def supervise(command, sample_hz=2.0, ring_size=3600, samples_file=None, max_file_bytes=8 * 1024 * 1024,
+              initial_backoff=1.0, max_backoff=60.0, stable_seconds=60.0, max_restarts=None):
+    """Run a command headless, restart it on crashes with exponential backoff, and sample it"""
+    sampler = ProcSampler(ring_size, samples_file, max_file_bytes)
+    interval = 1.0 / sample_hz
+    stopping = []
+
+    def request_stop(signum, frame):
+        stopping.append(signum)
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    restarts = 0
+    backoff = min(initial_backoff, max_backoff)
+    supervise_start = time.monotonic()
+    exit_code = 0
+    while not stopping:
+        process = subprocess.Popen(command, stdin=subprocess.DEVNULL)
+        started = time.monotonic()
+        print(f"[supervisor] started pid {process.pid}: {' '.join(command)}")
+        sampler.attach(process.pid)
+
+        # Sample on a fixed schedule until the process exits
+        next_sample = started
+        while process.poll() is None and not stopping:
+            sampler.sample()
+            next_sample += interval
+            delay = next_sample - time.monotonic()
+            if delay > 0:
+                try:
+                    process.wait(timeout=delay)
+                except subprocess.TimeoutExpired:
+                    pass
+            else:
+                next_sample = time.monotonic()  # Fell behind: don't burst
+        sampler.detach()
+
+        if stopping:
+            process.terminate()
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+            break
+
+        exit_code = process.returncode
+        runtime = time.monotonic() - started
+        if exit_code == 0:
+            print(f"[supervisor] EchoBooster exited cleanly after {runtime:.1f}s")
+            break
+        if runtime >= stable_seconds:
+            backoff = min(initial_backoff, max_backoff)  # It ran long enough: treat the crash as a fresh failure
+        if max_restarts is not None and restarts >= max_restarts:
+            print(f"[supervisor] exit code {exit_code}; giving up after {restarts} restarts")
+            break
+        print(f"[supervisor] exit code {exit_code} after {runtime:.1f}s; restarting in {backoff:.1f}s")
+        deadline = time.monotonic() + backoff
+        while not stopping and time.monotonic() < deadline:
+            time.sleep(min(0.2, deadline - time.monotonic()))
+        backoff = min(backoff * 2, max_backoff)
+        restarts += 1
+
+    elapsed = time.monotonic() - supervise_start
+    overhead = 100.0 * sampler.cpu_seconds / elapsed if elapsed > 0 else 0.0
+    print(f"[supervisor] {sampler.count} samples, {restarts} restarts, "
+          f"sampler overhead {overhead:.3f}% of a core")
+    for timestamp, pid, cpu, rss, threads, fds in sampler.recent(3):
+        print(f"[supervisor]   pid {pid}: cpu {cpu:.1f}%, rss {rss / 1048576:.1f} MB, "
+              f"{threads} threads, {fds} fds")
+    sampler.close()
+    return exit_code
+
+
 def open_terminal_and_run():
     """Open a terminal and run the EchoBooster application"""
     print("Starting EchoBooster Application...")
-    
+
+    script_dir = Path(__file__).parent.absolute()
+    manifest = load_manifest(script_dir)
+    timings = {}
+
     # Try to find the executable
-    exe_path = find_echo_booster_executable()
-    
-    if exe_path:
-        print(f"Found EchoBooster at: {exe_path}")
+    command = resolve_command(script_dir, manifest, timings)
+    terminal = find_terminal(manifest) if platform.system() == "Linux" else None
+
+    if command:
         print("Launching EchoBooster...")
-        
         try:
-            if platform.system() == "Windows":
-                # On Windows
-                subprocess.Popen([exe_path], shell=True)
-            elif platform.system() == "Darwin":  # macOS
-                # On macOS, try to open in Terminal
-                subprocess.Popen(['open', '-a', 'Terminal', exe_path])
-            else:  # Linux
-                # On Linux, try different terminal emulators
-                terminals = ['gnome-terminal', 'konsole', 'xfce4-terminal', 'xterm']
-                terminal_found = False
-                
-                for terminal in terminals:
-                    if subprocess.run(['which', terminal], capture_output=True).returncode == 0:
-                        subprocess.Popen([terminal, '-e', exe_path])
-                        terminal_found = True
-                        break
-                
-                if not terminal_found:
-                    # Fallback: run directly
-                    subprocess.Popen([exe_path])
-            
+            start = time.perf_counter()
+            launch(command, terminal, cwd=script_dir)
+            timings["spawn"] = time.perf_counter() - start
             print("EchoBooster launched successfully!")
-        except Exception as e:
-            print(f"Error launching EchoBooster: {e}")
-            return False
-    else:
-        print("EchoBooster executable not found!")
-        print("Attempting to build and run from source...")
-        
-        # Try to run from source using dotnet if available
-        try:
-            result = subprocess.run(['dotnet', '--version'], capture_output=True, text=True)
-            if result.returncode == 0:
-                # DotNet is available, try to run the project
-                script_dir = Path(__file__).parent.absolute()
-                project_path = script_dir / "EchoBooster" / "EchoBooster.csproj"
-                
-                if project_path.exists():
-                    print("Found EchoBooster project, building and running...")
-                    subprocess.Popen(['dotnet', 'run', '--project', 'EchoBooster'], cwd=script_dir)
-                    return True
-                else:
-                    print("EchoBooster project not found.")
-            else:
-                print("DotNet SDK not found. Please install .NET SDK to run from source.")
-        except FileNotFoundError:
-            print("DotNet SDK not found. Please install .NET SDK to run from source.")
-        
-        # Try to open a terminal for manual operation
-        try:
-            if platform.system() == "Windows":
-                subprocess.Popen(['cmd'], shell=True)
-            elif platform.system() == "Darwin":
-                subprocess.Popen(['open', '-a', 'Terminal', '.'])
-            else:  # Linux
-                terminals = ['gnome-terminal', 'konsole', 'xfce4-terminal', 'xterm']
-                terminal_found = False
-                
-                for terminal in terminals:
-                    if subprocess.run(['which', terminal], capture_output=True).returncode == 0:
-                        subprocess.Popen([terminal])
-                        terminal_found = True
-                        break
-                
-                if not terminal_found:
-                    print("No known terminal found. Please open a terminal manually.")
-                    return False
-            
-            print("Terminal opened. Please navigate to the EchoBooster directory and run 'dotnet run'.")
+            report_ready(manifest, timings)
+            save_manifest(script_dir, manifest)
             return True
         except Exception as e:
-            print(f"Error opening terminal: {e}")
+            print(f"Error launching EchoBooster: {e}")
+            manifest.pop("executable", None)  # Re-probe next time
+            save_manifest(script_dir, manifest)
             return False
-    
-    return True
+
+    save_manifest(script_dir, manifest)
+
+    # Try to open a terminal for manual operation
+    try:
+        if platform.system() == "Windows":
+            subprocess.Popen(['cmd'], shell=True)
+        elif platform.system() == "Darwin":
+            subprocess.Popen(['open', '-a', 'Terminal', '.'])
+        else:  # Linux
+            if not terminal:
+                print("No known terminal found. Please open a terminal manually.")
+                return False
+            subprocess.Popen([terminal])
+
+        print("Terminal opened. Please navigate to the EchoBooster directory and run 'dotnet run'.")
+        return True
+    except Exception as e:
+        print(f"Error opening terminal: {e}")
+        return False
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Launch the EchoBooster application")
+    parser.add_argument("--supervise", action="store_true",
+                        help="run headless, restart on crashes and sample resource usage (Linux)")
+    parser.add_argument("--sample-hz", type=float, default=2.0, help="resource samples per second")
+    parser.add_argument("--ring-size", type=int, default=3600, help="samples kept in memory")
+    parser.add_argument("--samples-file", help=f"rolling binary sample file (default: {SAMPLES_FILE_NAME})")
+    parser.add_argument("--max-file-mb", type=float, default=8.0, help="size at which the sample file rolls over")
+    parser.add_argument("--initial-backoff", type=float, default=1.0, help="first restart delay in seconds")
+    parser.add_argument("--max-backoff", type=float, default=60.0, help="longest restart delay in seconds")
+    parser.add_argument("--max-restarts", type=int, help="stop after this many restarts")
+    parser.add_argument("--command", nargs=argparse.REMAINDER,
+                        help="supervise this command instead of EchoBooster")
+    return parser.parse_args(argv)
 
 
 def main():
     """Main function"""
+    args = parse_args()
     print("EchoBooster Launcher")
     print("=" * 20)
-    
+
+    if args.supervise:
+        if not os.path.isdir("/proc"):
+            print("Supervisor mode needs /proc (Linux).")
+            sys.exit(1)
+        script_dir = Path(__file__).parent.absolute()
+        manifest = load_manifest(script_dir)
+        command = args.command or resolve_command(script_dir, manifest, {})
+        save_manifest(script_dir, manifest)
+        if not command:
+            print("\nOperation failed.")
+            sys.exit(1)
+        sys.exit(supervise(
+            command,
+            sample_hz=args.sample_hz,
+            ring_size=args.ring_size,
+            samples_file=args.samples_file or str(script_dir / SAMPLES_FILE_NAME),
+            max_file_bytes=int(args.max_file_mb * 1024 * 1024),
+            initial_backoff=args.initial_backoff,
+            max_backoff=args.max_backoff,
+            max_restarts=args.max_restarts
+        ))
+
     success = open_terminal_and_run()
-    
+
     if success:
         print("\nOperation completed successfully.")
     else:
         print("\nOperation failed.")
-    
-    # Wait for user input before exiting
-    input("\nPress Enter to exit...")
+
+    # Wait for user input before exiting (only when someone is there to press Enter)
+    if sys.stdin.isatty():
+        input("\nPress Enter to exit...")
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()